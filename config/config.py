@@ -46,3 +46,159 @@ STUDENT_GITHUB_DEFAULT_REPO_LIST = [
 
 # This is the default, but needs to be changed if installed under a different user.
 TEMP_FILE_FOLDER = '/home/eagle/EAGLE'
+
+# Maximum size (in bytes) of the on-disk cache of file contents fetched from git repositories.
+# The cache is stored in TEMP_FILE_FOLDER and shared by all server processes. Set to 0 to disable.
+BLOB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# GitHub and GitLab API clients (and their keep-alive connections) are reused between requests
+# that use the same access token. Clients idle for longer than this many seconds are closed,
+# and this is also how long the result of checking an access token is remembered.
+CLIENT_POOL_TTL = 600
+CLIENT_POOL_MAX_SIZE = 128
+
+# Minimum time (in seconds) between requests, and between write requests, made with the same GitHub client.
+# Clients are shared by all requests that use the same token (or none), so PyGithub's defaults of 0.25s and 1s
+# would queue up unrelated requests behind each other. Concurrency is limited by UPSTREAM_MAX_CONCURRENCY_PER_HOST
+# and SAVE_BLOB_MAX_PARALLEL instead. Set to None for no minimum time.
+GITHUB_SECONDS_BETWEEN_REQUESTS = None
+GITHUB_SECONDS_BETWEEN_WRITES = None
+
+# The default repositories above can be read from local git mirrors (bare clones in TEMP_FILE_FOLDER/mirrors)
+# instead of through the GitHub and GitLab APIs. Mirrors are fetched again in the background when they are
+# more than GIT_MIRROR_REFRESH_INTERVAL seconds old, so files changed outside EAGLE can take that long to show.
+# Repositories are cloned from GITHUB_CLONE_URL/<repository>.git and GITLAB_CLONE_URL/<repository>.git.
+GIT_MIRROR_ENABLED = os.getenv("EAGLE_GIT_MIRROR", "false").lower() in ("1", "true", "yes")
+GIT_MIRROR_REFRESH_INTERVAL = 300
+GITHUB_CLONE_URL = os.getenv("EAGLE_GITHUB_CLONE_URL", "https://github.com")
+GITLAB_CLONE_URL = os.getenv("EAGLE_GITLAB_CLONE_URL", os.getenv("EAGLE_GITLAB_URL", "https://gitlab.com"))
+GIT_MIRROR_REPOSITORIES = (
+    [("github", repo["repository"]) for repo in GITHUB_DEFAULT_REPO_LIST + STUDENT_GITHUB_DEFAULT_REPO_LIST] +
+    [("gitlab", repo["repository"]) for repo in GITLAB_DEFAULT_REPO_LIST]
+)
+
+# Number of GitHub responses (repository metadata and folder listings) kept, with their ETags,
+# so that they can be revalidated with conditional requests that do not count against the rate limit.
+CONDITIONAL_CACHE_MAX_ENTRIES = 4096
+
+# Number of recursive repository listings (one per branch head commit) kept.
+TREE_CACHE_MAX_ENTRIES = 64
+
+# GitHub files over 1 MB are downloaded unencoded, after finding them in the folders on their path if GitHub will not
+# describe them (over 100 MB). FOLDER_TREE_CACHE_MAX_ENTRIES folders are kept for this. To cap the memory needed by a
+# request, files larger than LARGE_FILE_MAX_BYTES are not opened (413).
+FOLDER_TREE_CACHE_MAX_ENTRIES = 4096
+LARGE_FILE_MAX_BYTES = 64 * 1024 * 1024
+
+# Docker Hub lists of images and tags are fetched again after DOCKER_HUB_CACHE_TTL seconds.
+# For a further DOCKER_HUB_STALE_TTL seconds the old list is still returned straight away,
+# while a new copy is fetched in the background.
+DOCKER_HUB_CACHE_TTL = 300
+DOCKER_HUB_STALE_TTL = 3600
+DOCKER_HUB_CACHE_MAX_ENTRIES = 1024
+
+# Maximum number of pages (of 100 entries) fetched for a single list of Docker Hub images or tags.
+DOCKER_HUB_MAX_PAGES = 20
+
+# Number of JSON files fetched from URLs (such as the default palettes) that are kept. They are reused
+# for as long as their Cache-Control headers allow and then revalidated. If the remote host is down,
+# a copy that expired at most HTTP_CACHE_MAX_STALE seconds ago is returned instead of an error.
+HTTP_CACHE_MAX_ENTRIES = 256
+HTTP_CACHE_MAX_STALE = 24 * 60 * 60
+
+# How long (in seconds) the addresses of host names in user-supplied URLs are remembered.
+DNS_CACHE_TTL = 60
+
+# Where the caches above are kept, so that they can be shared by all the server's worker processes:
+# "sqlite" - a database file in TEMP_FILE_FOLDER, shared by all processes on the host
+# "redis"  - a Redis server at CACHE_REDIS_URL (needs the 'redis' package)
+# "memory" - in each process, not shared
+CACHE_BACKEND = os.getenv("EAGLE_CACHE_BACKEND", "sqlite")
+CACHE_REDIS_URL = os.getenv("EAGLE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Base URLs of the GitHub API and GitLab instance. These can be changed to use GitHub Enterprise,
+# a self-hosted GitLab, or a local stand-in for testing.
+GITHUB_BASE_URL = os.getenv("EAGLE_GITHUB_BASE_URL", "https://api.github.com")
+GITLAB_URL = os.getenv("EAGLE_GITLAB_URL", "https://gitlab.com")
+
+# GitHub and GitLab limit the number of API calls per hour for each token, and for each IP address without one
+# (so all anonymous users share one budget). When less than this fraction of the budget is left, file listings
+# are not fetched again (the last listing is returned, if there is one), to keep the rest for opening and saving
+# files. When it is used up, opening or saving a file waits up to RATE_LIMIT_MAX_WAIT seconds for the budget to be
+# reset before failing with 429.
+RATE_LIMIT_RESERVE = 0.2
+RATE_LIMIT_MAX_WAIT = 10
+
+# Number of file listings kept to be returned when the rate limit budget is low, or GitHub or GitLab fail (see STALE_MAX_AGE).
+LISTING_CACHE_MAX_ENTRIES = 1024
+
+# Push notifications are received at '/webhook/github' and '/webhook/gitlab'. Give the webhook the same secret
+# (GitHub: "Secret", GitLab: "Secret token") as here; the endpoints are disabled when no secret is set.
+# A repository that sent a notification in the last WEBHOOK_WATCH_TTL seconds is trusted to send one for every
+# push, so its folder listings, branch heads and the last commits of its files are reused for up to
+# WEBHOOK_CACHE_TTL seconds (in case a notification is lost) without asking GitHub or GitLab, unless a push
+# changes them. With WEBHOOK_REWARM, the folders changed by a push are listed again straight away
+# (public repositories only). Webhooks need a shared CACHE_BACKEND ("sqlite" or "redis"), so that every
+# server process sees the pushes; they stay disabled with the "memory" backend.
+WEBHOOK_GITHUB_SECRET = os.getenv("EAGLE_WEBHOOK_GITHUB_SECRET")
+WEBHOOK_GITLAB_TOKEN = os.getenv("EAGLE_WEBHOOK_GITLAB_TOKEN")
+WEBHOOK_CACHE_TTL = 24 * 60 * 60
+WEBHOOK_WATCH_TTL = 7 * 24 * 60 * 60
+WEBHOOK_CACHE_MAX_ENTRIES = 65536
+WEBHOOK_REWARM = os.getenv("EAGLE_WEBHOOK_REWARM", "false").lower() in ("1", "true", "yes")
+
+# When GitHub or GitLab fail (server errors, 403 and 429 responses, timeouts, or no free upstream slot), the last good
+# copy of a folder listing or file is returned instead, with 'stale' set and its age in seconds as 'staleAge', if it is
+# at most this many seconds old (0 to return the error). Listings and files of the routes below are kept for this,
+# and files opened with '/openRemoteFiles' use the limits of the single file routes.
+STALE_MAX_AGE = {
+    "getGitHubFilesAll": 7 * 24 * 60 * 60,
+    "getGitLabFilesAll": 7 * 24 * 60 * 60,
+    "openRemoteGithubFile": 24 * 60 * 60,
+    "openRemoteGitlabFile": 24 * 60 * 60,
+}
+STALE_FILE_CACHE_MAX_ENTRIES = 1024
+
+# Number of last commits of files (in watched repositories, see above) kept.
+FILE_COMMIT_CACHE_MAX_ENTRIES = 4096
+
+# Maximum number of calls in progress at once to any single upstream host (GitHub, GitLab, Docker Hub, ...)
+# per server process, and how long (in seconds) a request waits for a free slot before failing with 503.
+UPSTREAM_MAX_CONCURRENCY_PER_HOST = 32
+UPSTREAM_WAIT_TIMEOUT = 10
+
+# Files opened from user-supplied URLs share UPSTREAM_URL_MAX_CONCURRENCY slots between all their hosts, so that
+# slow or unresponsive hosts can only hold up that many of a worker's threads, not those needed for GitHub and GitLab.
+UPSTREAM_URL_MAX_CONCURRENCY = 4
+
+# After UPSTREAM_FAILURE_THRESHOLD consecutive calls to an upstream host fail because it is down (server errors,
+# timeouts, failed connections), calls to it fail straight away with 503 (or return the last good copy, see
+# STALE_MAX_AGE) for UPSTREAM_RETRY_INTERVAL seconds. Then one call is let through to test the host again.
+# This is counted separately by each server process; the state is shown at '/health'. Set to 0 to disable.
+UPSTREAM_FAILURE_THRESHOLD = 5
+UPSTREAM_RETRY_INTERVAL = 30
+
+# Limits for '/openRemoteFiles', which reads many files in one request:
+# the maximum number of files per request, and how many are fetched at the same time.
+BATCH_OPEN_MAX_FILES = 50
+BATCH_OPEN_MAX_PARALLEL = 8
+
+# When saving many files to GitHub in one commit, files of at least SAVE_BLOB_MIN_BYTES are uploaded
+# separately (SAVE_BLOB_MAX_PARALLEL at a time) rather than inline with the new tree, as are the largest
+# remaining files until at most SAVE_INLINE_MAX_BYTES of content is sent inline.
+SAVE_BLOB_MIN_BYTES = 256 * 1024
+SAVE_INLINE_MAX_BYTES = 1024 * 1024
+SAVE_BLOB_MAX_PARALLEL = 8
+
+# Every response has a Server-Timing header with the time spent on upstream calls, JSON parsing and the other
+# steps of the request, which browsers show in their developer tools. A fraction TRACE_SAMPLE_RATE (0 to 1) of
+# requests is also written, with the time of every step, as a line of JSON to TRACE_FILE (by default
+# traces.jsonl in TEMP_FILE_FOLDER).
+SERVER_TIMING = os.getenv("EAGLE_SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+TRACE_SAMPLE_RATE = float(os.getenv("EAGLE_TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.getenv("EAGLE_TRACE_FILE")
+
+# JSON responses of at least this many bytes are compressed (with brotli if the 'brotli' package
+# is installed and the browser accepts it, otherwise gzip). Set to 0 to disable compression.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
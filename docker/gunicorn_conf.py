@@ -1,36 +1,116 @@
 from __future__ import print_function
 
+import importlib.util
 import json
+import math
 import multiprocessing
 import os
 import shutil
 
-workers_per_core_str = os.getenv("WORKERS_PER_CORE", "2")
-web_concurrency_str = os.getenv("WEB_CONCURRENCY", None)
+# Every setting below comes from an environment variable. They are all checked
+# here, and the server does not start if any of them is invalid.
+errors = []
+
+
+def env_str(name, default, choices=None):
+    value = os.getenv(name, default)
+    if choices is not None and value not in choices:
+        errors.append(f"{name}={value!r} must be one of {', '.join(choices)}")
+    return value
+
+
+def env_bool(name, default):
+    value = os.getenv(name, default).lower()
+    if value not in ("1", "true", "yes", "0", "false", "no", ""):
+        errors.append(f"{name}={value!r} must be true or false")
+    return value in ("1", "true", "yes")
+
+
+def env_number(name, default, kind=int, minimum=0):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = kind(value)
+    except ValueError:
+        errors.append(f"{name}={value!r} must be a number")
+        return default
+    if number < minimum:
+        errors.append(f"{name}={value!r} must be at least {minimum}")
+        return default
+    return number
+
+
+# Profiles:
+# "dev"      - sync workers (WORKERS_PER_CORE per core, default 2), reloaded when the code changes
+# "threaded" - one worker per core, each with THREADS threads, for requests that mostly wait on upstream calls
+# "async"    - one worker per core, each with up to WORKER_CONNECTIONS cooperative (gevent) requests
+# EAGLE_ASYNC=true is the same as EAGLE_PROFILE=async.
+async_env = env_bool("EAGLE_ASYNC", "false")
+profile = env_str("EAGLE_PROFILE", "async" if async_env else "dev", ("dev", "threaded", "async"))
+async_mode = profile == "async"
+if async_mode and importlib.util.find_spec("gevent") is None:
+    errors.append("EAGLE_PROFILE=async needs the 'gevent' package (pip install .[async])")
+
+workers_per_core = env_number("WORKERS_PER_CORE", 2 if profile == "dev" else 1, float, minimum=0.1)
+web_concurrency = env_number("WEB_CONCURRENCY", None, minimum=1)
 host = os.getenv("HOST", "0.0.0.0")
 port = os.getenv("PORT", "80")
 bind_env = os.getenv("BIND", None)
-logdir = "/var/log/gunicorn"
-if os.path.exists(logdir):
-    # cleanup
-    shutil.rmtree(logdir, ignore_errors=True)
-os.mkdir(logdir)
-errorlog = f"{logdir}/error.log"
-accesslog = f"{logdir}/access.log"
-use_loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Threads per worker in the threaded profile. By default this follows from how long a request waits on
+# GitHub, GitLab or Docker Hub compared to the CPU time it needs: a worker with 1 + wait / cpu threads keeps
+# its core busy. Measure both on a running server, from eagle_upstream_duration_seconds and
+# eagle_request_duration_seconds on /metrics.
+upstream_latency = env_number("EAGLE_UPSTREAM_LATENCY", 0.3, float, minimum=0)
+request_cpu_time = env_number("EAGLE_REQUEST_CPU_TIME", 0.02, float, minimum=0.001)
+threads_per_worker = env_number("THREADS", min(64, 1 + math.ceil(upstream_latency / request_cpu_time)), minimum=1)
+worker_connections_count = env_number("WORKER_CONNECTIONS", 1000, minimum=1)
+
+# Workers are restarted after MAX_REQUESTS requests (plus up to MAX_REQUESTS_JITTER more, so that they do not
+# all restart at once), which returns the memory held on to after handling large graphs. 0 to never restart.
+max_requests_count = env_number("MAX_REQUESTS", 0 if profile == "dev" else 2000, minimum=0)
+max_requests_jitter_count = env_number("MAX_REQUESTS_JITTER", max_requests_count // 10, minimum=0)
+
+# The longest time (in seconds) that opening files and listing folders, and saving files (or opening many
+# at once), may take. Workers that stop responding for longer than the slowest of these are killed, and a
+# worker that is restarted or shut down is given time to finish any save in progress.
+read_timeout = env_number("EAGLE_READ_TIMEOUT", 30, minimum=1)
+save_timeout = env_number("EAGLE_SAVE_TIMEOUT", 90, minimum=1)
+
+# preload: import the app once in the master process before forking the workers, so that
+# each new worker starts without importing anything (reload is not possible when preloading)
+preload = env_bool("EAGLE_PRELOAD", "false")
+# metrics of all workers are written to files in this directory, and added up by /metrics
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/eagle_metrics")
+# logs are appended to files in this directory, or written to stdout and stderr if it is "-"
+logdir = os.getenv("EAGLE_LOG_DIR", "/var/log/gunicorn")
+use_loglevel = env_str("LOG_LEVEL", "info", ("debug", "info", "warning", "error", "critical"))
+
+if errors:
+    raise RuntimeError("Invalid server settings:\n  " + "\n  ".join(errors))
+
+if preload and async_mode:
+    # gevent must patch the standard library before the app imports it in the master
+    from gevent import monkey
+    monkey.patch_all()
+
+if logdir == "-":
+    errorlog = "-"
+    accesslog = "-"
+else:
+    os.makedirs(logdir, exist_ok=True)
+    errorlog = f"{logdir}/error.log"
+    accesslog = f"{logdir}/access.log"
 if bind_env:
     use_bind = bind_env
 else:
     use_bind = "{host}:{port}".format(host=host, port=port)
 
 cores = multiprocessing.cpu_count()
-workers_per_core = float(workers_per_core_str)
-default_web_concurrency = workers_per_core * cores
-if web_concurrency_str:
-    web_concurrency = int(web_concurrency_str)
-    assert web_concurrency > 0
-else:
-    web_concurrency = int(default_web_concurrency)
+default_web_concurrency = max(1, int(workers_per_core * cores))
+if web_concurrency is None:
+    web_concurrency = default_web_concurrency
 
 # Gunicorn config variables
 loglevel = use_loglevel
@@ -39,16 +119,56 @@ bind = use_bind
 keepalive = 120
 errorlog = errorlog
 accesslog = accesslog
-timeout = 60
-reload = True
+timeout = max(read_timeout, save_timeout) + 10
+graceful_timeout = save_timeout
+max_requests = max_requests_count
+max_requests_jitter = max_requests_jitter_count
+reload = profile == "dev" and not preload
+preload_app = preload
+if profile == "threaded":
+    worker_class = "gthread"
+    threads = threads_per_worker
+elif async_mode:
+    worker_class = "gevent"
+    worker_connections = worker_connections_count
+
+
+def on_starting(server):
+    # discard the metrics of a previous run
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    if preload:
+        # finish the work otherwise left until the first request, before the workers are forked
+        from eagleServer import eagleServer
+        eagleServer.preload()
+
+
+def child_exit(server, worker):
+    from eagleServer import metrics
+    metrics.mark_process_dead(worker.pid)
+
 
 # For debugging and testing
 log_data = {
     "loglevel": loglevel,
     "workers": workers,
     "bind": bind,
+    "timeout": timeout,
+    "graceful_timeout": graceful_timeout,
+    "max_requests": max_requests,
+    "max_requests_jitter": max_requests_jitter,
     # Additional, non-gunicorn variables
+    "profile": profile,
+    "threads": threads_per_worker if profile == "threaded" else None,
+    "worker_connections": worker_connections_count if async_mode else None,
     "workers_per_core": workers_per_core,
+    "async_mode": async_mode,
+    "preload": preload,
+    "metrics_dir": metrics_dir,
+    "logdir": logdir,
     "host": host,
     "port": port,
 }
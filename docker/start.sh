@@ -0,0 +1,10 @@
+#! /usr/bin/env sh
+set -e
+
+# Like the base image's /start.sh, but leaves the worker class to gunicorn_conf.py
+# (the base image always starts meinheld workers, whatever EAGLE_PROFILE says).
+if [ -f /app/prestart.sh ] ; then
+    . /app/prestart.sh
+fi
+
+exec gunicorn -c "${GUNICORN_CONF:-/app/gunicorn_conf.py}" "${APP_MODULE:-eagleServer.eagleServer:app}"
@@ -0,0 +1,167 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+On-disk cache of file contents fetched from git repositories.
+
+Once the commit SHA of a file is known its content can never change, so
+entries are keyed by (repository, commit SHA, path) and never need to be
+invalidated, only evicted. The cache lives in a plain directory so that it
+is shared by every gunicorn worker on the host. Writes are atomic (write to
+a temporary file, then rename) and the least recently used entries are
+removed once the total size exceeds the configured limit.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from eagleServer import metrics
+
+logger = logging.getLogger(__name__)
+
+ENTRY_SUFFIX = ".blob"
+
+
+class BlobCache:
+    """
+    Size-bounded LRU cache of immutable blobs stored under a directory.
+
+    Each entry is a single file containing one line of JSON metadata
+    followed by the raw content.
+    """
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+        self._bytes_since_evict = 0
+
+        if self.enabled:
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+            except OSError as e:
+                logger.warning("Blob cache disabled, unable to create %s: %s", self.folder, e)
+                self.enabled = False
+
+    @staticmethod
+    def key(repo_name: str, commit_sha: str, path: str) -> str:
+        return hashlib.sha256("\0".join([repo_name, commit_sha, path]).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key + ENTRY_SUFFIX)
+
+    def get(self, repo_name: str, commit_sha: str, path: str):
+        """
+        Return a (content, metadata) tuple for the entry, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        entry_path = self._entry_path(self.key(repo_name, commit_sha, path))
+        try:
+            with open(entry_path, "rb") as f:
+                metadata = json.loads(f.readline())
+                content = f.read()
+        except FileNotFoundError:
+            metrics.cache_event("blob", "miss")
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable blob cache entry %s: %s", entry_path, e)
+            self._remove(entry_path)
+            metrics.cache_event("blob", "error")
+            return None
+
+        metrics.cache_event("blob", "hit")
+
+        # mark the entry as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+        return content, metadata
+
+    def put(self, repo_name: str, commit_sha: str, path: str, content: bytes, metadata: dict) -> None:
+        if not self.enabled:
+            return
+
+        entry_path = self._entry_path(self.key(repo_name, commit_sha, path))
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(metadata).encode("utf-8") + b"\n")
+                f.write(content)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            logger.warning("Unable to write blob cache entry %s: %s", entry_path, e)
+            return
+        metrics.cache_event("blob", "put")
+
+        # only rescan the directory once a reasonable amount of new data has been written
+        self._bytes_since_evict += len(content)
+        if self._bytes_since_evict >= self.max_bytes // 10:
+            self._bytes_since_evict = 0
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache is below its size limit.
+        """
+        entries = []
+        total = 0
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                # clean up temporary files left behind by a crashed writer
+                if entry.name.endswith(".tmp"):
+                    if stat.st_mtime < time.time() - 3600:
+                        self._remove(entry.path)
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        # evict down to 90% of the limit, so that we don't rescan on every write
+        target = self.max_bytes * 0.9
+        for _, size, entry_path in sorted(entries):
+            if total <= target:
+                break
+            self._remove(entry_path)
+            total -= size
+
+    @staticmethod
+    def _remove(entry_path: str) -> None:
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
@@ -0,0 +1,293 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Caches used by the EAGLE server.
+
+Gunicorn runs several worker processes, and a cache held in the memory of
+one process is cold in all the others. Besides the in-process LRUCache
+there are two shared backends: SQLiteCache, a table in a database file in
+TEMP_FILE_FOLDER that every worker on the host can use, and RedisCache, for
+deployments with a Redis (or Redis-compatible) server. create_cache()
+chooses one according to config.CACHE_BACKEND.
+
+All caches have the same interface: get(key, default), put(key, value, ttl)
+and stats(). Keys are tuples of strings, and values stored in the shared
+backends must be JSON serialisable (tuples are returned as lists). Errors in
+a shared backend are logged and treated as cache misses, so a broken cache
+never breaks a request.
+"""
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from eagleServer import codec
+from eagleServer import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """
+    Counters of cache hits, misses and writes in this process.
+
+    Events are also counted in the metrics of the cache with the given name, if any.
+    """
+    EVENTS = {"hit": "hits", "miss": "misses", "put": "puts", "error": "errors"}
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.errors = 0
+
+    def count(self, event: str) -> None:
+        attribute = self.EVENTS[event]
+        setattr(self, attribute, getattr(self, attribute) + 1)
+        metrics.cache_event(self.name, event)
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "puts": self.puts,
+            "errors": self.errors,
+            "hitRate": self.hits / lookups if lookups else None,
+        }
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that discards the least recently used entries once it holds `max_entries`.
+
+    Entries put with a `ttl` (in seconds) expire after that time, otherwise `default_ttl` is used (None for no expiry).
+    The `name` labels the cache's metrics.
+    """
+    def __init__(self, max_entries: int, default_ttl: float = None, name: str = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats(name)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.time()):
+                self._stats.count("miss")
+                return default
+            self._entries.move_to_end(key)
+            self._stats.count("hit")
+            return entry[0]
+
+    def put(self, key, value, ttl: float = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            self._stats.count("put")
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats.as_dict(), backend="memory", entries=len(self._entries))
+
+
+def _encode_key(key) -> str:
+    return json.dumps(list(key) if isinstance(key, tuple) else key, separators=(",", ":"))
+
+
+class SQLiteCache:
+    """
+    Cache stored in a table of an SQLite database, shared by all processes on the host.
+
+    Each cache has its own `namespace` in the table. Once a namespace holds more than
+    `max_entries`, the least recently written entries are removed.
+    """
+    def __init__(self, path: str, namespace: str, max_entries: int, default_ttl: float = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._connection = None
+        self._pid = None
+        self._puts_since_trim = 0
+        self._lock = threading.Lock()
+        self._stats = CacheStats(namespace)
+
+    def _connect(self):
+        # connections must not be shared with a forked child, so reconnect after a fork
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL, written REAL NOT NULL, PRIMARY KEY (namespace, key))")
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_written ON cache (namespace, written)")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                row = self._connect().execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key = ? AND (expires IS NULL OR expires >= ?)",
+                    (self.namespace, _encode_key(key), time.time())
+                ).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Error reading %s cache: %s", self.namespace, e)
+                self._stats.count("error")
+                row = None
+
+            if row is None:
+                self._stats.count("miss")
+                return default
+            self._stats.count("hit")
+        return codec.loads(row[0])
+
+    def put(self, key, value, ttl: float = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        data = codec.dumps(value)
+        with self._lock:
+            try:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires, written) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, _encode_key(key), data, now + ttl if ttl is not None else None, now)
+                )
+                self._stats.count("put")
+
+                # trimming needs a scan of the namespace, so only do it every so often
+                self._puts_since_trim += 1
+                if self._puts_since_trim > max(1, self.max_entries // 10):
+                    self._puts_since_trim = 0
+                    connection.execute("DELETE FROM cache WHERE namespace = ? AND expires < ?", (self.namespace, now))
+                    connection.execute(
+                        "DELETE FROM cache WHERE namespace = ? AND key IN (SELECT key FROM cache WHERE namespace = ? ORDER BY written DESC LIMIT -1 OFFSET ?)",
+                        (self.namespace, self.namespace, self.max_entries)
+                    )
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Error writing %s cache: %s", self.namespace, e)
+                self._stats.count("error")
+
+    def stats(self) -> dict:
+        with self._lock:
+            try:
+                entries = self._connect().execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+            except (sqlite3.Error, OSError):
+                entries = None
+            return dict(self._stats.as_dict(), backend="sqlite", entries=entries)
+
+
+class RedisCache:
+    """
+    Cache stored in a Redis server, shared by all processes that use it.
+
+    `client` is a redis.Redis instance, or anything with the same get/set methods.
+    Redis limits the size of the cache itself (see its 'maxmemory' settings), so
+    `max_entries` is not enforced here; entries without a ttl are given `max_ttl`.
+    """
+    def __init__(self, client, namespace: str, default_ttl: float = None, max_ttl: float = 86400):
+        self.client = client
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.max_ttl = max_ttl
+        self._lock = threading.Lock()
+        self._stats = CacheStats(namespace)
+
+    def _key(self, key):
+        return "eagle:" + self.namespace + ":" + _encode_key(key)
+
+    def _count(self, event):
+        with self._lock:
+            self._stats.count(event)
+
+    def get(self, key, default=None):
+        try:
+            data = self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning("Error reading %s cache: %s", self.namespace, e)
+            self._count("error")
+            data = None
+
+        if data is None:
+            self._count("miss")
+            return default
+        self._count("hit")
+        return codec.loads(data)
+
+    def put(self, key, value, ttl: float = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        try:
+            self.client.set(self._key(key), codec.dumps_bytes(value), ex=max(1, int(ttl if ttl is not None else self.max_ttl)))
+            self._count("put")
+        except Exception as e:
+            logger.warning("Error writing %s cache: %s", self.namespace, e)
+            self._count("error")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats.as_dict(), backend="redis", entries=None)
+
+
+_redis_client = None
+
+
+def _get_redis_client(url):
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+    return _redis_client
+
+
+def create_cache(backend: str, namespace: str, max_entries: int, default_ttl: float = None, folder: str = None, redis_url: str = None, redis_client=None):
+    """
+    Create a cache using the named backend ("memory", "sqlite" or "redis").
+
+    The SQLite database is stored in `folder`. For Redis, an existing `redis_client`
+    may be given, otherwise one is created for `redis_url` (this needs the optional
+    'redis' package). If the backend can not be used, an in-memory cache is returned.
+    """
+    if backend == "sqlite":
+        return SQLiteCache(os.path.join(folder, "cache.sqlite3"), namespace, max_entries, default_ttl)
+
+    if backend == "redis":
+        if redis_client is None:
+            try:
+                redis_client = _get_redis_client(redis_url)
+            except ImportError:
+                logger.warning("The 'redis' package is not installed, using an in-memory %s cache", namespace)
+                return LRUCache(max_entries, default_ttl, namespace)
+        return RedisCache(redis_client, namespace, default_ttl)
+
+    if backend != "memory":
+        logger.warning("Unknown cache backend '%s', using an in-memory %s cache", backend, namespace)
+    return LRUCache(max_entries, default_ttl, namespace)
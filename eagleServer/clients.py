@@ -0,0 +1,356 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Per-process pool of GitHub and GitLab API clients.
+
+Creating a new client for every request means a new HTTP session, and so a
+new TCP+TLS handshake, for every request. The pool keeps one client per
+(service, token) so that the underlying keep-alive connections are reused,
+and remembers the outcome of authenticating each token so that GitLab's
+extra auth round trip is only paid once.
+"""
+import hashlib
+import importlib.metadata
+import logging
+import threading
+import time
+import urllib.parse
+
+from eagleServer import metrics
+from eagleServer import tracing
+from eagleServer.lazy import lazy_import
+
+# imported on first use, see eagleServer.lazy
+github = lazy_import("github")
+gitlab = lazy_import("gitlab")
+requests = lazy_import("requests")
+
+logger = logging.getLogger(__name__)
+
+
+class _PerThreadAttribute:
+    """
+    Descriptor that stores an instance attribute separately for each thread.
+    """
+    def __init__(self, name: str):
+        self.name = name
+
+    @staticmethod
+    def _local(obj):
+        local = obj.__dict__.get("_per_thread")
+        if local is None:
+            local = obj.__dict__.setdefault("_per_thread", threading.local())
+        return local
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(self._local(obj), self.name)
+        except AttributeError:
+            raise AttributeError(self.name) from None
+
+    def __set__(self, obj, value):
+        setattr(self._local(obj), self.name, value)
+
+
+_PENDING_REQUEST_ATTRIBUTES = ("verb", "url", "input", "headers", "stream")
+
+
+def _make_github_connections_thread_safe():
+    """
+    PyGithub connections keep the pending request on the connection object
+    between request() and getresponse(), so a pooled client used by several
+    threads at once could send one thread's request with another thread's
+    URL or headers. Store those attributes per thread instead.
+
+    These are PyGithub internals, so check that request() stores nothing else
+    on the connection, and fail if it does rather than share clients unsafely.
+    """
+    for cls in (github.Requester.HTTPRequestsConnectionClass, github.Requester.HTTPSRequestsConnectionClass):
+        for name in _PENDING_REQUEST_ATTRIBUTES:
+            setattr(cls, name, _PerThreadAttribute(name))
+
+        connection = cls("localhost")
+        before = set(connection.__dict__)
+        connection.request("GET", "/", None, {})
+        unexpected = set(connection.__dict__) - before - {"_per_thread"}
+        missing = [name for name in _PENDING_REQUEST_ATTRIBUTES if not hasattr(connection._per_thread, name)]
+        connection.session.close()
+        if unexpected or missing or not callable(getattr(cls, "getresponse", None)):
+            raise RuntimeError(
+                "PyGithub {0} is not supported: its connections can not be shared between threads "
+                "(unexpected attributes: {1}, missing attributes: {2})".format(
+                    importlib.metadata.version("PyGithub"), sorted(unexpected), missing))
+
+
+def _observe_github_requests():
+    """
+    Time every request sent by PyGithub, for the upstream metrics and traces.
+    """
+    for cls in (github.Requester.HTTPRequestsConnectionClass, github.Requester.HTTPSRequestsConnectionClass):
+        def getresponse(self, _getresponse=cls.getresponse):
+            with tracing.span("github", method=self.verb, path=urllib.parse.urlsplit(self.url).path) as span, metrics.upstream("github") as call:
+                response = _getresponse(self)
+                call.status = response.status
+                span.set(status=response.status)
+            return response
+        cls.getresponse = getresponse
+
+
+_github_prepared = False
+_github_lock = threading.Lock()
+
+
+def prepare_github():
+    """
+    Import PyGithub and patch its connection classes (see above), once.
+    """
+    global _github_prepared
+    with _github_lock:
+        if not _github_prepared:
+            _make_github_connections_thread_safe()
+            _observe_github_requests()
+            _github_prepared = True
+
+
+def _observed_session(service: str):
+    """
+    Return a requests session that times every request it sends, for the upstream metrics and traces.
+    """
+    session = requests.Session()
+    send = session.send
+
+    def observed_send(request, **kwargs):
+        with tracing.span(service, method=request.method, path=urllib.parse.urlsplit(request.url).path) as span, metrics.upstream(service) as call:
+            response = send(request, **kwargs)
+            call.status = response.status_code
+            span.set(status=response.status_code)
+        return response
+
+    session.send = observed_send
+    return session
+
+
+def hash_token(token: str) -> str:
+    """
+    Return a digest of an access token, suitable for use in cache keys and logs.
+    """
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+
+
+class ClientPool:
+    """
+    Pool of API clients keyed by (service, hashed token).
+
+    Clients that have not been used for `ttl` seconds are removed,
+    and results of authentication checks are remembered for the same period.
+
+    PyGithub waits a minimum time between requests (and between writes) made by
+    a client. A pooled client is shared by many requests, so these intervals are
+    set by `github_seconds_between_requests` and `github_seconds_between_writes`
+    (None for no wait).
+
+    PyGithub also retries failed requests, and when the rate limit is used up it
+    sleeps until the limit is reset, which can be up to an hour. The pooled
+    clients do not retry: the server waits for the rate limit itself (see
+    eagleServer.ratelimit) and otherwise returns the last good copy, if any.
+    """
+    def __init__(self, ttl: float, max_size: int, github_base_url: str, gitlab_url: str,
+                 github_seconds_between_requests: float = None, github_seconds_between_writes: float = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.github_base_url = github_base_url
+        self.gitlab_url = gitlab_url
+        self.github_options = {
+            "base_url": github_base_url,
+            "seconds_between_requests": github_seconds_between_requests,
+            "seconds_between_writes": github_seconds_between_writes,
+            "retry": None,
+        }
+        self._clients = {}
+        self._auth = {}
+        self._gitlab_rate_limits = {}
+        self._lock = threading.Lock()
+
+    def github(self, token: str = None):
+        """
+        Return a pooled GitHub client, anonymous if no token is given.
+        """
+        return self._get("github", token, lambda: self._create_github(token))
+
+    def _create_github(self, token):
+        prepare_github()
+        return github.Github(token, **self.github_options) if token else github.Github(**self.github_options)
+
+    def github_session(self, token: str = None):
+        """
+        Return a pooled requests session for GitHub API calls not made with PyGithub (such as streamed
+        downloads), anonymous if no token is given.
+        """
+        return self._get("githubSession", token, lambda: self._create_github_session(token))
+
+    def _create_github_session(self, token):
+        session = _observed_session("github")
+        if token:
+            session.headers["Authorization"] = "token " + token
+        return session
+
+    def gitlab(self, token: str = None):
+        """
+        Return a pooled GitLab client, anonymous if no token is given.
+        """
+        return self._get("gitlab", token, lambda: self._create_gitlab(token))
+
+    def _create_gitlab(self, token):
+        session = _observed_session("gitlab")
+        client = gitlab.Gitlab(self.gitlab_url, private_token=token, api_version=4, session=session) if token else gitlab.Gitlab(self.gitlab_url, api_version=4, session=session)
+        key = ("gitlab", hash_token(token))
+
+        # remember the rate limit reported with each response
+        def record_rate_limit(response, *args, **kwargs):
+            try:
+                remaining = int(response.headers["RateLimit-Remaining"])
+                limit = int(response.headers["RateLimit-Limit"])
+                reset = int(response.headers.get("RateLimit-Reset", 0))
+            except (KeyError, ValueError):
+                return
+            self._gitlab_rate_limits[key] = (remaining, limit, reset)
+
+        client.session.hooks["response"].append(record_rate_limit)
+        return client
+
+    def rate_limit(self, service: str, token: str = None):
+        """
+        Return the (remaining, limit, reset) rate limit last reported for a token, or None if not known.
+
+        This is the budget seen by this process, which is shared with the other processes using the same token.
+        """
+        key = (service, hash_token(token))
+        with self._lock:
+            if service == "gitlab":
+                return self._gitlab_rate_limits.get(key)
+            entry = self._clients.get(key)
+        if entry is None:
+            return None
+
+        requester = entry[0].requester
+        remaining, limit = requester.rate_limiting
+        if limit < 0:
+            return None
+        return remaining, limit, requester.rate_limiting_resettime
+
+    def is_token_rejected(self, service: str, token: str) -> bool:
+        """
+        Return True if the service recently rejected this token.
+        """
+        return self._auth_result(service, token) is False
+
+    def reject_token(self, service: str, token: str) -> None:
+        """
+        Remember that the service rejected this token, and drop its client.
+        """
+        key = (service, hash_token(token))
+        with self._lock:
+            self._auth[key] = (False, time.monotonic() + self.ttl)
+            self._clients.pop(key, None)
+
+    def gitlab_auth(self, token: str) -> bool:
+        """
+        Authenticate a GitLab token, using the cached result where possible.
+
+        Returns False if GitLab rejects the token. Any other GitLab error is raised.
+        """
+        result = self._auth_result("gitlab", token)
+        if result is not None:
+            return result
+
+        try:
+            self.gitlab(token).auth()
+        except gitlab.exceptions.GitlabAuthenticationError as gae:
+            logger.info("GitLab rejected token %s: %s", hash_token(token)[:8], gae)
+            self.reject_token("gitlab", token)
+            return False
+
+        with self._lock:
+            self._auth[("gitlab", hash_token(token))] = (True, time.monotonic() + self.ttl)
+        return True
+
+    def github_for_read(self, token: str):
+        """
+        Return a (client, credentials_ignored) tuple for read access to GitHub.
+
+        If the token is known to be invalid, an anonymous client is returned so
+        that public repositories can still be read.
+        """
+        if token and self.is_token_rejected("github", token):
+            return self.github(), True
+        return self.github(token), False
+
+    def gitlab_for_read(self, token: str):
+        """
+        Return a (client, credentials_ignored) tuple for read access to GitLab.
+
+        If the token is rejected, an anonymous client is returned so that
+        public repositories can still be read.
+        """
+        if not token:
+            return self.gitlab(), False
+        if self.gitlab_auth(token):
+            return self.gitlab(token), False
+        return self.gitlab(), True
+
+    def _auth_result(self, service, token):
+        key = (service, hash_token(token))
+        with self._lock:
+            result = self._auth.get(key)
+            if result is None:
+                return None
+            if result[1] < time.monotonic():
+                del self._auth[key]
+                return None
+            return result[0]
+
+    def _get(self, service, token, factory):
+        key = (service, hash_token(token))
+        now = time.monotonic()
+
+        # Clients that are dropped from the pool may still be in use by another thread, which took them
+        # just before, so they are not closed here. Their connections are closed once they are garbage collected.
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = [factory(), now]
+                self._clients[key] = entry
+            entry[1] = now
+
+            # evict idle clients, and the least recently used if the pool is full
+            for other_key, other_entry in list(self._clients.items()):
+                if other_entry[1] < now - self.ttl:
+                    del self._clients[other_key]
+                    self._gitlab_rate_limits.pop(other_key, None)
+            while len(self._clients) > self.max_size:
+                oldest_key = min(self._clients, key=lambda k: self._clients[k][1])
+                del self._clients[oldest_key]
+                self._gitlab_rate_limits.pop(oldest_key, None)
+
+        return entry[0]
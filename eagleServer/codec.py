@@ -0,0 +1,130 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+JSON encoding and decoding for the EAGLE server.
+
+Uses orjson, if it is installed, for parsing and for compact output, and
+the standard library otherwise. orjson is stricter than the standard
+library: it does not parse NaN or Infinity, nor handle integers that do not
+fit in 64 bits, so those fall back to the standard library. When writing,
+orjson turns NaN and Infinity into null instead of failing, so output that
+contains them is also written by the standard library, which keeps them.
+
+Indented output is always produced by the standard library, so that files
+written to repositories are byte-for-byte the same as before.
+"""
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from flask.json.provider import DefaultJSONProvider
+
+from eagleServer import tracing
+
+INDENT = 4
+
+
+def loads(data):
+    """
+    Parse JSON from a str or bytes.
+    """
+    with tracing.span("parse"):
+        if orjson is not None:
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+        return json.loads(data)
+
+
+def dumps_bytes(obj, sort_keys: bool = False, default=None) -> bytes:
+    """
+    Serialise to compact UTF-8 encoded JSON.
+    """
+    with tracing.span("serialize"):
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                data = orjson.dumps(obj, default=default, option=option)
+            except TypeError:
+                pass
+            else:
+                # only output with nulls can have lost a NaN or Infinity
+                if b"null" not in data or not _has_non_finite(obj):
+                    return data
+        return json.dumps(obj, separators=(",", ":"), sort_keys=sort_keys, default=default, ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj, sort_keys: bool = False) -> str:
+    """
+    Serialise to compact JSON.
+    """
+    return dumps_bytes(obj, sort_keys).decode("utf-8")
+
+
+def dumps_indented(obj, sort_keys: bool = False) -> str:
+    """
+    Serialise to indented JSON, exactly as json.dumps(obj, indent=4) does.
+    """
+    with tracing.span("serialize", indented=True):
+        return json.dumps(obj, indent=INDENT, sort_keys=sort_keys)
+
+
+def _has_non_finite(obj) -> bool:
+    """
+    Return True if there is a NaN or infinite float anywhere in a structure of dicts and lists.
+    """
+    pending = [obj]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+    return False
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that uses this module for request bodies and compact responses.
+    """
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        # pretty printed (debug) responses are left to the standard library
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, self.sort_keys, self.default) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,77 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Compression of JSON responses.
+
+Graphs and palettes can be several megabytes of JSON, which compresses very
+well. Responses are compressed with brotli if the client accepts it and the
+optional 'brotli' package is installed, otherwise with gzip.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain"}
+
+
+def choose_encoding(accept_encodings):
+    """
+    Return the best encoding ("br" or "gzip") that the client accepts, or None.
+    """
+    if brotli is not None and accept_encodings["br"] > 0:
+        return "br"
+    if accept_encodings["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def compress_response(response, accept_encodings, min_size: int, level: int):
+    """
+    Compress the body of a Flask response in place, if it is worth doing.
+    """
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304) or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    # whether or not it is compressed, the response depends on Accept-Encoding
+    response.vary.add("Accept-Encoding")
+
+    encoding = choose_encoding(accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < min_size:
+        return response
+
+    if encoding == "br":
+        # brotli quality runs from 0 to 11, gzip levels from 1 to 9
+        compressed = brotli.compress(data, quality=min(11, level))
+    else:
+        compressed = gzip.compress(data, compresslevel=level)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
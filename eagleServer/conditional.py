@@ -0,0 +1,82 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Conditional (ETag) requests to the GitHub API.
+
+GitHub answers a request carrying the ETag of a previous response with
+'304 Not Modified' if nothing has changed, and such responses do not count
+against the rate limit. We keep the ETag and payload of repository metadata
+and folder listings in an LRU cache of (etag, payload) tuples, and revalidate
+them instead of downloading them again.
+"""
+import urllib.parse
+
+from eagleServer.cache import LRUCache
+from eagleServer.clients import github, hash_token
+
+
+def conditional_get(g, cache: LRUCache, key, url: str, parameters: dict = None):
+    """
+    GET a GitHub API url, revalidating any cached copy with If-None-Match.
+
+    Returns the decoded JSON payload. Errors are raised as GithubException,
+    exactly as they would be by the equivalent PyGithub method.
+    """
+    cached = cache.get(key)
+    headers = {"If-None-Match": cached[0]} if cached is not None else {}
+
+    response_headers, data = g.requester.requestJsonAndCheck("GET", url, parameters=parameters, headers=headers)
+
+    # a '304 Not Modified' response has an empty body
+    if data is None and cached is not None:
+        return cached[1]
+
+    etag = response_headers.get("etag")
+    if etag:
+        cache.put(key, (etag, data))
+    return data
+
+
+def get_repo(g, cache: LRUCache, token: str, repo_name: str):
+    """
+    Equivalent of g.get_repo(repo_name), using a conditional request.
+
+    The response depends on the permissions of the token, so the token is part of the cache key.
+    """
+    raw_data = conditional_get(g, cache, ("repo", hash_token(token), repo_name), "/repos/" + repo_name)
+    return g.create_from_raw_data(github.Repository.Repository, raw_data)
+
+
+def get_folder(g, cache: LRUCache, token: str, repo, path: str, branch: str) -> list:
+    """
+    Equivalent of repo.get_contents(path, ref=branch) for a folder, using a conditional request.
+
+    Returns a list of dicts with the 'type', 'name' and 'path' of each entry.
+    """
+    url = repo.url + "/contents/" + urllib.parse.quote(path)
+    items = conditional_get(g, cache, ("folder", hash_token(token), repo.full_name, branch, path), url, {"ref": branch})
+
+    # a path that refers to a file returns a single object rather than a list
+    if isinstance(items, dict):
+        items = [items]
+
+    return [{"type": item["type"], "name": item["name"], "path": item["path"]} for item in items]
@@ -0,0 +1,124 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Cached lookups of Docker Hub images and tags.
+
+Docker Hub returns lists one page at a time and strictly rate limits
+anonymous clients. Lookups here follow the 'next' links to return the
+complete list, and are cached: a fresh entry is returned as is, an entry
+that is older than the TTL but still within the stale window is returned
+immediately while a background thread fetches a new copy, and concurrent
+identical lookups are coalesced into one upstream request.
+"""
+import logging
+import threading
+import time
+import urllib.parse
+
+from eagleServer.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+IMAGES_URL = "https://hub.docker.com/v2/repositories/{0}/"
+TAGS_URL = "https://registry.hub.docker.com/v2/repositories/{0}/tags"
+
+
+class DockerHub:
+    """
+    Docker Hub client with a cache in front of it.
+
+    'fetch' is called with a URL and returns the decoded JSON response, or raises.
+    'cache' is one of the caches in eagleServer.cache.
+    """
+    def __init__(self, fetch, cache, ttl: float, stale_ttl: float, max_pages: int, page_size: int = 100):
+        self.fetch = fetch
+        self.cache = cache
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_pages = max_pages
+        self.page_size = page_size
+        self._flights = SingleFlight()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def images(self, user_name: str) -> dict:
+        """
+        Return all the public images of a Docker Hub user or organisation.
+        """
+        return self._lookup(IMAGES_URL.format(urllib.parse.quote(user_name)))
+
+    def tags(self, image_name: str) -> dict:
+        """
+        Return all the tags of a Docker Hub image.
+        """
+        return self._lookup(TAGS_URL.format(urllib.parse.quote(image_name)))
+
+    def _lookup(self, url):
+        entry = self.cache.get(url)
+        if entry is not None:
+            if time.time() - entry["fetched"] >= self.ttl:
+                # stale: answer now, and refresh in the background
+                with self._lock:
+                    start = url not in self._refreshing
+                    self._refreshing.add(url)
+                if start:
+                    threading.Thread(target=self._refresh, args=(url,), daemon=True).start()
+            return entry["data"]
+
+        return self._flights.do(url, self._fetch_and_store, url)
+
+    def _refresh(self, url):
+        try:
+            self._flights.do(url, self._fetch_and_store, url)
+        except Exception as e:
+            logger.warning("Background refresh of %s failed, keeping the stale copy: %s", url, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+    def _fetch_and_store(self, url):
+        data = self._fetch_all(url)
+        self.cache.put(url, {"fetched": time.time(), "data": data}, ttl=self.ttl + self.stale_ttl)
+        return data
+
+    def _fetch_all(self, url):
+        """
+        Fetch every page of a list, and return them combined into a single page.
+        """
+        host = urllib.parse.urlparse(url).hostname
+        page_url = url + "?" + urllib.parse.urlencode({"page_size": self.page_size})
+        results = []
+        count = None
+
+        for _ in range(self.max_pages):
+            page = self.fetch(page_url)
+            results.extend(page.get("results", []))
+            count = page.get("count", count)
+            page_url = page.get("next")
+
+            # only follow links to the same host
+            if not page_url or urllib.parse.urlparse(page_url).hostname != host:
+                break
+        else:
+            logger.warning("Stopped after %d pages of %s", self.max_pages, url)
+
+        return {"count": count if count is not None else len(results), "next": None, "previous": None, "results": results}
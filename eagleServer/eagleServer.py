@@ -23,14 +23,17 @@
 This is the main module of the EAGLE server side code.
 """
 import argparse
-import base64
-import certifi
+import concurrent.futures
 import datetime
+import gc
 import json
 import logging
 import os
+import shutil
 import sys
 import subprocess
+import threading
+import time
 
 import ipaddress
 import socket
@@ -39,21 +42,43 @@ import urllib.request
 import urllib.parse
 import ssl
 
-import github
-import gitlab
-from flask import Flask, request, render_template, jsonify, send_from_directory
+from flask import Flask, Response, request, render_template, jsonify, send_from_directory
 
 import config.config
 from config.config import GITHUB_DEFAULT_REPO_LIST
 from config.config import GITLAB_DEFAULT_REPO_LIST
 from config.config import STUDENT_GITHUB_DEFAULT_REPO_LIST
 from config.config import SERVER_PORT
+from eagleServer.blob_cache import BlobCache
+from eagleServer.clients import ClientPool, github, gitlab, hash_token, prepare_github
+from eagleServer.compression import compress_response
+from eagleServer import codec
+from eagleServer import conditional
+from eagleServer import lazy
+from eagleServer.cache import LRUCache, create_cache
+from eagleServer.dockerhub import DockerHub
+from eagleServer.httpcache import HttpCache
+from eagleServer.mirror import GitMirror
+from eagleServer.singleflight import SingleFlight
+from eagleServer import metrics
+from eagleServer import ratelimit
+from eagleServer import tracing
+from eagleServer import trees
+from eagleServer import webhooks
+from eagleServer.ratelimit import RateLimitError, RateLimitScheduler
+from eagleServer.upstream import CircuitOpenError, HostLimiter, UpstreamBusyError, UpstreamError, host_of, is_upstream_failure, raise_upstream_failure
 
 URL_OPEN_TIMEOUT = 20
 
 ALLOWED_URL_SCHEMES = {"http", "https"}
 ALLOWED_URL_EXTENSIONS = {".graph", ".palette"}
 
+# created on first use (see get_ssl_context()), as loading the CA certificates is slow
+ssl_context = None
+
+# versions of the response format of the routes that open files, see file_response()
+FILE_RESPONSE_FORMATS = {1, 2}
+
 
 class RemoteFetchError(Exception):
     """Raised by fetch_json_url when a remote HTTP fetch fails."""
@@ -63,18 +88,27 @@ class RemoteFetchError(Exception):
         self.status = status
 
 
-def fetch_json_url(url: str, label: str) -> dict:
+def fetch_json_url(url: str, label: str, cached: bool = True) -> dict:
     """
     Fetch a URL, decode the response, and parse it as JSON.
 
+    Responses are cached according to their HTTP caching headers (see eagleServer.httpcache),
+    unless 'cached' is False, for callers that keep the results in their own cache.
     Raises RemoteFetchError with an appropriate HTTP status code on any
     network, HTTP, or parse failure.  All exceptions are logged via the
     Flask application logger before being re-raised as RemoteFetchError.
     """
-    ctx = ssl.create_default_context(cafile=certifi.where())
     try:
-        with urllib.request.urlopen(url, context=ctx, timeout=URL_OPEN_TIMEOUT) as response:
-            return json.loads(response.read().decode())
+        if not cached:
+            status, headers, body = open_url(url, {})
+            return codec.loads(body)
+        return http_cache.get_json(url)
+    except CircuitOpenError as e:
+        app.logger.warning("Not fetching %s, the host is not responding: %s", label, url)
+        raise RemoteFetchError("Remote host is not responding, please try again later", 503) from e
+    except UpstreamBusyError as e:
+        app.logger.warning("Too many concurrent requests for %s: %s", label, url)
+        raise RemoteFetchError("Remote host is busy, please try again", 503) from e
     except urllib.error.HTTPError as e:
         app.logger.exception("%s HTTP %s for %s", label, e.code, url)
         status = 404 if e.code == 404 else 502
@@ -90,6 +124,67 @@ def fetch_json_url(url: str, label: str) -> dict:
         raise RemoteFetchError("An unexpected error occurred", 500) from e
 
 
+def open_url(url: str, headers: dict):
+    """
+    Helper method for the HTTP cache, to GET a URL with extra request headers.
+
+    Returns a (status, headers, body) tuple, with status 304 if the resource is not modified.
+    """
+    url_request = urllib.request.Request(url, headers=headers)
+    host = host_of(url)
+    service = service_of(host)
+    # user-supplied URLs share one pool of slots, whatever their host
+    with host_limiter.limit(host, pool="url" if service == "url" else None), tracing.span(service, method="GET", host=host) as span, metrics.upstream(service) as call:
+        try:
+            with urllib.request.urlopen(url_request, context=get_ssl_context(), timeout=URL_OPEN_TIMEOUT) as response:
+                body = response.read()
+                call.status = response.status
+                span.set(status=response.status)
+                return response.status, response.headers, body
+        except urllib.error.HTTPError as e:
+            call.status = e.code
+            span.set(status=e.code)
+            if e.code == 304:
+                return e.code, e.headers, b""
+            raise
+
+
+def service_of(host: str) -> str:
+    """
+    Return the name of the upstream service of a host, as used in metrics: "github", "gitlab", "dockerhub" or "url".
+    """
+    if host == GITHUB_HOST:
+        return "github"
+    if host == GITLAB_HOST:
+        return "gitlab"
+    if host == "docker.com" or host.endswith(".docker.com"):
+        return "dockerhub"
+    return "url"
+
+
+def circuit_changed(host, opened):
+    """
+    Log and count circuit breakers being opened and closed (see eagleServer.upstream).
+    """
+    if opened:
+        app.logger.warning("%s is not responding, calls to it are paused for %d seconds", host, config.config.UPSTREAM_RETRY_INTERVAL)
+    else:
+        app.logger.info("%s is responding again", host)
+    metrics.circuit_changed(service_of(host), opened)
+
+
+def resolve_host(host: str, port: int):
+    """
+    Helper method to resolve a host name, remembering the result for a short time.
+    """
+    key = (host, port)
+    addresses = resolved_hosts.get(key)
+    if addresses is None:
+        addresses = [sockaddr[0] for *_, sockaddr in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+        resolved_hosts.put(key, addresses)
+    return addresses
+
+
 def validate_remote_url(url: str) -> None:
     """
     Validate a user-supplied URL before fetching it server-side.
@@ -120,15 +215,15 @@ def validate_remote_url(url: str) -> None:
     # 4. Resolve the hostname and check every returned address
     port = parsed.port or (443 if parsed.scheme == "https" else 80)
     try:
-        addr_infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+        addresses = resolve_host(host, port)
     except socket.gaierror:
         raise ValueError("URL host could not be resolved")
 
-    if not addr_infos:
+    if not addresses:
         raise ValueError("URL host resolved to no addresses")
 
-    for *_, sockaddr in addr_infos:
-        ip = ipaddress.ip_address(sockaddr[0])
+    for address in addresses:
+        ip = ipaddress.ip_address(address)
         if not ip.is_global:
             raise ValueError("URL resolves to a non-public address")
 
@@ -151,38 +246,345 @@ staticdir = os.path.normpath(os.path.join(BASE_DIR, "..", "static"))
 srcdir = os.path.normpath(os.path.join(BASE_DIR, "..", "src"))
 
 app = Flask(__name__, template_folder=templdir, static_folder=staticdir)
+app.json = codec.JSONProvider(app)
+metrics.init_app(app)
+tracing.init_app(app, config.config.SERVER_TIMING, config.config.TRACE_SAMPLE_RATE, lambda: get_trace_file())
 app.config.from_object("config")
 
-version = "Unknown"
-commit_hash = "Unknown"
-
-# first look for the version and commit_hash in the VERSION file
-# that was generated during the build process
-try:
-    with open(staticdir+"/VERSION") as vfile:
-        for line in vfile.readlines():
-            if "SW_VER" in line:
-                version = line.split("SW_VER ")[1].strip()[1:-1]
-                continue
-            if "COMMIT_HASH" in line:
-                commit_hash = line.split("COMMIT_HASH ")[1].strip()[1:-1]
-except Exception as e:
-    print(f"Unable to load VERSION file: {e}")
-
-# if the first method was unsuccessful, then run some git commands
-# to find the version and commit_hash
-if version == "Unknown" and commit_hash == "Unknown":
+client_pool = ClientPool(
+    config.config.CLIENT_POOL_TTL, config.config.CLIENT_POOL_MAX_SIZE, config.config.GITHUB_BASE_URL, config.config.GITLAB_URL,
+    config.config.GITHUB_SECONDS_BETWEEN_REQUESTS, config.config.GITHUB_SECONDS_BETWEEN_WRITES
+)
+host_limiter = HostLimiter(
+    config.config.UPSTREAM_MAX_CONCURRENCY_PER_HOST, config.config.UPSTREAM_WAIT_TIMEOUT,
+    config.config.UPSTREAM_FAILURE_THRESHOLD, config.config.UPSTREAM_RETRY_INTERVAL,
+    {"url": config.config.UPSTREAM_URL_MAX_CONCURRENCY}, circuit_changed
+)
+rate_limits = RateLimitScheduler(client_pool.rate_limit, config.config.RATE_LIMIT_RESERVE, config.config.RATE_LIMIT_MAX_WAIT)
+flights = SingleFlight()
+resolved_hosts = LRUCache(1024, config.config.DNS_CACHE_TTL, "dns")
+GITHUB_HOST = host_of(config.config.GITHUB_BASE_URL)
+GITLAB_HOST = host_of(config.config.GITLAB_URL)
+conditional_cache = None
+tree_cache = None
+folder_tree_cache = None
+docker_cache = None
+docker_hub = None
+http_cache = None
+listing_cache = None
+stale_file_cache = None
+blob_cache = None
+git_mirror = None
+file_commit_cache = None
+push_versions = None
+
+
+def init_caches():
+    """
+    Create the response caches, using the backend chosen in the config.
+
+    Called again by main() if a TEMP_FILE_FOLDER is given on the command line.
+    """
+    global conditional_cache, tree_cache, folder_tree_cache, docker_cache, docker_hub, http_cache, listing_cache, stale_file_cache, git_mirror, file_commit_cache, push_versions
+    settings = {"folder": TEMP_FILE_FOLDER, "redis_url": config.config.CACHE_REDIS_URL}
+    conditional_cache = create_cache(config.config.CACHE_BACKEND, "conditional", config.config.CONDITIONAL_CACHE_MAX_ENTRIES, **settings)
+    tree_cache = create_cache(config.config.CACHE_BACKEND, "tree", config.config.TREE_CACHE_MAX_ENTRIES, **settings)
+    folder_tree_cache = create_cache(config.config.CACHE_BACKEND, "folderTree", config.config.FOLDER_TREE_CACHE_MAX_ENTRIES, **settings)
+    listing_cache = create_cache(config.config.CACHE_BACKEND, "listing", config.config.LISTING_CACHE_MAX_ENTRIES, **settings)
+    stale_file_cache = create_cache(config.config.CACHE_BACKEND, "staleFile", config.config.STALE_FILE_CACHE_MAX_ENTRIES, **settings)
+    docker_cache = create_cache(config.config.CACHE_BACKEND, "docker", config.config.DOCKER_HUB_CACHE_MAX_ENTRIES, **settings)
+    http_cache = HttpCache(create_cache(config.config.CACHE_BACKEND, "http", config.config.HTTP_CACHE_MAX_ENTRIES, **settings), open_url, config.config.HTTP_CACHE_MAX_STALE)
+    # Docker Hub results are kept in docker_cache, so they are not stored in the HTTP cache as well
+    docker_hub = DockerHub(lambda url: fetch_json_url(url, label="Docker Hub", cached=False), docker_cache, config.config.DOCKER_HUB_CACHE_TTL, config.config.DOCKER_HUB_STALE_TTL, config.config.DOCKER_HUB_MAX_PAGES)
+
+    push_versions = None
+    if config.config.WEBHOOK_GITHUB_SECRET or config.config.WEBHOOK_GITLAB_TOKEN:
+        webhook_cache = create_cache(config.config.CACHE_BACKEND, "webhook", config.config.WEBHOOK_CACHE_MAX_ENTRIES, **settings)
+        if isinstance(webhook_cache, LRUCache):
+            # a push received by one worker process would not be seen by the others, which
+            # would keep serving what they cached before it for up to WEBHOOK_CACHE_TTL
+            app.logger.warning("Webhooks disabled, they need a shared cache backend (sqlite or redis)")
+        else:
+            file_commit_cache = create_cache(config.config.CACHE_BACKEND, "fileCommit", config.config.FILE_COMMIT_CACHE_MAX_ENTRIES, **settings)
+            push_versions = webhooks.PushVersions(webhook_cache, config.config.WEBHOOK_WATCH_TTL)
+
+    git_mirror = None
+    if config.config.GIT_MIRROR_ENABLED:
+        if shutil.which("git") is None:
+            app.logger.warning("Git mirrors disabled, git executable not found")
+        else:
+            clone_urls = {"github": config.config.GITHUB_CLONE_URL, "gitlab": config.config.GITLAB_CLONE_URL}
+            repositories = {(service, name): clone_urls[service].rstrip("/") + "/" + name + ".git" for service, name in config.config.GIT_MIRROR_REPOSITORIES}
+            git_mirror = GitMirror(os.path.join(TEMP_FILE_FOLDER, "mirrors"), repositories, config.config.GIT_MIRROR_REFRESH_INTERVAL)
+
+
+init_caches()
+
+
+def get_ssl_context():
+    """
+    Return the SSL context used to fetch URLs, with the CA certificates from certifi.
+    """
+    global ssl_context
+    if ssl_context is None:
+        import certifi
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+    return ssl_context
+
+
+def get_trace_file():
+    """
+    Return the path of the file that sampled request traces are written to.
+    """
+    return config.config.TRACE_FILE or os.path.join(TEMP_FILE_FOLDER, "traces.jsonl")
+
+
+def get_blob_cache():
+    """
+    Return the on-disk cache of file contents, creating it on first use so that
+    a TEMP_FILE_FOLDER given on the command line is respected.
+    """
+    global blob_cache
+    if blob_cache is None:
+        blob_cache = BlobCache(os.path.join(TEMP_FILE_FOLDER, "blob_cache"), config.config.BLOB_CACHE_MAX_BYTES)
+    return blob_cache
+
+
+def coalesced(key, host, func, *args):
+    """
+    Call func(*args), holding an upstream slot for 'host' (if given).
+
+    Concurrent calls with the same key share a single call and its result, so that
+    many users opening the same file at once only cause one upstream fetch. The key
+    must include everything the result depends on, including (a hash of) the token.
+    The shared result must not be modified by the callers.
+    """
+    def call():
+        if host is None:
+            return func(*args)
+        with host_limiter.limit(host):
+            return func(*args)
+    return flights.do(key, call)
+
+
+def check_rate_limit(service, token, priority):
+    """
+    Wait until a call to GitHub or GitLab with this token may go ahead, or raise RateLimitError (see eagleServer.ratelimit).
+
+    Tokens that were rejected are checked against the anonymous budget, as they are replaced by anonymous access.
+    """
+    if token and client_pool.is_token_rejected(service, token):
+        token = None
+    rate_limits.check(service, token or None, priority)
+
+
+def listing(key, route, service, host, token, func, *args, version=None):
+    """
+    Call a function that lists files in a repository, as coalesced() does, at background priority.
+
+    The last successful result is kept, and returned with 'rateLimited' set instead of listing
+    the files again when the rate limit budget is low, or as a stale copy (see stale_copy()) if
+    GitHub or GitLab fail. If the folder has a version (see push_version()), the result is reused
+    until a push changes the folder.
+    """
+    if version is not None:
+        key = key + (version,)
+        cached = listing_cache.get(key)
+        if cached is not None:
+            return cached["result"]
+
+    try:
+        check_rate_limit(service, token, ratelimit.BACKGROUND)
+    except RateLimitError as e:
+        cached = listing_cache.get(key)
+        if cached is None:
+            raise
+        app.logger.info("Returning stored listing of %s: %s", key[1], e)
+        return dict(cached["result"], rateLimited=True)
+
+    try:
+        result = coalesced(key, host, func, *args)
+    except Exception as e:
+        copy = stale_copy(listing_cache, key, route, e)
+        if copy is None:
+            raise_upstream_failure(e)
+        return copy
+
+    if "error" not in result:
+        listing_cache.put(key, {"fetched": time.time(), "result": result}, ttl=config.config.WEBHOOK_CACHE_TTL if version is not None else None)
+    return result
+
+
+def stale_copy(cache, key, route, error):
+    """
+    Return the last good copy of a result, with 'stale' set and its age in seconds as 'staleAge', after
+    an upstream call for it failed with 'error'.
+
+    Returns None if the error does not mean that GitHub or GitLab failed (see upstream.is_upstream_failure()),
+    or if there is no copy that is at most STALE_MAX_AGE seconds old for the route.
+    """
+    if not is_upstream_failure(error):
+        return None
+    entry = cache.get(key)
+    if entry is None:
+        return None
+
+    age = time.time() - entry["fetched"]
+    if age > config.config.STALE_MAX_AGE.get(route, 0):
+        return None
+    app.logger.warning("Returning a copy of %s from %d seconds ago for %s: %s", key[1], age, route, error)
+    return dict(entry["result"], stale=True, staleAge=int(age))
+
+
+def with_stale_copy(key, route, read):
+    """
+    Call a function that reads a file and returns a (result, status) tuple, keeping the last good result,
+    which is returned instead (see stale_copy()) if GitHub or GitLab fail.
+    """
     try:
-        version = subprocess.run(["git", "describe", "--abbrev=0", "--tags"], capture_output=True, text=True).stdout.strip() + " (dev)"
-        commit_hash = subprocess.run(["git", "rev-parse", "--short=8", "HEAD"], capture_output=True, text=True).stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error running git command: {e}")
-    except FileNotFoundError:
-        print("Git executable not found. Ensure git is installed and in the system PATH.")
+        result, status = read()
     except Exception as e:
-        print(f"Unexpected error determining version: {e}")
+        copy = stale_copy(stale_file_cache, key, route, e)
+        if copy is None:
+            raise_upstream_failure(e)
+        return copy, 200
+
+    if status == 200 and config.config.STALE_MAX_AGE.get(route, 0) > 0:
+        stale_file_cache.put(key, {"fetched": time.time(), "result": result}, ttl=config.config.STALE_MAX_AGE[route])
+    return result, status
+
+
+def push_version(service, repo_name, branch, path):
+    """
+    Return the version of a file or folder in a repository that sends push notifications (see eagleServer.webhooks),
+    or None if the repository does not.
+    """
+    if push_versions is None:
+        return None
+    folder_name, repo_name = extract_folder_and_repo_names(repo_name)
+    if not push_versions.watched(service, repo_name):
+        return None
+    return push_versions.version(service, repo_name, branch, path)
+
+
+def pushed_head(service, repo_name, branch):
+    """
+    Return the head commit SHA of a branch of a repository that sends push notifications, or None if not known.
+    """
+    if push_versions is None or not push_versions.watched(service, repo_name):
+        return None
+    return push_versions.head(service, repo_name, branch)
+
+
+@app.errorhandler(RateLimitError)
+def rate_limit_exceeded(e):
+    """
+    Calls refused to save the rate limit budget fail with 429, and the time until the budget is reset.
+    """
+    app.logger.warning("Rejected request to %s: %s", request.path, e)
+    return jsonify({"error": str(e), "rateLimit": e.status}), 429, {"Retry-After": str(e.retry_after)}
+
+
+@app.errorhandler(UpstreamBusyError)
+def upstream_busy(e):
+    """
+    Requests that can not get a slot for their upstream host within UPSTREAM_WAIT_TIMEOUT, or whose upstream host
+    is not responding (see UPSTREAM_FAILURE_THRESHOLD), fail fast with 503.
+    """
+    app.logger.warning("Rejected request to %s: %s", request.path, e)
+    if isinstance(e, CircuitOpenError):
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+    return jsonify({"error": str(e)}), 503
+
+
+@app.errorhandler(UpstreamError)
+def upstream_failed(e):
+    """
+    Calls that GitHub or GitLab fail, with no earlier result to return instead, fail with the upstream status.
+    """
+    app.logger.warning("Upstream failure for %s: %s", request.path, e)
+    return jsonify({"error": str(e)}), e.status
+
+
+@app.after_request
+def compress(response):
+    """
+    Compress JSON responses if the client accepts it.
+    """
+    if config.config.COMPRESSION_MIN_SIZE <= 0:
+        return response
+    with tracing.span("compress"):
+        return compress_response(response, request.accept_encodings, config.config.COMPRESSION_MIN_SIZE, config.config.COMPRESSION_LEVEL)
+
+version_info = None
+
+
+def get_version():
+    """
+    Return the (version, commit_hash) of the server, worked out on first use.
+
+    Builds record them in eagleServer/_version.py (see updateVersion.py) and static/VERSION;
+    in a development checkout they come from git instead.
+    """
+    global version_info
+    if version_info is not None:
+        return version_info
+
+    version = "Unknown"
+    commit_hash = "Unknown"
+
+    # first look for the version and commit_hash stamped during the build process
+    try:
+        from eagleServer._version import version, commit_hash
+    except ImportError:
+        try:
+            with open(staticdir+"/VERSION") as vfile:
+                for line in vfile.readlines():
+                    if "SW_VER" in line:
+                        version = line.split("SW_VER ")[1].strip()[1:-1]
+                        continue
+                    if "COMMIT_HASH" in line:
+                        commit_hash = line.split("COMMIT_HASH ")[1].strip()[1:-1]
+        except Exception as e:
+            print(f"Unable to load VERSION file: {e}")
+
+    # if the build did not record them, then run some git commands
+    # to find the version and commit_hash
+    if version == "Unknown" and commit_hash == "Unknown":
+        try:
+            version = subprocess.run(["git", "describe", "--abbrev=0", "--tags"], capture_output=True, text=True).stdout.strip() + " (dev)"
+            commit_hash = subprocess.run(["git", "rev-parse", "--short=8", "HEAD"], capture_output=True, text=True).stdout.strip()
+        except subprocess.CalledProcessError as e:
+            print(f"Error running git command: {e}")
+        except FileNotFoundError:
+            print("Git executable not found. Ensure git is installed and in the system PATH.")
+        except Exception as e:
+            print(f"Unexpected error determining version: {e}")
+
+    print("Version: " + version + " Commit Hash: " + commit_hash)
+    version_info = (version, commit_hash)
+    return version_info
+
+
+def preload():
+    """
+    Do the work that is otherwise left until the first request: import the GitHub and GitLab
+    client libraries, load the CA certificates and work out the version.
+
+    Called in the gunicorn master when the app is preloaded (see docker/gunicorn_conf.py), so
+    that workers start with all of this already done and shared copy-on-write with the master.
+    """
+    for module in (github, gitlab, lazy.lazy_import("requests")):
+        lazy.load(module)
+    prepare_github()
+    get_ssl_context()
+    get_version()
+
+    # move everything loaded so far out of the garbage collector's reach, so that collections
+    # in the workers do not touch (and so copy) the pages shared with the master
+    gc.collect()
+    gc.freeze()
 
-print("Version: " + version + " Commit Hash: " + commit_hash)
 
 @app.route("/")
 def index():
@@ -200,6 +602,7 @@ def index():
     filename   = request.args.get("filename", "")
     url        = request.args.get("url", "")
     mode       = request.args.get("mode", "")
+    version, commit_hash = get_version()
 
     # if the url does not specify a graph to load, just send render the default template with no additional information
     if service == "":
@@ -231,7 +634,7 @@ def save():
     """
     content = request.get_json(silent=True)
     content["modelData"]["lastModifiedDatetime"] = datetime.datetime.now().timestamp()
-    return json.dumps(content, indent=4, sort_keys=True)
+    return codec.dumps_indented(content, sort_keys=True)
 
 
 @app.route("/getGitHubRepositoryList", methods=["GET"])
@@ -264,6 +667,203 @@ def get_student_repository_list():
     return jsonify(STUDENT_GITHUB_DEFAULT_REPO_LIST)
 
 
+@app.route("/cacheStats", methods=["GET"])
+def get_cache_stats():
+    """
+    FLASK GET routing method for '/cacheStats'
+
+    Returns the hit and miss counts of the response caches in this server process.
+    """
+    return jsonify({
+        "conditional": conditional_cache.stats(),
+        "tree": tree_cache.stats(),
+        "folderTree": folder_tree_cache.stats(),
+        "docker": docker_cache.stats(),
+        "listing": listing_cache.stats(),
+        "staleFile": stale_file_cache.stats(),
+        "mirror": git_mirror.stats.as_dict() if git_mirror is not None else None,
+        "fileCommit": file_commit_cache.stats() if push_versions is not None else None,
+    })
+
+
+@app.route("/health", methods=["GET"])
+def get_health():
+    """
+    FLASK GET routing method for '/health'
+
+    Returns "ok", or "degraded" if GitHub or GitLab are not responding, with the circuit breaker state of the
+    upstream hosts whose last call failed, as seen by this server process. Hosts of user-supplied URLs are not
+    named, only counted.
+    """
+    upstreams = {}
+    urls = {"open": 0, "failing": 0}
+    for host, circuit in host_limiter.circuits().items():
+        if service_of(host) == "url":
+            urls["open" if circuit["state"] != "closed" else "failing"] += 1
+        else:
+            upstreams[host] = circuit
+
+    degraded = any(upstreams.get(host, {}).get("state", "closed") != "closed" for host in (GITHUB_HOST, GITLAB_HOST))
+    return jsonify({
+        "status": "degraded" if degraded else "ok",
+        "upstreams": upstreams,
+        "urls": urls,
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    FLASK GET routing method for '/metrics'
+
+    Returns the server's metrics in the Prometheus text format (see eagleServer.metrics), added up over all worker processes.
+    """
+    if not metrics.enabled():
+        return jsonify({"error": "Metrics are not available, the 'prometheus_client' package is not installed"}), 404
+
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/getRateLimit", methods=["POST"])
+def get_rate_limit():
+    """
+    FLASK POST routing method for '/getRateLimit'
+
+    Returns the remaining GitHub or GitLab API rate limit budget for a token, as last reported to this server process. The POST request content is a JSON string containing the service and optionally a token; without one, the budget shared by all anonymous users is returned.
+    The budget is null if no request has been made with the token yet.
+    """
+    content = request.get_json(silent=True)
+
+    try:
+        service = content["service"].lower()
+        token = content.get("token") or None
+    except (KeyError, TypeError, AttributeError) as ke:
+        app.logger.error("KeyError in getRateLimit: %s", ke)
+        return jsonify({"error":"Service not specified in request"}), 400
+
+    if service not in ratelimit.SERVICE_NAMES:
+        return jsonify({"error": "Unknown service: {0}".format(service)}), 400
+
+    if token and client_pool.is_token_rejected(service, token):
+        token = None
+
+    return jsonify({"service": service, "rateLimit": rate_limits.status(service, token)})
+
+
+@app.route("/webhook/github", methods=["POST"])
+def github_webhook():
+    """
+    FLASK POST routing method for '/webhook/github'
+
+    Receives push notifications from GitHub, signed with WEBHOOK_GITHUB_SECRET, and updates the caches (see eagleServer.webhooks).
+    """
+    if push_versions is None or not config.config.WEBHOOK_GITHUB_SECRET:
+        return jsonify({"error": "GitHub webhooks are not enabled"}), 404
+
+    body = request.get_data()
+    if not webhooks.verify_github_signature(config.config.WEBHOOK_GITHUB_SECRET, body, request.headers.get("X-Hub-Signature-256")):
+        app.logger.warning("Rejected GitHub webhook with an invalid signature")
+        return jsonify({"error": "Invalid signature"}), 401
+
+    event = request.headers.get("X-GitHub-Event", "")
+    try:
+        # webhooks can be set to send either JSON or a form with the JSON in 'payload'
+        if request.mimetype == "application/x-www-form-urlencoded":
+            body = urllib.parse.parse_qs(body.decode("utf-8"))["payload"][0]
+        payload = codec.loads(body)
+
+        if event == "ping":
+            # sent when the webhook is added, without a repository for organization and app webhooks
+            if "repository" in payload:
+                push_versions.watch("github", payload["repository"]["full_name"])
+            return jsonify({"success": True})
+        if event != "push":
+            return jsonify({"success": True, "ignored": event})
+        push = webhooks.parse_github_push(payload)
+    except (ValueError, KeyError, TypeError) as e:
+        app.logger.error("Invalid GitHub webhook payload: %s", e)
+        return jsonify({"error": "Invalid payload: " + str(e)}), 400
+
+    return jsonify(apply_push(push))
+
+
+@app.route("/webhook/gitlab", methods=["POST"])
+def gitlab_webhook():
+    """
+    FLASK POST routing method for '/webhook/gitlab'
+
+    Receives push notifications from GitLab, with WEBHOOK_GITLAB_TOKEN as their secret token, and updates the caches (see eagleServer.webhooks).
+    """
+    if push_versions is None or not config.config.WEBHOOK_GITLAB_TOKEN:
+        return jsonify({"error": "GitLab webhooks are not enabled"}), 404
+
+    if not webhooks.verify_gitlab_token(config.config.WEBHOOK_GITLAB_TOKEN, request.headers.get("X-Gitlab-Token")):
+        app.logger.warning("Rejected GitLab webhook with an invalid token")
+        return jsonify({"error": "Invalid token"}), 401
+
+    try:
+        payload = codec.loads(request.get_data())
+        push = webhooks.parse_gitlab_push(payload)
+    except (ValueError, KeyError, TypeError) as e:
+        app.logger.error("Invalid GitLab webhook payload: %s", e)
+        return jsonify({"error": "Invalid payload: " + str(e)}), 400
+
+    if push is None:
+        return jsonify({"success": True, "ignored": payload.get("object_kind")})
+    return jsonify(apply_push(push))
+
+
+def apply_push(push):
+    """
+    Helper method to update the caches after a push to a branch.
+
+    Returns the dict to be sent to the client.
+    """
+    if push is None:
+        return {"success": True, "ignored": "not a branch"}
+
+    paths = push_versions.record(push)
+    app.logger.info("Push to %s %s/%s changed %s", push.service, push.repo_name, push.branch, "everything" if paths is None else "%d paths" % len(push.paths))
+
+    if git_mirror is not None:
+        git_mirror.invalidate(push.service, push.repo_name)
+
+    if config.config.WEBHOOK_REWARM and push.head is not None:
+        if paths is None:
+            folders = {""}
+        else:
+            folders = webhooks.affected_paths(path.rsplit("/", 1)[0] if "/" in path else "" for path in push.paths)
+        rewarm_listings(push.service, push.repo_name, push.branch, folders)
+
+    return {"success": True, "invalidated": sorted(paths) if paths is not None else "branch"}
+
+
+def rewarm_listings(service, repo_name, repo_branch, folders, max_folders=50):
+    """
+    Helper method to list folders of a repository again, in a background thread, after a push changed them.
+
+    The folders are listed anonymously, so this only helps public repositories.
+    """
+    if service == "github":
+        route, host, func = "getGitHubFilesAll", GITHUB_HOST, list_git_hub_files
+    else:
+        route, host, func = "getGitLabFilesAll", GITLAB_HOST, list_git_lab_files
+
+    def run():
+        # the shallowest folders first, as they are the most likely to be opened
+        for folder in sorted(folders, key=lambda f: (f.count("/"), f))[:max_folders]:
+            key = (service, repo_name, repo_branch, folder, hash_token(""))
+            version = push_version(service, repo_name, repo_branch, folder)
+            try:
+                listing(key, route, service, host, "", func, repo_name, repo_branch, "", folder, version=version)
+            except Exception as e:
+                app.logger.warning("Unable to list %s/%s again after a push: %s", repo_name, folder, e)
+                return
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def extract_folder_and_repo_names(repo_name):
     """
     If repository name has more than one slash, then after the second slash it is a folder name in that repository.
@@ -298,45 +898,66 @@ def get_git_hub_files_all():
         app.logger.error("KeyError in getGitHubFilesAll: %s", ke)
         return jsonify({"error":"Repository, Branch or Token not specified in request"}), 400
 
+    mirrored = list_mirrored_files("github", repo_name, repo_branch, repo_path)
+    if mirrored is not None:
+        return jsonify(mirrored)
+
+    key = ("github", repo_name, repo_branch, repo_path, hash_token(repo_token))
+    version = push_version("github", repo_name, repo_branch, repo_path)
+    return jsonify(listing(key, "getGitHubFilesAll", "github", GITHUB_HOST, repo_token, list_git_hub_files, repo_name, repo_branch, repo_token, repo_path, version=version))
+
+
+def list_git_hub_files(repo_name, repo_branch, repo_token, repo_path):
+    """
+    Helper method to list the files in a GitHub repository.
+
+    Returns the dict to be sent to the client.
+    """
     # Extracting the true repo name and repo folder.
     folder_name, repo_name = extract_folder_and_repo_names(repo_name)
 
     # authenticate or not
-    credentials_ignored = False
-    g = github.Github(repo_token) if repo_token else github.Github()
+    g, credentials_ignored = client_pool.github_for_read(repo_token)
+    read_token = None if credentials_ignored else repo_token
 
     try:
-        repo = g.get_repo(repo_name)
+        repo = conditional.get_repo(g, conditional_cache, read_token, repo_name)
     except github.UnknownObjectException as uoe:
         print("UnknownObjectException {1}: {0}".format(str(uoe), repo_name))
-        return jsonify({"error":uoe.message})
+        return {"error":uoe.message}
     except github.GithubException as ge:
-        if ge.status == 401 and repo_token:
+        if is_upstream_failure(ge):
+            raise
+        if ge.status == 401 and repo_token and not credentials_ignored:
             # bad credentials - fall back to anonymous access for public repos
             print("GithubException 401 for {0}, retrying anonymously".format(repo_name))
+            client_pool.reject_token("github", repo_token)
             credentials_ignored = True
-            g = github.Github()
+            read_token = None
+            g = client_pool.github()
             try:
-                repo = g.get_repo(repo_name)
+                repo = conditional.get_repo(g, conditional_cache, read_token, repo_name)
             except github.UnknownObjectException as uoe:
-                return jsonify({"error":uoe.message})
+                return {"error":uoe.message}
             except github.GithubException as ge2:
-                return jsonify({"error":ge2.data.get("message", str(ge2))})
+                if is_upstream_failure(ge2):
+                    raise
+                return {"error":ge2.data.get("message", str(ge2))}
         else:
             print("GithubException {1}: {0}".format(str(ge), repo_name))
-            return jsonify({"error":ge.data.get("message", str(ge))})
+            return {"error":ge.data.get("message", str(ge))}
 
     # get results
-    d = parse_github_folder(repo, repo_path, repo_branch)
+    d = parse_github_folder(g, read_token, repo, repo_path, repo_branch)
 
     # if unable to parse github folder, return the error
 
     if type(d) is not dict:
         print("Unable to parse github folder:" + str(d))
-        return jsonify({"error":str(d)})
+        return {"error":str(d)}
 
     # return correct result
-    return jsonify({"files": d, "credentialsIgnored": credentials_ignored})
+    return {"files": d, "credentialsIgnored": credentials_ignored}
 
 
 @app.route("/getGitLabFilesAll", methods=["POST"])
@@ -358,33 +979,133 @@ def get_git_lab_files_all():
         app.logger.error("KeyError in getGitLabFilesAll: %s", ke)
         return jsonify({"error":"Repository, Branch or Token not specified in request"}), 400
 
-    credentials_ignored = False
-    if repo_token:
-        gl = gitlab.Gitlab('https://gitlab.com', private_token=repo_token, api_version=4)
-        try:
-            gl.auth()
-        except gitlab.exceptions.GitlabAuthenticationError as gae:
-            # bad credentials - fall back to anonymous access for public repos
-            print("GitlabAuthenticationError {1}: {0}, retrying anonymously".format(str(gae), repo_name))
-            credentials_ignored = True
-            gl = gitlab.Gitlab('https://gitlab.com', api_version=4)
-        except gitlab.exceptions.GitlabError as ge:
-            print("GitlabError during auth {1}: {0}".format(str(ge), repo_name))
-            return jsonify({"error": "GitLab error during authentication: " + str(ge)})
-    else:
-        gl = gitlab.Gitlab('https://gitlab.com', api_version=4)
+    mirrored = list_mirrored_files("gitlab", repo_name, repo_branch, repo_path)
+    if mirrored is not None:
+        return jsonify(mirrored)
+
+    key = ("gitlab", repo_name, repo_branch, repo_path, hash_token(repo_token))
+    version = push_version("gitlab", repo_name, repo_branch, repo_path)
+    return jsonify(listing(key, "getGitLabFilesAll", "gitlab", GITLAB_HOST, repo_token, list_git_lab_files, repo_name, repo_branch, repo_token, repo_path, version=version))
+
+
+def list_git_lab_files(repo_name, repo_branch, repo_token, repo_path):
+    """
+    Helper method to list the files in a GitLab repository.
+
+    Returns the dict to be sent to the client.
+    """
+    # bad credentials fall back to anonymous access for public repos
+    try:
+        gl, credentials_ignored = client_pool.gitlab_for_read(repo_token)
+    except gitlab.exceptions.GitlabError as ge:
+        if is_upstream_failure(ge):
+            raise
+        print("GitlabError during auth {1}: {0}".format(str(ge), repo_name))
+        return {"error": "GitLab error during authentication: " + str(ge)}
 
     try:
         project = gl.projects.get(repo_name)
-        items = project.repository_tree(recursive='false', all=True, ref=repo_branch, path=repo_path)
+        items = project.repository_tree(recursive='false', get_all=True, ref=repo_branch, path=repo_path)
     except gitlab.exceptions.GitlabGetError as gge:
+        if is_upstream_failure(gge):
+            raise
         print("GitlabGetError {1}: {0}".format(str(gge), repo_name))
-        return jsonify({"error": "Unable to get repository. Repository or branch name may be incorrect, or repository may be empty." + "\n" + str(gge)})
+        return {"error": "Unable to get repository. Repository or branch name may be incorrect, or repository may be empty." + "\n" + str(gge)}
 
     d = parse_gitlab_folder(items, repo_path)
 
     # return correct result
-    return jsonify({"files": d, "credentialsIgnored": credentials_ignored})
+    return {"files": d, "credentialsIgnored": credentials_ignored}
+
+
+@app.route("/getGitHubTree", methods=["POST"])
+@host_limiter.limited(GITHUB_HOST)
+def get_git_hub_tree():
+    """
+    FLASK POST routing method for '/getGitHubTree'
+
+    Returns every file and folder in a GitHub repository branch, with type, size and blob SHA, in a single response. The POST request content is a JSON string containing repository, branch and token.
+    """
+    content = request.get_json(silent=True)
+
+    try:
+        repo_name = content["repository"]
+        repo_branch = content["branch"]
+        repo_token = content["token"]
+    except KeyError as ke:
+        app.logger.error("KeyError in getGitHubTree: %s", ke)
+        return jsonify({"error":"Repository, Branch or Token not specified in request"}), 400
+
+    check_rate_limit("github", repo_token, ratelimit.BACKGROUND)
+
+    # Extracting the true repo name and repo folder.
+    folder_name, repo_name = extract_folder_and_repo_names(repo_name)
+
+    # authenticate or not
+    g, credentials_ignored = client_pool.github_for_read(repo_token)
+
+    try:
+        try:
+            repo = conditional.get_repo(g, conditional_cache, None if credentials_ignored else repo_token, repo_name)
+        except github.GithubException as ge:
+            if ge.status != 401 or not repo_token or credentials_ignored:
+                raise
+            # bad credentials - fall back to anonymous access for public repos
+            print("GithubException 401 for {0}, retrying anonymously".format(repo_name))
+            client_pool.reject_token("github", repo_token)
+            credentials_ignored = True
+            g = client_pool.github()
+            repo = conditional.get_repo(g, conditional_cache, None, repo_name)
+
+        tree = trees.github_tree(repo, repo_branch, tree_cache, pushed_head("github", repo_name, repo_branch))
+    except github.GithubException as ge:
+        host_limiter.report(ge)
+        print("GithubException {1}: {0}".format(str(ge), repo_name))
+        message = ge.data.get("message", str(ge)) if isinstance(ge.data, dict) else str(ge)
+        return jsonify({"error": message})
+
+    tree = trees.filter_tree(tree, folder_name)
+
+    return jsonify({"files": tree["entries"], "sha": tree["sha"], "truncated": tree["truncated"], "credentialsIgnored": credentials_ignored})
+
+
+@app.route("/getGitLabTree", methods=["POST"])
+@host_limiter.limited(GITLAB_HOST)
+def get_git_lab_tree():
+    """
+    FLASK POST routing method for '/getGitLabTree'
+
+    Returns every file and folder in a GitLab repository branch, with type and blob SHA, in a single response. The POST request content is a JSON string containing repository, branch and token.
+    """
+    content = request.get_json(silent=True)
+
+    try:
+        repo_name = content["repository"]
+        repo_branch = content["branch"]
+        repo_token = content["token"]
+    except KeyError as ke:
+        app.logger.error("KeyError in getGitLabTree: %s", ke)
+        return jsonify({"error":"Repository, Branch or Token not specified in request"}), 400
+
+    check_rate_limit("gitlab", repo_token, ratelimit.BACKGROUND)
+
+    # bad credentials fall back to anonymous access for public repos
+    try:
+        gl, credentials_ignored = client_pool.gitlab_for_read(repo_token)
+    except gitlab.exceptions.GitlabError as ge:
+        host_limiter.report(ge)
+        print("GitlabError during auth {1}: {0}".format(str(ge), repo_name))
+        return jsonify({"error": "GitLab error during authentication: " + str(ge)})
+
+    try:
+        project = gl.projects.get(repo_name, lazy=True)
+        tree = trees.gitlab_tree(project, repo_branch, tree_cache)
+    except gitlab.exceptions.GitlabError as ge:
+        host_limiter.report(ge)
+        print("GitlabError {1}: {0}".format(str(ge), repo_name))
+        return jsonify({"error": "Unable to get repository. Repository or branch name may be incorrect, or repository may be empty." + "\n" + str(ge)})
+
+    return jsonify({"files": tree["entries"], "sha": tree["sha"], "truncated": tree["truncated"], "credentialsIgnored": credentials_ignored})
 
 
 @app.route("/getDockerImages", methods=["POST"])
@@ -402,10 +1123,8 @@ def get_docker_images():
         app.logger.error("KeyError in getDockerImages: %s", ke)
         return jsonify({"error":"Username not specified in request"}), 400
 
-    docker_url = "https://hub.docker.com/v2/repositories/" + user_name + "/"
-
     try:
-        data = fetch_json_url(docker_url, label="Docker Hub")
+        data = docker_hub.images(user_name)
     except RemoteFetchError as e:
         return jsonify({"error": e.message}), e.status
 
@@ -427,10 +1146,8 @@ def get_docker_image_tags():
         app.logger.error("KeyError in getDockerImageTags: %s", ke)
         return jsonify({"error":"Imagename not specified in request"}), 400
 
-    docker_url = "https://registry.hub.docker.com/v2/repositories/" + image_name + "/tags"
-
     try:
-        data = fetch_json_url(docker_url, label="Docker Hub")
+        data = docker_hub.tags(image_name)
     except RemoteFetchError as e:
         return jsonify({"error": e.message}), e.status
 
@@ -482,18 +1199,20 @@ def create_branch():
 
     try:
         if service.lower() == "github":
-            g = github.Github(token) if token else github.Github()
-            repo = g.get_repo(repo_name)
-            # Get the source branch reference
-            source_ref = repo.get_git_ref(f"heads/{source_branch}")
-            # Create the new branch reference
-            repo.create_git_ref(ref=f"refs/heads/{new_branch}", sha=source_ref.object.sha)
+            with host_limiter.limit(GITHUB_HOST):
+                g = client_pool.github(token)
+                repo = g.get_repo(repo_name)
+                # Get the source branch reference
+                source_ref = repo.get_git_ref(f"heads/{source_branch}")
+                # Create the new branch reference
+                repo.create_git_ref(ref=f"refs/heads/{new_branch}", sha=source_ref.object.sha)
             return jsonify({"success": True, "service": "github", "repository": repo_name, "newBranch": new_branch})
         elif service.lower() == "gitlab":
-            gl = gitlab.Gitlab('https://gitlab.com', private_token=token, api_version=4) if token else gitlab.Gitlab('https://gitlab.com', api_version=4)
-            project = gl.projects.get(repo_name)
-            # Create the new branch
-            branch = project.branches.create({'branch': new_branch, 'ref': source_branch})
+            with host_limiter.limit(GITLAB_HOST):
+                gl = client_pool.gitlab(token)
+                project = gl.projects.get(repo_name)
+                # Create the new branch
+                branch = project.branches.create({'branch': new_branch, 'ref': source_branch})
             return jsonify({"success": True, "service": "gitlab", "repository": repo_name, "newBranch": new_branch})
         else:
             return jsonify({"error": f"Unknown service: {service}"})
@@ -528,15 +1247,19 @@ def delete_branch():
 
     try:
         if service.lower() == "github":
-            g = github.Github(token) if token else github.Github()
-            repo = g.get_repo(repo_name)
-            branch_ref = repo.get_git_ref(f"heads/{branch_to_delete}")
-            branch_ref.delete()
+            with host_limiter.limit(GITHUB_HOST):
+                g = client_pool.github(token)
+                repo = g.get_repo(repo_name)
+                branch_ref = repo.get_git_ref(f"heads/{branch_to_delete}")
+                branch_ref.delete()
+            invalidate_mirror("github", repo_name)
             return jsonify({"success": True, "service": "github", "repository": repo_name, "deletedBranch": branch_to_delete})
         elif service.lower() == "gitlab":
-            gl = gitlab.Gitlab('https://gitlab.com', private_token=token, api_version=4) if token else gitlab.Gitlab('https://gitlab.com', api_version=4)
-            project = gl.projects.get(repo_name)
-            project.branches.delete(branch_to_delete)
+            with host_limiter.limit(GITLAB_HOST):
+                gl = client_pool.gitlab(token)
+                project = gl.projects.get(repo_name)
+                project.branches.delete(branch_to_delete)
+            invalidate_mirror("gitlab", repo_name)
             return jsonify({"success": True, "service": "gitlab", "repository": repo_name, "deletedBranch": branch_to_delete})
         else:
             return jsonify({"error": f"Unknown service: {service}"})
@@ -549,6 +1272,7 @@ def delete_branch():
     
     
 @app.route("/saveFileToRemoteGithub", methods=["POST"])
+@host_limiter.limited(GITHUB_HOST)
 def save_git_hub_file():
     """
     FLASK POST routing method for '/saveFileToRemoteGithub'
@@ -569,7 +1293,8 @@ def save_git_hub_file():
     if folder_name != "":
         filename = folder_name + "/" + filename
 
-    g = github.Github(repo_token)
+    check_rate_limit("github", repo_token, ratelimit.INTERACTIVE)
+    g = client_pool.github(repo_token)
 
     # get repo
     try:
@@ -592,14 +1317,24 @@ def save_git_hub_file():
         return github_exception_handler(e, "Error in set_metadata_for_ingress", repo_name, repo_branch)
 
     # The 'indent=4' option is used for nice formatting. Without it the file is stored as a single line.
-    json_data = json.dumps(graph, indent=4)
+    json_data = codec.dumps_indented(graph)
 
-    # Commit to GitHub repo.
-    latest_commit = repo.get_git_commit(branch_sha)
-    base_tree = latest_commit.tree
+    # compare with the file already on the branch, and skip the commit if it is unchanged
     try:
-        new_tree = repo.create_git_tree(
-            [
+        unchanged = trees.github_unchanged_paths(repo, branch_sha, {filename: json_data}, folder_tree_cache)
+        tree_sha = trees.github_root_tree_sha(repo, branch_sha, folder_tree_cache)
+    except github.GithubException as e:
+        return github_exception_handler(e, "Error in get_git_tree", repo_name, repo_branch)
+
+    if unchanged:
+        app.logger.info("File %s is unchanged in %s/%s, not committing", filename, repo_name, repo_branch)
+        return jsonify({"success": True, "unchanged": True})
+
+    # Commit to GitHub repo.
+    latest_commit, base_tree = get_git_hub_commit_base(g, branch_sha, tree_sha)
+    try:
+        new_tree = repo.create_git_tree(
+            [
                 github.InputGitTreeElement(
                     path=filename, mode="100644", type="blob", content=json_data
                 )
@@ -618,10 +1353,12 @@ def save_git_hub_file():
     except github.GithubException as e:
         return github_exception_handler(e, "Error in edit", repo_name, repo_branch)
 
+    invalidate_mirror("github", repo_name)
     return jsonify({"success": True})
 
 
 @app.route("/saveFilesToRemoteGithub", methods=["POST"])
+@host_limiter.limited(GITHUB_HOST)
 def save_git_hub_files():
     """
     FLASK POST routing method for '/saveFilesToRemoteGithub'
@@ -636,7 +1373,8 @@ def save_git_hub_files():
     files = content["files"]  # contains "path" and "jsonData" for each file. The path should include the filename.
     commit_message = content["commitMessage"]
 
-    g = github.Github(repo_token)
+    check_rate_limit("github", repo_token, ratelimit.INTERACTIVE)
+    g = client_pool.github(repo_token)
 
     # get repo
     try:
@@ -654,16 +1392,14 @@ def save_git_hub_files():
     # get SHA from branch
     branch_sha = branch_ref.object.sha
 
-    # build a list of InputGitTreeElement objects to create the new commit
-    tree_elements = []
-
-    # add the files
+    # serialise the files
+    contents = {}
     for file in files:
         path = file["path"]
 
         # parse the json string
         try:
-            graphObject = json.loads(file["jsonData"])
+            graphObject = codec.loads(file["jsonData"])
         except json.JSONDecodeError as e:
             return github_exception_handler(e, "Error in json.loads for file " + path, repo_name, repo_branch)
 
@@ -674,16 +1410,38 @@ def save_git_hub_files():
             return github_exception_handler(e, "Error in set_metadata_for_ingress for file " + path, repo_name, repo_branch)
 
         # The 'indent=4' option is used for nice formatting. Without it the file is stored as a single line.
-        json_data = json.dumps(graphObject, indent=4)
+        contents[path] = codec.dumps_indented(graphObject)
 
-        tree_element = github.InputGitTreeElement(
-            path=path, mode="100644", type="blob", content=json_data
-        )
-        tree_elements.append(tree_element)
+    # compare with the files already on the branch, and leave out the ones that are unchanged
+    try:
+        unchanged = trees.github_unchanged_paths(repo, branch_sha, contents, folder_tree_cache)
+        tree_sha = trees.github_root_tree_sha(repo, branch_sha, folder_tree_cache)
+    except github.GithubException as e:
+        return github_exception_handler(e, "Error in get_git_tree", repo_name, repo_branch)
+
+    if len(unchanged) == len(contents):
+        app.logger.info("All %d files are unchanged in %s/%s, not committing", len(contents), repo_name, repo_branch)
+        return "ok"
+
+    changed = {path: json_data for path, json_data in contents.items() if path not in unchanged}
+
+    # large files are uploaded as separate blobs, in parallel, rather than inline in one huge request
+    blob_paths = choose_blob_paths(changed)
+    try:
+        blob_shas = create_git_hub_blobs(repo, {path: changed[path] for path in blob_paths}, repo_name)
+    except github.GithubException as e:
+        return github_exception_handler(e, "Error in create_git_blob", repo_name, repo_branch)
+
+    # build a list of InputGitTreeElement objects to create the new commit
+    tree_elements = [
+        github.InputGitTreeElement(path=path, mode="100644", type="blob", sha=blob_shas[path])
+        if path in blob_shas else
+        github.InputGitTreeElement(path=path, mode="100644", type="blob", content=json_data)
+        for path, json_data in changed.items()
+    ]
 
     # Commit to GitHub repo.
-    latest_commit = repo.get_git_commit(branch_sha)
-    base_tree = latest_commit.tree
+    latest_commit, base_tree = get_git_hub_commit_base(g, branch_sha, tree_sha)
     try:
         new_tree = repo.create_git_tree(
             tree_elements,
@@ -697,12 +1455,66 @@ def save_git_hub_files():
         message=commit_message, parents=[latest_commit], tree=new_tree
     )
     branch_ref.edit(sha=new_commit.sha, force=False)
+    invalidate_mirror("github", repo_name)
 
     return "ok"
 
 
+def choose_blob_paths(contents):
+    """
+    Helper method to choose which files of a commit to upload as separate blobs.
+
+    Files of at least SAVE_BLOB_MIN_BYTES are uploaded as blobs, and then the largest of the
+    remaining files, until the content sent inline with the new tree is at most SAVE_INLINE_MAX_BYTES.
+    """
+    blob_paths = {path for path, content in contents.items() if len(content) >= config.config.SAVE_BLOB_MIN_BYTES}
+    inline = sorted((path for path in contents if path not in blob_paths), key=lambda path: len(contents[path]))
+    inline_bytes = sum(len(contents[path]) for path in inline)
+
+    while inline and inline_bytes > config.config.SAVE_INLINE_MAX_BYTES:
+        path = inline.pop()
+        blob_paths.add(path)
+        inline_bytes -= len(contents[path])
+
+    return blob_paths
+
+
+def create_git_hub_blobs(repo, contents, repo_name):
+    """
+    Helper method to create blobs in a GitHub repository, SAVE_BLOB_MAX_PARALLEL at a time.
+
+    'contents' is a dict of path to file content. Returns a dict of path to blob SHA.
+    Raises GithubException if any blob can not be created.
+    """
+    blob_shas = {}
+    if not contents:
+        return blob_shas
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.config.SAVE_BLOB_MAX_PARALLEL) as executor:
+        create_git_blob = tracing.bind(repo.create_git_blob)
+        futures = {executor.submit(create_git_blob, content, "utf-8"): path for path, content in contents.items()}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            path = futures[future]
+            blob_shas[path] = future.result().sha
+            app.logger.info("Created blob %d/%d for %s in %s", done, len(futures), path, repo_name)
+
+    return blob_shas
+
+
+def get_git_hub_commit_base(g, branch_sha, tree_sha):
+    """
+    Helper method to get the latest commit on a branch and its tree, to build a new commit on top of them.
+
+    Only their SHAs are needed, and these are already known, so neither is fetched.
+    """
+    latest_commit = g.create_from_raw_data(github.GitCommit.GitCommit, {"sha": branch_sha})
+    base_tree = g.create_from_raw_data(github.GitTree.GitTree, {"sha": tree_sha})
+    return latest_commit, base_tree
+
+
 # helper function to handle github exceptions consistently
 def github_exception_handler(e, description, repo_name, repo_branch):
+    host_limiter.report(e)
     data = getattr(e, "data", None)
     status = getattr(e, "status", None)
     message = data.get("message") if isinstance(data, dict) else None
@@ -715,6 +1527,7 @@ def github_exception_handler(e, description, repo_name, repo_branch):
 
 
 @app.route("/saveFileToRemoteGitlab", methods=["POST"])
+@host_limiter.limited(GITLAB_HOST)
 def save_git_lab_file():
     """
     FLASK POST routing method for '/saveFileToRemoteGitLab'
@@ -735,46 +1548,129 @@ def save_git_lab_file():
     if folder_name != "":
         filename = folder_name + "/" + filename
 
+    check_rate_limit("gitlab", repo_token, ratelimit.INTERACTIVE)
+
     # get the data from gitlab
-    gl = gitlab.Gitlab('https://gitlab.com', private_token=repo_token, api_version=4)
-    gl.auth()
-    project = gl.projects.get(repo_name)
+    try:
+        authenticated = client_pool.gitlab_auth(repo_token)
+    except gitlab.exceptions.GitlabError as ge:
+        host_limiter.report(ge)
+        return jsonify({"error": "GitLab error during authentication: " + str(ge)}), 400
+    if not authenticated:
+        return jsonify({"error": "GitLab access token is invalid"}), 401
+
+    # a lazy project object is enough to commit, and saves a request
+    gl = client_pool.gitlab(repo_token)
+    project = gl.projects.get(repo_name, lazy=True)
 
     # Add repo and file name in the graph.
     set_metadata_for_ingress(graph, "GitLab", repo_name, repo_branch, filename)
 
     # The 'indent=4' option is used for nice formatting. Without it the file is stored as a single line.
-    json_data = json.dumps(graph, indent=4)
+    json_data = codec.dumps_indented(graph)
 
-    # check if file exists, if it exists, then the 'get' and 'save' approach will be sufficient
-    # if the file is new, then a GitlabGetError exception will be raised, and we try to create instead
-    getSuccessful = True
     try:
-        f = project.files.get(file_path=filename, ref=repo_branch)
-        # update content
-        f.content = json_data
-        f.save(branch=repo_branch, commit_message=commit_message)
-    except gitlab.GitlabHttpError as ghe:
-        return jsonify({"error": str(ghe)}), 400
-    except gitlab.GitlabGetError as gge:
-        print("GitlabGetError {1}: {0}".format(str(gge), repo_name))
-        getSuccessful = False
+        committed = commit_git_lab_files(project, repo_branch, {filename: json_data}, commit_message)
+    except gitlab.exceptions.GitlabError as ge:
+        host_limiter.report(ge)
+        print("GitlabError {1}: {0}".format(str(ge), repo_name))
+        return jsonify({"error": str(ge)}), 400
+
+    if not committed:
+        return jsonify({"success": True, "unchanged": True})
+    invalidate_mirror("gitlab", repo_name)
+    return jsonify({"success": True})
+
+
+@app.route("/saveFilesToRemoteGitlab", methods=["POST"])
+@host_limiter.limited(GITLAB_HOST)
+def save_git_lab_files():
+    """
+    FLASK POST routing method for '/saveFilesToRemoteGitlab'
 
-    # if the 'get' approach above was unsuccessful, then we try to create the file
-    # if the 'create' approach fails, then send errors to the client
-    if not getSuccessful:
+    Save file(s) to a GitLab repository in a single commit. The POST request content is a JSON string containing the repository name, branch, access token, and commit message. Plus a JSON array containing each files name and data in JSON format.
+    """
+    # Extract parameters and file content from json.
+    content = request.get_json(silent=True)
+    repo_name = content["repositoryName"]
+    repo_branch = content["repositoryBranch"]
+    repo_token = content["token"]
+    files = content["files"]  # contains "path" and "jsonData" for each file. The path should include the filename.
+    commit_message = content["commitMessage"]
+
+    check_rate_limit("gitlab", repo_token, ratelimit.INTERACTIVE)
+    try:
+        authenticated = client_pool.gitlab_auth(repo_token)
+    except gitlab.exceptions.GitlabError as ge:
+        host_limiter.report(ge)
+        return jsonify({"error": "GitLab error during authentication: " + str(ge)}), 400
+    if not authenticated:
+        return jsonify({"error": "GitLab access token is invalid"}), 401
+
+    # a lazy project object is enough to commit, and saves a request
+    gl = client_pool.gitlab(repo_token)
+    project = gl.projects.get(repo_name, lazy=True)
+
+    # serialise the files
+    contents = {}
+    for file in files:
+        path = file["path"]
+
+        # parse the json string
         try:
-            f = project.files.create({'file_path': filename,
-                              'branch': repo_branch,
-                              'content': json_data,
-                              'commit_message': commit_message})
-        except gitlab.GitlabHttpError as ghe:
-            return jsonify({"error": str(ghe)}), 400
-        except gitlab.GitlabCreateError as gce:
-            return jsonify({"error": str(gce)}), 400
+            graphObject = codec.loads(file["jsonData"])
+        except json.JSONDecodeError as e:
+            return jsonify({"error": "Error in json.loads for file " + path + ": " + str(e)}), 400
 
+        # set standard metadata for the file
+        try:
+            set_metadata_for_ingress(graphObject, "GitLab", repo_name, repo_branch, path)
+        except Exception as e:
+            return jsonify({"error": "Error in set_metadata_for_ingress for file " + path + ": " + str(e)}), 400
+
+        # The 'indent=4' option is used for nice formatting. Without it the file is stored as a single line.
+        contents[path] = codec.dumps_indented(graphObject)
+
+    try:
+        committed = commit_git_lab_files(project, repo_branch, contents, commit_message)
+    except gitlab.exceptions.GitlabError as ge:
+        host_limiter.report(ge)
+        print("GitlabError {1}: {0}".format(str(ge), repo_name))
+        return jsonify({"error": str(ge)}), 400
+
+    if not committed:
+        return jsonify({"success": True, "unchanged": True})
+    invalidate_mirror("gitlab", repo_name)
+    return "ok"
 
-    return jsonify({"success": True})
+
+def commit_git_lab_files(project, branch, contents, commit_message):
+    """
+    Helper method to commit files to a GitLab branch, in a single commit using the commits API.
+
+    'contents' is a dict of path to file content. Whether each file is created or updated is
+    decided from the listings of the folders containing the files, files that are unchanged are
+    left out, and if no files have changed, no commit is made.
+
+    Returns True if a commit was made. Raises GitlabError if the branch can not be read or the commit fails.
+    """
+    existing = trees.gitlab_blob_shas(project, branch, contents)
+    unchanged = {path for path, content in contents.items() if existing.get(path) == trees.git_blob_sha(content)}
+
+    actions = [
+        {"action": "update" if path in existing else "create", "file_path": path, "content": content}
+        for path, content in contents.items() if path not in unchanged
+    ]
+    if not actions:
+        app.logger.info("All %d files are unchanged in %s/%s, not committing", len(contents), project.id, branch)
+        return False
+
+    project.commits.create({
+        "branch": branch,
+        "commit_message": commit_message,
+        "actions": actions,
+    })
+    return True
 
 
 def set_metadata_for_ingress(graph, repo_service, repo_name, repo_branch, filename):
@@ -820,95 +1716,186 @@ def set_metadata_for_egress(graph, repo_service, repo_name, repo_branch, commit_
                 graphLocation["lastModifiedDatetime"] = last_modified_datetime
 
 
+def compact_json_response(data, status=200):
+    """
+    Helper method to build a JSON response without any whitespace.
+    """
+    return app.response_class(response=codec.dumps_bytes(data), status=status, mimetype="application/json")
+
+
+def format_file_result(result, status, response_format):
+    """
+    Helper method to convert the result of reading a file into the given response format.
+    """
+    if status == 200 and response_format == 1 and not isinstance(result["data"], str):
+        return dict(result, data=codec.dumps_indented(result["data"]))
+    return result
+
+
+def file_response(result, status, response_format):
+    """
+    Helper method to build the response to a request to open a file.
+
+    Format 1 (the default) returns the content of graphs and palettes as an indented JSON string
+    inside the JSON response. Format 2 returns them as a JSON object, with no whitespace, so
+    that they are neither escaped twice nor padded with indentation.
+    """
+    if response_format not in FILE_RESPONSE_FORMATS:
+        return jsonify({"error": "Unknown response format: {0}".format(response_format)}), 400
+    if response_format == 1:
+        return jsonify(format_file_result(result, status, response_format)), status
+    return compact_json_response(result, status)
+
+
 @app.route("/openRemoteGithubFile", methods=["POST"])
 def open_git_hub_file():
     """
     FLASK POST routing method for '/openRemoteGithubFile'
 
-    Reads a file from a GitHub repository. The POST request content is a JSON string containing the file name, repository name, branch, access token.
+    Reads a file from a GitHub repository. The POST request content is a JSON string containing the file name, repository name, branch, access token, and optionally the response 'format' (see file_response()).
     """
     content = request.get_json(silent=True)
-    repo_name = content["repositoryName"]
-    repo_branch = content["repositoryBranch"]
-    repo_token = content["token"]
-    filename = content["filename"]
-    extension = os.path.splitext(filename)[1]
+    result, status = read_git_hub_file(content["repositoryName"], content["repositoryBranch"], content["token"], content["filename"])
+    return file_response(result, status, content.get("format", 1))
+
+
+def get_git_hub_repo_for_read(repo_name, repo_token, repos=None):
+    """
+    Helper method to get a GitHub repository for reading, falling back to anonymous access if the token is rejected.
+
+    If a dict is given as 'repos', repository objects are reused from, and added to, it.
+
+    Returns a (repo, credentials_ignored) tuple. Raises GithubException if the repository can not be read.
+    """
+    key = (repo_name, repo_token)
+    if repos is not None and key in repos:
+        return repos[key]
+
+    # use authentication or not
+    g, credentials_ignored = client_pool.github_for_read(repo_token)
+
+    try:
+        repo = conditional.get_repo(g, conditional_cache, None if credentials_ignored else repo_token, repo_name)
+    except github.GithubException as ge:
+        if ge.status != 401 or not repo_token or credentials_ignored:
+            raise
+        # bad credentials - fall back to anonymous access for public repos
+        print("GithubException 401 for {0}, retrying anonymously".format(repo_name))
+        client_pool.reject_token("github", repo_token)
+        credentials_ignored = True
+        g = client_pool.github()
+        repo = conditional.get_repo(g, conditional_cache, None, repo_name)
+
+    if repos is not None:
+        repos[key] = (repo, credentials_ignored)
+    return repo, credentials_ignored
+
+
+def read_git_hub_file(repo_name, repo_branch, repo_token, filename, repos=None):
+    """
+    Helper method to read a file from a GitHub repository.
+
+    Concurrent reads of the same file with the same token share one upstream fetch.
+    If GitHub fails, the last good copy is returned instead (see with_stale_copy()).
+
+    Returns a (result, status) tuple, where result is the dict to be sent to the client.
+    """
+    mirrored = read_mirrored_file("github", repo_name, repo_branch, filename)
+    if mirrored is not None:
+        return mirrored
+
+    key = ("github", repo_name, repo_branch, filename, hash_token(repo_token))
 
-    #print("open_git_hub_file()", "repo_name", repo_name, "repo_branch", repo_branch, "repo_token", repo_token, "filename", filename, "extension:" + extension + ":")
+    def read():
+        check_rate_limit("github", repo_token, ratelimit.INTERACTIVE)
+        return coalesced(key, GITHUB_HOST, fetch_git_hub_file, repo_name, repo_branch, repo_token, filename, repos)
+    return with_stale_copy(key, "openRemoteGithubFile", read)
+
+
+def fetch_git_hub_file(repo_name, repo_branch, repo_token, filename, repos=None):
+    extension = os.path.splitext(filename)[1]
 
     # Extracting the true repo name and repo folder.
     folder_name, repo_name = extract_folder_and_repo_names(repo_name)
     if folder_name != "":
         filename = folder_name + "/" + filename
 
-    # use authentication or not
-    credentials_ignored = False
-    g = github.Github(repo_token) if repo_token else github.Github()
-
     try:
-        repo = g.get_repo(repo_name)
-    except github.GithubException as ge:
-        if ge.status == 401 and repo_token:
-            # bad credentials - fall back to anonymous access for public repos
-            print("GithubException 401 for {0}, retrying anonymously".format(repo_name))
-            credentials_ignored = True
-            g = github.Github()
-            try:
-                repo = g.get_repo(repo_name)
-            except Exception as e:
-                return jsonify({"error": str(e)}), 404
-        else:
-            return jsonify({"error": ge.data.get("message", str(ge))}), 404
+        with tracing.span("repo"):
+            repo, credentials_ignored = get_git_hub_repo_for_read(repo_name, repo_token, repos)
     except Exception as e:
-        return jsonify({"error": str(e)}), 404
+        if is_upstream_failure(e):
+            raise
+        if isinstance(e, github.GithubException):
+            message = e.data.get("message", str(e)) if isinstance(e.data, dict) else str(e)
+            return {"error": message}, 404
+        return {"error": str(e)}, 404
 
 
     # get commits
-    commits = repo.get_commits(sha=repo_branch, path=filename)
-    most_recent_commit = commits[0]
-
-    # get the file from this commit
-    try:
-        f = repo.get_contents(filename, ref=most_recent_commit.sha)
-        download_url = f.download_url
-        raw_data = f.decoded_content
-    except github.GithubException as e:
-        # first get the branch reference
-        ref = repo.get_git_ref(f'heads/{repo_branch}')
-        # then get the tree
-        tree = repo.get_git_tree(ref.object.sha, recursive='/' in filename).tree
-        # look for path in tree
-        sha = [x.sha for x in tree if x.path == filename]
-        if not sha:
-            # well, not found..
-            return jsonify({"error": "File not found"}), 404
-
-        # use the sha to get the blob, then decode it
-        blob = repo.get_git_blob(sha[0])
-        b64 = base64.b64decode(blob.content)
-        raw_data = b64.decode("utf8")
-
-        # manually build the download url
-        download_url = "https://raw.githubusercontent.com/" + repo_name + "/" + most_recent_commit.sha + "/" + filename
-    except AssertionError as e:
-        # download via http get
-        raw_data = urllib.request.urlopen(download_url, context=ssl.create_default_context(cafile=certifi.where()), timeout=URL_OPEN_TIMEOUT).read()
+    with tracing.span("commits"):
+        most_recent_commit = get_git_hub_file_commit(repo, repo_name, repo_branch, None if credentials_ignored else repo_token, filename)
+
+    # the content of a file at a given commit never changes, so check the cache first
+    with tracing.span("blobCache") as span:
+        cached = get_blob_cache().get(repo_name, most_recent_commit["sha"], filename)
+        span.set(hit=cached is not None)
+    if cached is not None:
+        raw_data, cached_metadata = cached
+        download_url = cached_metadata["downloadUrl"]
+    else:
+        # get the file from this commit
+        try:
+            with tracing.span("contents"):
+                f = repo.get_contents(filename, ref=most_recent_commit["sha"])
+            if isinstance(f, list):
+                return {"error": "File not found"}, 404
+            download_url = f.download_url
+            blob = {"sha": f.sha, "size": f.size}
+            # files over 1 MB are described without their content
+            raw_data = f.decoded_content if f.encoding != "none" else None
+        except github.GithubException as e:
+            if e.status == 404:
+                return {"error": "File not found"}, 404
+            if is_upstream_failure(e) and not is_too_large(e):
+                raise
+
+            # GitHub does not describe files over 100 MB, so find the file in the folders on its path
+            with tracing.span("folderTrees"):
+                blob = trees.github_blob(repo, most_recent_commit["sha"], filename, folder_tree_cache)
+            if blob is None:
+                return {"error": "File not found"}, 404
+            raw_data = None
+
+            # manually build the download url
+            download_url = "https://raw.githubusercontent.com/" + repo_name + "/" + most_recent_commit["sha"] + "/" + filename
+
+        if raw_data is None:
+            if blob["size"] <= config.config.LARGE_FILE_MAX_BYTES:
+                raw_data = download_git_hub_blob(repo_name, None if credentials_ignored else repo_token, blob["sha"], config.config.LARGE_FILE_MAX_BYTES)
+            if raw_data is None:
+                return {"error": "File is too large to open ({0:.1f} MB, the limit is {1:.1f} MB)".format(
+                    blob["size"] / (1024 * 1024), config.config.LARGE_FILE_MAX_BYTES / (1024 * 1024))}, 413
+
+        # the cache is shared between users, so don't keep any access token embedded in the download url
+        raw_bytes = raw_data if isinstance(raw_data, (bytes, bytearray)) else raw_data.encode("utf-8")
+        get_blob_cache().put(repo_name, most_recent_commit["sha"], filename, raw_bytes, {"downloadUrl": download_url.split("?", 1)[0] if download_url else download_url})
 
     if extension != ".md":
         # parse JSON
         try:
-            graph = json.loads(raw_data)
+            graph = codec.loads(raw_data)
         except json.decoder.JSONDecodeError as e:
-            return app.response_class(response=json.dumps({"error": "File contains invalid JSON: " + str(e)}), status=400, mimetype="application/json")
+            return {"error": "File contains invalid JSON: " + str(e)}, 400
 
         if isinstance(graph, list):
-            return jsonify({"error": "File JSON data is a list, this file could be a Physical Graph instead of a Logical Graph."}), 404
+            return {"error": "File JSON data is a list, this file could be a Physical Graph instead of a Logical Graph."}, 404
 
         if not "modelData" in graph:
             graph["modelData"] = {}
 
         # add the repository information
-        set_metadata_for_egress(graph, "GitHub", repo_name, repo_branch, most_recent_commit.sha, most_recent_commit.commit.committer.name, most_recent_commit.commit.committer.email, most_recent_commit.commit.committer.date.timestamp(), filename, download_url)
+        set_metadata_for_egress(graph, "GitHub", repo_name, repo_branch, most_recent_commit["sha"], most_recent_commit["name"], most_recent_commit["email"], most_recent_commit["timestamp"], filename, download_url)
 
         # for palettes, put downloadUrl in every component
         if extension == ".palette":
@@ -916,15 +1903,80 @@ def open_git_hub_file():
                 for component in graph["nodeDataArray"]:
                     component["paletteDownloadUrl"] = download_url
 
-        json_data = json.dumps(graph, indent=4)
-
-        return jsonify({"data": json_data, "credentialsIgnored": credentials_ignored})
+        return {"data": graph, "credentialsIgnored": credentials_ignored}, 200
     else:
         raw_str = raw_data if isinstance(raw_data, str) else raw_data.decode("utf-8")
-        return jsonify({"data": raw_str, "credentialsIgnored": credentials_ignored})
+        return {"data": raw_str, "credentialsIgnored": credentials_ignored}, 200
+
+
+def is_too_large(e):
+    """
+    Return True if GitHub refused to describe a file because it is too large.
+    """
+    errors = e.data.get("errors", []) if isinstance(e.data, dict) else []
+    return any(isinstance(error, dict) and error.get("code") == "too_large" for error in errors)
+
+
+def download_git_hub_blob(repo_name, repo_token, sha, max_bytes):
+    """
+    Helper method to download the content of a file from GitHub, given its blob SHA.
+
+    The content is streamed unencoded (rather than base64 encoded inside JSON), and the download is abandoned
+    if it is larger than 'max_bytes'. Returns the content as a bytearray, or None if it is too large.
+
+    Raises GithubException if GitHub does not return the file.
+    """
+    url = config.config.GITHUB_BASE_URL.rstrip("/") + "/repos/" + repo_name + "/git/blobs/" + sha
+    session = client_pool.github_session(repo_token)
+    with tracing.span("download") as span, session.get(url, headers={"Accept": "application/vnd.github.raw"}, stream=True, timeout=URL_OPEN_TIMEOUT) as response:
+        if response.status_code != 200:
+            try:
+                data = response.json()
+            except ValueError:
+                data = {"message": response.reason}
+            raise github.GithubException(response.status_code, data, dict(response.headers))
+
+        length = int(response.headers.get("Content-Length") or 0)
+        if length > max_bytes:
+            return None
+        content = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            content += chunk
+            if len(content) > max_bytes:
+                return None
+        span.set(bytes=len(content))
+    return content
+
+
+def get_git_hub_file_commit(repo, repo_name, repo_branch, repo_token, filename):
+    """
+    Helper method to find the last commit that changed a file on a branch.
+
+    Returns a dict with the commit 'sha' and the committer's 'name', 'email' and 'timestamp'. For repositories
+    that send push notifications, the answer is reused until a push changes the file.
+    """
+    version = push_version("github", repo_name, repo_branch, filename)
+    if version is not None:
+        key = (repo_name.lower(), repo_branch, filename, hash_token(repo_token), version)
+        cached = file_commit_cache.get(key)
+        if cached is not None:
+            return cached
+
+    commit = repo.get_commits(sha=repo_branch, path=filename)[0]
+    result = {
+        "sha": commit.sha,
+        "name": commit.commit.committer.name,
+        "email": commit.commit.committer.email,
+        "timestamp": commit.commit.committer.date.timestamp(),
+    }
+
+    if version is not None:
+        file_commit_cache.put(key, result, ttl=config.config.WEBHOOK_CACHE_TTL)
+    return result
 
 
 @app.route("/deleteRemoteGithubFile", methods=["POST"])
+@host_limiter.limited(GITHUB_HOST)
 def delete_git_hub_file():
     """
     FLASK POST routing method for '/deleteRemoteGithubFile'
@@ -941,11 +1993,12 @@ def delete_git_hub_file():
 
     #print("delete_git_hub_file()", "repo_name", repo_name, "repo_service", repo_service, "repo_branch", repo_branch, "repo_token", repo_token, "filename", filename, "extension:" + extension + ":")
 
-    g = github.Github(repo_token)
+    g = client_pool.github(repo_token)
 
     try:
         repo = g.get_repo(repo_name)
     except Exception as e:
+        host_limiter.report(e)
         app.logger.exception("GitHub get_repo failed for %s", repo_name)
         return jsonify({"error": str(e)}), 404
 
@@ -958,8 +2011,10 @@ def delete_git_hub_file():
         f = repo.get_contents(filename, ref=most_recent_commit.sha)
         repo.delete_file(f.path, "File removed by EAGLE", f.sha, branch=repo_branch)
     except github.GithubException as e:
+        host_limiter.report(e)
         return jsonify({"error": str(e)}), 404
 
+    invalidate_mirror("github", repo_name)
     return jsonify({"success": True})
 
 
@@ -968,49 +2023,69 @@ def open_git_lab_file():
     """
     FLASK POST routing method for '/openRemoteGitlabFile'
 
-    Reads a file from a GitLab repository. The POST request content is a JSON string containing the file name, repository name, branch, access token.
+    Reads a file from a GitLab repository. The POST request content is a JSON string containing the file name, repository name, branch, access token, and optionally the response 'format' (see file_response()).
     """
     content = request.get_json(silent=True)
-    repo_name = content["repositoryName"]
-    repo_branch = content["repositoryBranch"]
-    repo_service = content["repositoryService"]
-    repo_token = content["token"]
-    filename = content["filename"]
-    extension = os.path.splitext(filename)[1]
+    result, status = read_git_lab_file(content["repositoryName"], content["repositoryBranch"], content["token"], content["filename"])
+    return file_response(result, status, content.get("format", 1))
+
+
+def read_git_lab_file(repo_name, repo_branch, repo_token, filename, projects=None):
+    """
+    Helper method to read a file from a GitLab repository.
 
-    #print("open_git_lab_file()", "repo_name", repo_name, "repo_service", repo_service, "repo_branch", repo_branch, "repo_token", repo_token, "filename", filename, "extension:" + extension + ":")
+    Concurrent reads of the same file with the same token share one upstream fetch.
+    If GitLab fails, the last good copy is returned instead (see with_stale_copy()).
+    If a dict is given as 'projects', project objects are reused from, and added to, it.
+
+    Returns a (result, status) tuple, where result is the dict to be sent to the client.
+    """
+    mirrored = read_mirrored_file("gitlab", repo_name, repo_branch, filename)
+    if mirrored is not None:
+        return mirrored
+
+    key = ("gitlab", repo_name, repo_branch, filename, hash_token(repo_token))
+
+    def read():
+        check_rate_limit("gitlab", repo_token, ratelimit.INTERACTIVE)
+        return coalesced(key, GITLAB_HOST, fetch_git_lab_file, repo_name, repo_branch, repo_token, filename, projects)
+    return with_stale_copy(key, "openRemoteGitlabFile", read)
+
+
+def fetch_git_lab_file(repo_name, repo_branch, repo_token, filename, projects=None):
+    extension = os.path.splitext(filename)[1]
 
     # Extracting the true repo name and repo folder.
     folder_name, repo_name = extract_folder_and_repo_names(repo_name)
     if folder_name != "":
         filename = folder_name + "/" + filename
 
-    #print("folder_name", folder_name, "repo_name", repo_name, "filename", filename)
-
-    # get the data from gitlab
-    credentials_ignored = False
-    if repo_token:
-        gl = gitlab.Gitlab('https://gitlab.com', private_token=repo_token, api_version=4)
-        try:
-            gl.auth()
-        except gitlab.exceptions.GitlabAuthenticationError:
-            # bad credentials - fall back to anonymous access for public repos
-            print("GitLab auth failed for {0}, retrying anonymously".format(repo_name))
-            credentials_ignored = True
-            gl = gitlab.Gitlab('https://gitlab.com', api_version=4)
-        except gitlab.exceptions.GitlabError as ge:
-            app.logger.exception("GitLab error during auth for %s", repo_name)
-            return jsonify({"error": "GitLab error during authentication: " + str(ge)}), 404
+    # get the data from gitlab, bad credentials fall back to anonymous access for public repos
+    try:
+        gl, credentials_ignored = client_pool.gitlab_for_read(repo_token)
+    except gitlab.exceptions.GitlabError as ge:
+        if is_upstream_failure(ge):
+            raise
+        app.logger.exception("GitLab error during auth for %s", repo_name)
+        return {"error": "GitLab error during authentication: " + str(ge)}, 404
+
+    key = (repo_name, repo_token)
+    if projects is not None and key in projects:
+        project = projects[key]
     else:
-        gl = gitlab.Gitlab('https://gitlab.com', api_version=4)
-
-    project = gl.projects.get(repo_name)
+        with tracing.span("project"):
+            project = gl.projects.get(repo_name)
+        if projects is not None:
+            projects[key] = project
 
     try:
-        f = project.files.get(file_path=filename, ref=repo_branch)
+        with tracing.span("contents"):
+            f = project.files.get(file_path=filename, ref=repo_branch)
     except gitlab.exceptions.GitlabGetError as gle:
+        if is_upstream_failure(gle):
+            raise
         app.logger.error("GitLabGetError %s/%s/%s: %s", repo_name, repo_branch, filename, gle)
-        return jsonify({"error": str(gle)}), 404
+        return {"error": str(gle)}, 404
 
     # get the decoded content
     raw_data = f.decode().decode("utf-8")
@@ -1018,9 +2093,9 @@ def open_git_lab_file():
     if extension != ".md":
         # parse JSON
         try:
-            graph = json.loads(raw_data)
+            graph = codec.loads(raw_data)
         except json.decoder.JSONDecodeError as e:
-            return app.response_class(response=json.dumps({"error": "File contains invalid JSON: " + str(e)}), status=400, mimetype="application/json")
+            return {"error": "File contains invalid JSON: " + str(e)}, 400
 
         if not "modelData" in graph:
             graph["modelData"] = {}
@@ -1033,15 +2108,14 @@ def open_git_lab_file():
             for component in graph["nodeDataArray"]:
                 component["paletteDownloadUrl"] = "TODO"
 
-        json_data = json.dumps(graph, indent=4)
-
-        return jsonify({"data": json_data, "credentialsIgnored": credentials_ignored})
+        return {"data": graph, "credentialsIgnored": credentials_ignored}, 200
     else:
         raw_str = raw_data if isinstance(raw_data, str) else raw_data.decode("utf-8")
-        return jsonify({"data": raw_str, "credentialsIgnored": credentials_ignored})
+        return {"data": raw_str, "credentialsIgnored": credentials_ignored}, 200
 
 
 @app.route("/deleteRemoteGitlabFile", methods=["POST"])
+@host_limiter.limited(GITLAB_HOST)
 def delete_git_lab_file():
     """
     FLASK POST routing method for '/deleteRemoteGitlabFile'
@@ -1064,22 +2138,26 @@ def delete_git_lab_file():
         filename = folder_name + "/" + filename
 
     # get the data from gitlab
-    gl = gitlab.Gitlab('https://gitlab.com', private_token=repo_token, api_version=4)
-
     try:
-        gl.auth()
+        if not client_pool.gitlab_auth(repo_token):
+            return jsonify({"error": "GitLab access token is invalid"}), 404
     except Exception as e:
+        host_limiter.report(e)
         app.logger.exception("GitLab auth failed for %s", repo_name)
         return jsonify({"error": str(e)}), 404
 
+    gl = client_pool.gitlab(repo_token)
+
     project = gl.projects.get(repo_name)
 
     try:
         project.files.delete(file_path=filename, branch=repo_branch, commit_message="File removed by EAGLE")
     except gitlab.exceptions.GitlabDeleteError as gle:
+        host_limiter.report(gle)
         app.logger.error("GitLabDeleteError %s/%s/%s: %s", repo_name, repo_branch, filename, gle)
         return jsonify({"error": str(gle)}), 404
 
+    invalidate_mirror("gitlab", repo_name)
     return jsonify({"success": True})
 
 
@@ -1088,10 +2166,33 @@ def open_url_file():
     """
     FLASK POST routing method for '/openRemoteUrlFile'
 
-    Reads a file from a URL. The POST request content is a JSON string containing the URL.
+    Reads a file from a URL. The POST request content is a JSON string containing the URL, and optionally the response 'format' (see file_response()).
     """
     content = request.get_json(silent=True)
-    url = content["url"]
+    result, status = read_url_file(content["url"])
+    response_format = content.get("format", 1)
+    if status != 200 or response_format != 1:
+        return file_response(result, status, response_format)
+
+    # format 1 for this route is the indented file content, as a JSON string
+    response = app.response_class(
+        response=json.dumps(codec.dumps_indented(result["data"])), status=200, mimetype="application/json"
+    )
+    return response
+
+
+def read_url_file(url):
+    """
+    Helper method to read a graph or palette from a URL.
+
+    Concurrent reads of the same URL share one fetch.
+
+    Returns a (result, status) tuple, where result is the dict to be sent to the client.
+    """
+    return coalesced(("url", url), None, fetch_url_file, url)
+
+
+def fetch_url_file(url):
     extension = os.path.splitext(url)[1]
 
     # validate the URL before fetching to prevent SSRF
@@ -1099,16 +2200,17 @@ def open_url_file():
         validate_remote_url(url)
     except ValueError as e:
         app.logger.warning("SSRF attempt blocked for URL %r: %s", url, e)
-        return jsonify({"error": "Invalid URL"}), 400
-    
+        return {"error": "Invalid URL"}, 400
+
     # download via http get
     try:
         graph = fetch_json_url(url, label="remote URL")
     except RemoteFetchError as e:
-        return jsonify({"error": e.message}), e.status
+        return {"error": e.message}, e.status
 
-    if not "modelData" in graph:
-        graph["modelData"] = {}
+    # the fetched graph may be a cached object that is shared with other requests, so copy what is changed
+    graph = dict(graph)
+    graph["modelData"] = dict(graph.get("modelData", {}))
 
     # overwrite some modelData information
     graph["modelData"]["repoService"] = "Url"
@@ -1116,37 +2218,172 @@ def open_url_file():
 
     # for palettes, put downloadUrl in every component
     if extension == ".palette":
-        for component in graph["nodeDataArray"]:
-            component["paletteDownloadUrl"] = url
+        graph["nodeDataArray"] = [dict(component, paletteDownloadUrl=url) for component in graph["nodeDataArray"]]
 
-    json_data = json.dumps(graph, indent=4)
+    return {"data": graph}, 200
 
-    response = app.response_class(
-        response=json.dumps(json_data), status=200, mimetype="application/json"
-    )
-    return response
 
+@app.route("/openRemoteFiles", methods=["POST"])
+def open_remote_files():
+    """
+    FLASK POST routing method for '/openRemoteFiles'
+
+    Reads many files in one request. The POST request content is a JSON string containing a list of 'files', each with a 'service' (GitHub, GitLab or Url) and either a 'url', or the repository name, branch, token and file name as for the single file routes.
+    Files are fetched concurrently, and the response contains a list of 'results' in the same order, each with a 'status' and either 'data' or 'error'.
+    The optional response 'format' applies to every file (see file_response()).
+    """
+    content = request.get_json(silent=True)
+
+    try:
+        files = content["files"]
+        response_format = content.get("format", 1)
+    except (KeyError, TypeError) as ke:
+        app.logger.error("KeyError in openRemoteFiles: %s", ke)
+        return jsonify({"error":"Files not specified in request"}), 400
+
+    if len(files) > config.config.BATCH_OPEN_MAX_FILES:
+        return jsonify({"error": "Too many files in request, the maximum is {0}".format(config.config.BATCH_OPEN_MAX_FILES)}), 400
+
+    # repository objects are shared by all the files in this request
+    repos = {}
+    projects = {}
+
+    def read_file(file):
+        try:
+            service = file["service"]
+            if service == "GitHub":
+                result, status = read_git_hub_file(file["repositoryName"], file["repositoryBranch"], file.get("token", ""), file["filename"], repos)
+            elif service == "GitLab":
+                result, status = read_git_lab_file(file["repositoryName"], file["repositoryBranch"], file.get("token", ""), file["filename"], projects)
+            elif service == "Url":
+                result, status = read_url_file(file["url"])
+            else:
+                result, status = {"error": "Unknown service: {0}".format(service)}, 400
+        except KeyError as ke:
+            result, status = {"error": "Missing parameter: {0}".format(ke)}, 400
+        except UpstreamBusyError as e:
+            result, status = {"error": str(e)}, 503
+        except UpstreamError as e:
+            result, status = {"error": str(e)}, e.status
+        except RateLimitError as e:
+            result, status = {"error": str(e), "rateLimit": e.status}, 429
+        except Exception as e:
+            app.logger.exception("Error in openRemoteFiles for %s", file.get("filename", file.get("url")))
+            result, status = {"error": str(e)}, 500
+
+        # results may be shared with other requests, so don't modify them
+        return dict(format_file_result(result, status, response_format), status=status)
+
+    if response_format not in FILE_RESPONSE_FORMATS:
+        return jsonify({"error": "Unknown response format: {0}".format(response_format)}), 400
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.config.BATCH_OPEN_MAX_PARALLEL) as executor:
+        results = list(executor.map(tracing.bind(read_file), files))
+
+    return compact_json_response({"results": results})
+
+
+def list_mirrored_files(service, repo_name, repo_branch, repo_path):
+    """
+    Helper method to list the files in a repository from its local git mirror (see eagleServer.mirror).
+
+    Returns the dict to be sent to the client, or None if the repository is not mirrored (or the mirror can not be used yet).
+    """
+    if git_mirror is None:
+        return None
+
+    folder_name, repo_name = extract_folder_and_repo_names(repo_name)
+    with tracing.span("mirror"):
+        items = git_mirror.list_folder(service, repo_name, repo_branch, repo_path)
+    if items is None:
+        return None
+
+    return {"files": parse_gitlab_folder(items, repo_path), "credentialsIgnored": False}
+
+
+def read_mirrored_file(service, repo_name, repo_branch, filename):
+    """
+    Helper method to read a file from the local git mirror of a repository (see eagleServer.mirror).
+
+    Returns a (result, status) tuple as read_git_hub_file() does, or None if the file can not be read from a mirror.
+    """
+    if git_mirror is None:
+        return None
+
+    extension = os.path.splitext(filename)[1]
+
+    # Extracting the true repo name and repo folder.
+    folder_name, repo_name = extract_folder_and_repo_names(repo_name)
+    if folder_name != "":
+        filename = folder_name + "/" + filename
+
+    with tracing.span("mirror"):
+        found = git_mirror.read_file(service, repo_name, repo_branch, filename)
+    if found is None:
+        return None
+    raw_data, commit = found
+
+    if extension == ".md":
+        return {"data": raw_data.decode("utf-8"), "credentialsIgnored": False}, 200
+
+    # parse JSON
+    try:
+        graph = codec.loads(raw_data)
+    except json.decoder.JSONDecodeError as e:
+        return {"error": "File contains invalid JSON: " + str(e)}, 400
+
+    if isinstance(graph, list):
+        return {"error": "File JSON data is a list, this file could be a Physical Graph instead of a Logical Graph."}, 404
+
+    if not "modelData" in graph:
+        graph["modelData"] = {}
 
-def parse_github_folder(repo, path, branch):
+    # add the repository information, from the last commit that changed the file
+    if service == "github":
+        download_url = "https://raw.githubusercontent.com/" + repo_name + "/" + commit["sha"] + "/" + filename
+        set_metadata_for_egress(graph, "GitHub", repo_name, repo_branch, commit["sha"], commit["name"], commit["email"], commit["timestamp"], filename, download_url)
+    else:
+        download_url = "TODO"
+        set_metadata_for_egress(graph, "GitLab", repo_name, repo_branch, commit["sha"], commit["name"], commit["email"], commit["timestamp"], filename, download_url)
+
+    # for palettes, put downloadUrl in every component
+    if extension == ".palette":
+        for component in graph.get("nodeDataArray", []):
+            component["paletteDownloadUrl"] = download_url
+
+    return {"data": graph, "credentialsIgnored": False}, 200
+
+
+def invalidate_mirror(service, repo_name):
+    """
+    Helper method to stop reading a repository from its local git mirror until it has been fetched again, after a change made through this server.
+    """
+    if git_mirror is not None:
+        git_mirror.invalidate(service, extract_folder_and_repo_names(repo_name)[1])
+
+
+def parse_github_folder(g, token, repo, path, branch):
     """
     Helper method to parse the retrieve and parse the content of a github folder.
+
+    The folder listing is revalidated with a conditional request, so unchanged folders do not use up the rate limit.
     """
     result = {"": []}
 
     # Getting repository file list
     try:
-        contents = repo.get_contents(path, ref=branch)
+        contents = conditional.get_folder(g, conditional_cache, token, repo, path, branch)
     except github.GithubException as ghe:
+        if is_upstream_failure(ghe):
+            raise
         print("GitHubException {1} ({2}): {0}".format(str(ghe), repo.full_name, branch))
         return ghe.data.get("message", str(ghe))
 
-    while contents:
-        file_content = contents.pop(0)
-
-        if file_content.type == "dir":
-            result[file_content.path] = file_content.name
+    for file_content in contents:
+        if file_content["type"] == "dir":
+            result[file_content["path"]] = file_content["name"]
         else:
-            result[""].append(file_content.name)
+            result[""].append(file_content["name"])
 
     return result
 
@@ -1173,30 +2410,25 @@ def parse_gitlab_folder(items, path):
 def find_github_palettes(repo, path, branch):
     """
     Helper method to parse the retrieve and parse palettes from a github folder.
+
+    Uses the (cached) recursive tree of the branch rather than walking the folders one request at a time.
     """
     result = []
 
     # Getting repository file list
     try:
-        contents = repo.get_contents(path, ref=branch)
+        tree = trees.github_tree(repo, branch, tree_cache)
     except github.GithubException as ghe:
         print("GitHubException {1} ({2}): {0}".format(str(ghe), repo.full_name, branch))
         return ghe.data.get("message", str(ghe))
 
-    while contents:
-        file_content = contents.pop(0)
-
-        if file_content.type == "dir":
-            palettes = find_github_palettes(repo, file_content.path, branch)
-            for palette in palettes:
-                result.append(palette)
-        else:
-            if file_content.name.endswith(".palette"):
-                if '/' in file_content.path:
-                    path_without_filename = file_content.path[:file_content.path.rindex('/')]
-                else:
-                    path_without_filename = ""
-                result.append({"name":file_content.name, "path":path_without_filename})
+    for entry in trees.filter_tree(tree, path)["entries"]:
+        if entry["type"] == "blob" and entry["path"].endswith(".palette"):
+            if '/' in entry["path"]:
+                path_without_filename, name = entry["path"].rsplit('/', 1)
+            else:
+                path_without_filename, name = "", entry["path"]
+            result.append({"name":name, "path":path_without_filename})
 
     return result
 
@@ -1234,6 +2466,7 @@ def parse_args():
     if args.tempdir is not None:
         global TEMP_FILE_FOLDER
         TEMP_FILE_FOLDER = args.tempdir
+        init_caches()
 
     # Create the temp folder if it does not esist.
     try:
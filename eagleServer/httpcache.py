@@ -0,0 +1,140 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+HTTP cache for JSON fetched from arbitrary URLs.
+
+The default palettes are fetched from the same URLs by every editor on
+startup. Responses are kept in one of the caches from eagleServer.cache,
+and reused for as long as their Cache-Control (or Expires) headers allow.
+After that they are revalidated with If-None-Match / If-Modified-Since, so
+that an unchanged file is not downloaded again. If the remote host is down
+or failing, a copy that is at most 'max_stale' seconds past its expiry is
+returned instead of an error.
+"""
+import email.utils
+import logging
+import time
+import urllib.error
+
+from eagleServer import codec
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cache_control(value: str) -> dict:
+    """
+    Parse a Cache-Control header into a dict of lower-case directives and their values (None if they have none).
+    """
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def freshness_lifetime(headers, default_ttl: float):
+    """
+    Return how many seconds a response may be used without revalidation, or None if it must not be stored.
+    """
+    directives = parse_cache_control(headers.get("Cache-Control"))
+
+    # this is a cache shared between users
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0, int(directives[name]))
+            except (TypeError, ValueError):
+                return 0
+
+    if headers.get("Expires"):
+        try:
+            expires = email.utils.parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = email.utils.parsedate_to_datetime(headers["Date"]).timestamp() if headers.get("Date") else time.time()
+            return max(0, expires - date)
+        except (TypeError, ValueError):
+            return 0
+
+    return default_ttl
+
+
+class HttpCache:
+    """
+    Cache of decoded JSON responses, keyed by URL.
+
+    'open_url' is called with a URL and a dict of extra request headers, and returns a
+    (status, headers, body) tuple. It should return status 304 for 'Not Modified'
+    and raise for any other error.
+    """
+    def __init__(self, cache, open_url, max_stale: float, default_ttl: float = 0):
+        self.cache = cache
+        self.open_url = open_url
+        self.max_stale = max_stale
+        self.default_ttl = default_ttl
+
+    def get_json(self, url: str):
+        entry = self.cache.get(url)
+        now = time.time()
+        if entry is not None and now < entry["expires"]:
+            return entry["data"]
+
+        request_headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry.get("lastModified"):
+                request_headers["If-Modified-Since"] = entry["lastModified"]
+
+        try:
+            status, headers, body = self.open_url(url, request_headers)
+        except Exception as e:
+            if entry is None or not self._may_serve_stale(e) or now - entry["expires"] > self.max_stale:
+                raise
+            logger.warning("Serving stale copy of %s (expired %d seconds ago): %s", url, now - entry["expires"], e)
+            return entry["data"]
+
+        if status == 304 and entry is not None:
+            data = entry["data"]
+        else:
+            data = codec.loads(body)
+            entry = {"data": data, "etag": headers.get("ETag"), "lastModified": headers.get("Last-Modified")}
+
+        lifetime = freshness_lifetime(headers, self.default_ttl)
+        if lifetime is None:
+            return data
+
+        entry["expires"] = now + lifetime
+        # keep the entry past its expiry, for revalidation and for outages
+        self.cache.put(url, entry, ttl=lifetime + max(self.max_stale, 86400))
+        return data
+
+    @staticmethod
+    def _may_serve_stale(e):
+        # the remote copy is gone or forbidden, rather than unavailable
+        if isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code != 429:
+            return False
+        return True
@@ -0,0 +1,73 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Modules that are only imported when they are first used.
+
+PyGithub, python-gitlab and requests take most of the time needed to
+import the server, and so to start (or reload) each worker process. They
+are imported through lazy_import(), which returns a placeholder module that
+imports the real one on first attribute access, so a worker only pays for
+them once it handles a request that needs them. load() imports them
+straight away, for example before gunicorn forks preloaded workers.
+"""
+import importlib
+import sys
+import threading
+import types
+
+_lock = threading.RLock()
+_placeholders = {}
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module, which imports it when one of its attributes is used.
+
+    Once imported, the module's attributes are copied into the placeholder, so
+    later lookups cost the same as for the real module.
+    """
+    def __getattr__(self, attribute):
+        return getattr(load(self), attribute)
+
+
+def lazy_import(name: str):
+    """
+    Return the named module if it is already imported, otherwise a placeholder that imports it on first use.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        return _placeholders.setdefault(name, LazyModule(name))
+
+
+def load(module):
+    """
+    Import the module behind a placeholder (if it is one), and return the real module.
+    """
+    if not isinstance(module, LazyModule):
+        return module
+
+    with _lock:
+        real = importlib.import_module(module.__name__)
+        module.__dict__.update(real.__dict__)
+    return real
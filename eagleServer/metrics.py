@@ -0,0 +1,187 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Prometheus metrics of the EAGLE server, served at '/metrics'.
+
+Metrics are only collected if the optional 'prometheus_client' package is
+installed; otherwise the functions here do nothing. Gunicorn runs several
+worker processes, each with its own counters. When the
+PROMETHEUS_MULTIPROC_DIR environment variable names a directory (as
+docker/gunicorn_conf.py does), every process writes its metrics to files
+there and '/metrics' adds up those of all the processes, whichever worker
+answers the scrape. Without it, each process reports only its own.
+
+Collected are:
+
+- eagle_request_duration_seconds, eagle_request_size_bytes and
+  eagle_response_size_bytes: histograms per route
+- eagle_requests_in_progress: requests being handled, per route
+- eagle_upstream_request_duration_seconds, eagle_upstream_requests_total
+  and eagle_upstream_requests_in_progress: calls to GitHub, GitLab,
+  Docker Hub and other URLs, with the status class ('2xx' ... '5xx') or
+  'error' if no response was received
+- eagle_upstream_circuits_open: upstream hosts whose circuit breaker is
+  open (see eagleServer.upstream), added up over the worker processes
+- eagle_cache_events_total: hits, misses, writes and errors of each cache
+"""
+import contextlib
+import os
+import time
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+if prometheus_client is not None:
+    REQUEST_DURATION = prometheus_client.Histogram(
+        "eagle_request_duration_seconds", "Time taken to handle requests", ["route", "method", "status"], buckets=LATENCY_BUCKETS)
+    REQUEST_SIZE = prometheus_client.Histogram(
+        "eagle_request_size_bytes", "Size of request bodies", ["route"], buckets=SIZE_BUCKETS)
+    RESPONSE_SIZE = prometheus_client.Histogram(
+        "eagle_response_size_bytes", "Size of response bodies, after compression", ["route"], buckets=SIZE_BUCKETS)
+    REQUESTS_IN_PROGRESS = prometheus_client.Gauge(
+        "eagle_requests_in_progress", "Requests being handled", ["route"], multiprocess_mode="livesum")
+    UPSTREAM_DURATION = prometheus_client.Histogram(
+        "eagle_upstream_request_duration_seconds", "Time taken by calls to upstream services", ["service"], buckets=LATENCY_BUCKETS)
+    UPSTREAM_REQUESTS = prometheus_client.Counter(
+        "eagle_upstream_requests", "Calls to upstream services", ["service", "outcome"])
+    UPSTREAM_IN_PROGRESS = prometheus_client.Gauge(
+        "eagle_upstream_requests_in_progress", "Calls to upstream services in progress", ["service"], multiprocess_mode="livesum")
+    UPSTREAM_CIRCUITS_OPEN = prometheus_client.Gauge(
+        "eagle_upstream_circuits_open", "Upstream hosts whose circuit breaker is open", ["service"], multiprocess_mode="livesum")
+    CACHE_EVENTS = prometheus_client.Counter(
+        "eagle_cache_events", "Cache lookups and writes", ["cache", "event"])
+
+
+def enabled() -> bool:
+    return prometheus_client is not None
+
+
+def init_app(app) -> None:
+    """
+    Record the duration, sizes and number in progress of the requests handled by a Flask app.
+
+    Call this before registering other after_request functions, so that the response size
+    is measured after they have run (for example, after compression).
+    """
+    if prometheus_client is None:
+        return
+
+    from flask import g, request
+
+    def route():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    @app.before_request
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = route()
+        REQUESTS_IN_PROGRESS.labels(g.metrics_route).inc()
+
+    @app.after_request
+    def observe_request(response):
+        if "metrics_start" in g:
+            REQUEST_DURATION.labels(g.metrics_route, request.method, str(response.status_code)).observe(time.perf_counter() - g.metrics_start)
+            if request.content_length is not None:
+                REQUEST_SIZE.labels(g.metrics_route).observe(request.content_length)
+            # streamed responses (such as static files) have no length yet
+            if not response.direct_passthrough and response.content_length is not None:
+                RESPONSE_SIZE.labels(g.metrics_route).observe(response.content_length)
+        return response
+
+    @app.teardown_request
+    def end_request(exc):
+        if "metrics_route" in g:
+            REQUESTS_IN_PROGRESS.labels(g.metrics_route).dec()
+
+
+class UpstreamCall:
+    """
+    Set `status` to the HTTP status of the response, if one was received.
+    """
+    status = None
+
+
+@contextlib.contextmanager
+def upstream(service: str):
+    """
+    Context manager timing a call to an upstream service, yielding an UpstreamCall.
+    """
+    call = UpstreamCall()
+    if prometheus_client is None:
+        yield call
+        return
+
+    in_progress = UPSTREAM_IN_PROGRESS.labels(service)
+    in_progress.inc()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        in_progress.dec()
+        UPSTREAM_DURATION.labels(service).observe(time.perf_counter() - start)
+        outcome = "error" if call.status is None else "{0}xx".format(call.status // 100)
+        UPSTREAM_REQUESTS.labels(service, outcome).inc()
+
+
+def circuit_changed(service: str, opened: bool) -> None:
+    """
+    Count a circuit breaker of a host of an upstream service being opened or closed.
+    """
+    if prometheus_client is not None:
+        if opened:
+            UPSTREAM_CIRCUITS_OPEN.labels(service).inc()
+        else:
+            UPSTREAM_CIRCUITS_OPEN.labels(service).dec()
+
+
+def cache_event(cache: str, event: str) -> None:
+    """
+    Count a cache event: "hit", "miss", "put" or "error".
+    """
+    if prometheus_client is not None and cache is not None:
+        CACHE_EVENTS.labels(cache, event).inc()
+
+
+def exposition():
+    """
+    Return a (body, content type) tuple of the metrics in the Prometheus text format.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Remove the live gauges of a worker process that has exited (for gunicorn's child_exit hook).
+    """
+    if prometheus_client is not None and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,236 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Local git mirrors of frequently read repositories.
+
+The default repositories are read by every user, so rather than listing and
+opening their files through the GitHub and GitLab APIs, bare clones of them
+are kept on disk and read with git. A mirror is fetched again in a
+background thread once it is older than the refresh interval, while the
+current copy keeps being served. Until a repository has been cloned, and
+after invalidate() is called (for example once a file has been saved to
+it), reads return None so that the caller falls back to the API until the
+next fetch has finished.
+
+Mirrors are shared by every server process on the host. Clones and fetches
+hold an exclusive lock on a file next to the repository, and the time of
+the last fetch is the modification time of a stamp file inside it.
+"""
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from eagleServer.cache import CacheStats
+
+logger = logging.getLogger(__name__)
+
+STAMP_FILE = "eagle_fetched"
+
+# how long (in seconds) a git command may take
+READ_TIMEOUT = 30
+FETCH_TIMEOUT = 600
+
+
+class GitMirror:
+    """
+    Bare clones of a fixed set of repositories under a folder.
+
+    'repositories' maps (service, repository name) to the URL the repository is cloned from.
+    """
+    def __init__(self, folder: str, repositories: dict, refresh_interval: float, git: str = "git"):
+        self.folder = folder
+        self.repositories = repositories
+        self.refresh_interval = refresh_interval
+        self.git = git
+        self.stats = CacheStats("mirror")
+        self._refreshing = set()
+        self._invalidated = set()
+        self._lock = threading.Lock()
+
+    def covers(self, service: str, repo_name: str) -> bool:
+        return (service, repo_name) in self.repositories
+
+    def _path(self, service, repo_name):
+        return os.path.join(self.folder, service, repo_name + ".git")
+
+    def _run(self, args, cwd=None, timeout=READ_TIMEOUT, text=True):
+        return subprocess.run([self.git] + args, cwd=cwd, capture_output=True, text=text, timeout=timeout)
+
+    def _commit(self, service, repo_name, branch):
+        """
+        Return the path of the mirror and the head commit of the branch, or (None, None) if the mirror can not be used.
+        """
+        if not self.covers(service, repo_name):
+            return None, None
+
+        path = self._path(service, repo_name)
+        try:
+            fetched = os.stat(os.path.join(path, STAMP_FILE)).st_mtime
+        except OSError:
+            # not cloned yet, or invalidated: use the API until the fetch is done
+            self._refresh_in_background(service, repo_name)
+            self.stats.count("miss")
+            return None, None
+        if time.time() - fetched >= self.refresh_interval:
+            self._refresh_in_background(service, repo_name)
+
+        result = self._run(["rev-parse", "--verify", "--quiet", "refs/heads/" + branch + "^{commit}"], cwd=path)
+        if result.returncode != 0:
+            # branches are only known to the mirror from the last fetch
+            self.stats.count("miss")
+            return None, None
+        self.stats.count("hit")
+        return path, result.stdout.strip()
+
+    def list_folder(self, service: str, repo_name: str, branch: str, folder: str):
+        """
+        Return the entries of a folder on a branch as a list of dicts with 'name', 'path' and 'type' ("tree" or "blob"),
+        or None if the mirror can not answer.
+        """
+        path, commit = self._commit(service, repo_name, branch)
+        if path is None:
+            return None
+
+        folder = folder.strip("/")
+        args = ["ls-tree", "-z", commit]
+        if folder:
+            args += ["--", folder + "/"]
+        result = self._run(args, cwd=path)
+        if result.returncode != 0:
+            logger.warning("git ls-tree failed in mirror of %s: %s", repo_name, result.stderr.strip())
+            return None
+
+        entries = []
+        for line in result.stdout.split("\0"):
+            if not line:
+                continue
+            info, entry_path = line.split("\t", 1)
+            entries.append({"name": entry_path.rsplit("/", 1)[-1], "path": entry_path, "type": info.split()[1]})
+        return entries
+
+    def read_file(self, service: str, repo_name: str, branch: str, filename: str):
+        """
+        Return the content of a file on a branch and the last commit that changed it, or None if the mirror can not answer.
+
+        The result is a (content bytes, commit) tuple, where commit is a dict with 'sha', 'name', 'email' and 'timestamp'
+        of the committer. Files that are not in the mirror also return None, as they may have been added since the last fetch.
+        """
+        path, commit = self._commit(service, repo_name, branch)
+        if path is None:
+            return None
+
+        result = self._run(["cat-file", "blob", commit + ":" + filename], cwd=path, text=False)
+        if result.returncode != 0:
+            return None
+
+        log = self._run(["log", "-1", "--format=%H%x00%cn%x00%ce%x00%ct", commit, "--", filename], cwd=path)
+        fields = log.stdout.strip().split("\0")
+        if log.returncode != 0 or len(fields) != 4:
+            logger.warning("git log failed in mirror of %s: %s", repo_name, log.stderr.strip())
+            return None
+        return result.stdout, {"sha": fields[0], "name": fields[1], "email": fields[2], "timestamp": float(fields[3])}
+
+    def invalidate(self, service: str, repo_name: str) -> None:
+        """
+        Stop serving a repository from its mirror until it has been fetched again, for example after a file was saved to it.
+        """
+        if not self.covers(service, repo_name):
+            return
+        try:
+            os.remove(os.path.join(self._path(service, repo_name), STAMP_FILE))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            # a fetch already in progress may have started before the change, so fetch again after it
+            if (service, repo_name) in self._refreshing:
+                self._invalidated.add((service, repo_name))
+        self._refresh_in_background(service, repo_name)
+
+    def refresh(self, service: str, repo_name: str) -> None:
+        """
+        Clone the repository, or fetch every branch of it again, and record the time.
+        """
+        path = self._path(service, repo_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # another process may have just done the same
+            try:
+                if time.time() - os.stat(os.path.join(path, STAMP_FILE)).st_mtime < self.refresh_interval:
+                    return
+            except OSError:
+                pass
+
+            url = self.repositories[(service, repo_name)]
+            if not os.path.isdir(path):
+                # clone next to the final location, then move it there, so that a failed clone leaves nothing behind
+                temp_path = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=".clone-")
+                try:
+                    result = self._run(["clone", "--bare", "--quiet", url, temp_path], timeout=FETCH_TIMEOUT)
+                    if result.returncode != 0:
+                        raise RuntimeError("git clone failed: " + result.stderr.strip())
+                    os.rename(temp_path, path)
+                finally:
+                    shutil.rmtree(temp_path, ignore_errors=True)
+            else:
+                result = self._run(["fetch", "--prune", "--quiet", url, "+refs/heads/*:refs/heads/*"], cwd=path, timeout=FETCH_TIMEOUT)
+                if result.returncode != 0:
+                    raise RuntimeError("git fetch failed: " + result.stderr.strip())
+
+            with open(os.path.join(path, STAMP_FILE), "w"):
+                pass
+            os.utime(os.path.join(path, STAMP_FILE))
+        self.stats.count("put")
+
+    def _refresh_in_background(self, service, repo_name):
+        key = (service, repo_name)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=key, daemon=True).start()
+
+    def _refresh(self, service, repo_name):
+        key = (service, repo_name)
+        while True:
+            try:
+                self.refresh(service, repo_name)
+            except Exception as e:
+                self.stats.count("error")
+                logger.warning("Unable to update the mirror of %s, keeping the current copy: %s", repo_name, e)
+            with self._lock:
+                if key in self._invalidated:
+                    self._invalidated.discard(key)
+                    try:
+                        os.remove(os.path.join(self._path(service, repo_name), STAMP_FILE))
+                    except FileNotFoundError:
+                        pass
+                    continue
+                self._refreshing.discard(key)
+                return
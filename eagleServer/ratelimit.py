@@ -0,0 +1,102 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Scheduling of GitHub and GitLab API calls by their remaining rate limit.
+
+Both services limit the number of API calls per token, and per IP address
+for anonymous calls, so every user without a token behind the same NAT
+shares one budget. The budget reported with the last response for each
+identity decides whether a call goes ahead:
+
+- while more than a reserve fraction of the budget is left, everything does;
+- below the reserve, background calls (listings) are refused, so that the
+  rest is kept for interactive calls (opening and saving files);
+- when the budget runs out, interactive calls wait for it to be reset if
+  that is soon, and are refused otherwise.
+
+Refused calls raise RateLimitError, with the number of seconds until the
+budget is reset, and callers may serve a cached copy instead.
+"""
+import math
+import time
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+SERVICE_NAMES = {"github": "GitHub", "gitlab": "GitLab"}
+
+
+class RateLimitError(Exception):
+    """Raised when a call is refused to save the rest of a rate limit budget."""
+    def __init__(self, service: str, status: dict):
+        self.service = service
+        self.status = status
+        self.retry_after = max(1, status["resetIn"])
+        super().__init__("{0} API rate limit is {1}, please try again in {2} seconds".format(
+            SERVICE_NAMES.get(service, service), "used up" if status["remaining"] <= 0 else "almost used up", self.retry_after))
+
+
+class RateLimitScheduler:
+    """
+    Admits or refuses API calls by their priority and the remaining budget.
+
+    `budget(service, token)` returns the last (remaining, limit, reset) reported
+    for a token, with reset as a Unix time, or None if nothing is known.
+    """
+    def __init__(self, budget, reserve: float, max_wait: float):
+        self.budget = budget
+        self.reserve = reserve
+        self.max_wait = max_wait
+
+    def status(self, service: str, token: str):
+        """
+        Return the budget of a token as a dict, or None if it is not known.
+        """
+        budget = self.budget(service, token)
+        if budget is None:
+            return None
+
+        remaining, limit, reset = budget
+        reset_in = max(0, math.ceil(reset - time.time()))
+        if reset and reset_in == 0:
+            # the budget has been reset since it was last reported
+            remaining = limit
+        return {"limit": limit, "remaining": remaining, "reset": reset, "resetIn": reset_in}
+
+    def check(self, service: str, token: str, priority: int) -> None:
+        """
+        Return when a call with the given priority may go ahead, or raise RateLimitError.
+
+        An interactive call may first wait up to `max_wait` seconds for the budget to be reset.
+        """
+        status = self.status(service, token)
+        if status is None or status["remaining"] > math.ceil(status["limit"] * self.reserve):
+            return
+
+        if priority == BACKGROUND:
+            raise RateLimitError(service, status)
+        if status["remaining"] > 0:
+            return
+        if status["reset"] and status["resetIn"] <= self.max_wait:
+            time.sleep(status["resetIn"])
+            return
+        raise RateLimitError(service, status)
@@ -0,0 +1,204 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Lightweight tracing of the steps taken to handle a request.
+
+Each request gets a Trace, held in a context variable, which collects
+spans: one for every upstream call (named after the service) and for every
+JSON parse and serialise step, and spans around the steps of the slower
+routes. The total time spent in each kind of span is returned in a
+Server-Timing header, which browsers show with the request in their
+developer tools. A sampled fraction of requests is also written, with every
+span, as a line of JSON to a file for offline analysis.
+
+When there is no trace (tracing is off, or outside a request) span() only
+reads the context variable, so the cost of the instrumentation is
+negligible. Work handed to other threads is only traced if it is wrapped
+with bind().
+"""
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("eagle_trace", default=None)
+_write_lock = threading.Lock()
+
+
+class Trace:
+    """
+    The spans recorded while handling one request.
+    """
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, attributes: dict) -> None:
+        with self._lock:
+            self.spans.append((name, start - self.start, duration, attributes))
+
+    def server_timing(self) -> str:
+        """
+        Return a Server-Timing header value with the total duration and number of the spans of each name.
+        """
+        totals = {}
+        with self._lock:
+            for name, start, duration, attributes in self.spans:
+                total = totals.setdefault(name, [0.0, 0])
+                total[0] += duration
+                total[1] += 1
+
+        entries = ['{0};desc="{1} call{2}";dur={3:.1f}'.format(name, count, "" if count == 1 else "s", duration * 1000)
+                   for name, (duration, count) in totals.items()]
+        entries.append("total;dur={0:.1f}".format((time.perf_counter() - self.start) * 1000))
+        return ", ".join(entries)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            spans = [dict(attributes, name=name, start=round(start * 1000, 3), duration=round(duration * 1000, 3))
+                     for name, start, duration, attributes in self.spans]
+        return {"time": self.wall_start, "duration": round((time.perf_counter() - self.start) * 1000, 3), "spans": spans}
+
+
+class Span:
+    """
+    Context manager recording a span in a trace. Attributes can be added while it is open, with span.set(key=value).
+    """
+    __slots__ = ("trace", "name", "attributes", "start")
+
+    def __init__(self, trace: Trace, name: str, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.name, self.start, time.perf_counter() - self.start, self.attributes)
+        return False
+
+
+class _NoSpan:
+    """
+    Stands in for a Span when there is no trace.
+    """
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Return a context manager recording a span in the current trace, if there is one.
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, attributes)
+
+
+def bind(func):
+    """
+    Return a function that records its spans in the current trace, to be called in another thread.
+    """
+    trace = _current.get()
+    if trace is None:
+        return func
+
+    def traced(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return traced
+
+
+def init_app(app, server_timing: bool, sample_rate: float, trace_file) -> None:
+    """
+    Trace the requests handled by a Flask app.
+
+    If `server_timing` is set, every response has a Server-Timing header. A fraction
+    `sample_rate` of requests is written to the file whose path is returned by `trace_file()`.
+    Call this before registering other after_request functions, so that their work is included.
+    """
+    if not server_timing and sample_rate <= 0:
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def start_trace():
+        trace = Trace(sample_rate > 0 and random.random() < sample_rate)
+        g.trace = trace
+        _current.set(trace)
+
+    @app.after_request
+    def add_server_timing(response):
+        trace = g.get("trace")
+        if trace is not None:
+            g.trace_status = response.status_code
+            if server_timing:
+                response.headers["Server-Timing"] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        trace = g.pop("trace", None)
+        if trace is None:
+            return
+        _current.set(None)
+        if trace.sampled:
+            record = dict(trace.as_dict(), method=request.method, path=request.path, status=g.get("trace_status"), error=repr(exc) if exc else None)
+            write(trace_file(), record)
+
+
+def write(path: str, record: dict) -> None:
+    """
+    Append a trace to a file of JSON lines. Errors are logged and otherwise ignored.
+    """
+    line = json.dumps(record, default=str).encode("utf-8") + b"\n"
+    try:
+        with _write_lock, open(path, "ab") as f:
+            f.write(line)
+    except OSError as e:
+        logger.warning("Unable to write trace to %s: %s", path, e)
@@ -0,0 +1,212 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Recursive listings of every file in a repository branch.
+
+A listing is fetched with a single recursive tree request (GitHub) or a
+paginated recursive tree request (GitLab). The tree of a commit never
+changes, so listings are cached by the SHA of the branch head and each
+request only needs to resolve the current head of the branch.
+
+Each listing is a dict with the head commit 'sha', a 'truncated' flag and
+a list of 'entries', each with the 'path', 'type' ("blob" or "tree"),
+'size' (None for folders, and for all GitLab entries) and blob 'sha'.
+GitHub listings also have the 'treeSha' of the root folder.
+
+To find a single file, github_blob() reads only the folders on its path
+instead, which is much faster in large repositories. Saves use the same to
+check whether the files being saved have changed, and GitLab saves list
+only the folders containing the files (gitlab_blob_shas()).
+"""
+import hashlib
+import urllib.parse
+
+import gitlab
+
+from eagleServer.cache import LRUCache
+
+
+def github_tree(repo, branch: str, cache: LRUCache, head_sha: str = None) -> dict:
+    """
+    Return the listing of a GitHub repository branch.
+
+    If the caller already knows the SHA of the head of the branch, it can be given as 'head_sha'.
+
+    Raises GithubException if the branch or tree can not be read.
+    """
+    if head_sha is None:
+        head_sha = repo.get_git_ref("heads/" + branch).object.sha
+
+    key = ("tree", "github", repo.full_name, head_sha)
+    tree = cache.get(key)
+    if tree is not None:
+        return tree
+
+    git_tree = repo.get_git_tree(head_sha, recursive=True)
+    tree = {
+        "sha": head_sha,
+        "treeSha": git_tree.sha,
+        # GitHub truncates trees with more than 100,000 entries
+        "truncated": bool(git_tree.raw_data.get("truncated", False)),
+        "entries": [{"path": e.path, "type": e.type, "size": e.size, "sha": e.sha} for e in git_tree.tree],
+    }
+    cache.put(key, tree)
+    return tree
+
+
+def github_blob(repo, commit_sha: str, path: str, cache: LRUCache) -> dict:
+    """
+    Return the blob 'sha' and 'size' of a file at a commit of a GitHub repository, or None if there is no such file.
+
+    Only the folders on the file's path are read, one (non-recursive) tree request each. The tree of a folder
+    never changes, so they are cached by SHA.
+
+    Raises GithubException if a tree can not be read.
+    """
+    *folders, name = path.strip("/").split("/")
+
+    # the trees API accepts the SHA of a commit for its root folder
+    tree_sha = commit_sha
+    for folder in folders:
+        entry = _github_folder(repo, tree_sha, cache)["entries"].get(folder)
+        if entry is None or entry["type"] != "tree":
+            return None
+        tree_sha = entry["sha"]
+
+    entry = _github_folder(repo, tree_sha, cache)["entries"].get(name)
+    if entry is None or entry["type"] != "blob":
+        return None
+    return {"sha": entry["sha"], "size": entry["size"]}
+
+
+def github_root_tree_sha(repo, commit_sha: str, cache: LRUCache) -> str:
+    """
+    Return the SHA of the root folder of a commit of a GitHub repository.
+
+    Raises GithubException if the tree can not be read.
+    """
+    return _github_folder(repo, commit_sha, cache)["sha"]
+
+
+def github_unchanged_paths(repo, commit_sha: str, files: dict, cache: LRUCache) -> set:
+    """
+    Return the paths in 'files', a dict of path to content, whose content is already at a commit of a GitHub repository.
+
+    Only the folders on the paths are read (see github_blob()). Raises GithubException if a tree can not be read.
+    """
+    unchanged = set()
+    for path, content in files.items():
+        blob = github_blob(repo, commit_sha, path, cache)
+        if blob is not None and blob["sha"] == git_blob_sha(content):
+            unchanged.add(path)
+    return unchanged
+
+
+def _github_folder(repo, tree_sha, cache):
+    """
+    Return a folder of a GitHub repository, given the SHA of its tree (or, for the root folder, of a commit),
+    as a dict with the tree 'sha' and its 'entries', a dict of name to 'type', 'size' and 'sha'.
+    """
+    key = ("folder", "github", repo.full_name, tree_sha)
+    folder = cache.get(key)
+    if folder is None:
+        git_tree = repo.get_git_tree(tree_sha)
+        folder = {
+            "sha": git_tree.sha,
+            "entries": {e.path: {"type": e.type, "size": e.size, "sha": e.sha} for e in git_tree.tree},
+        }
+        cache.put(key, folder)
+    return folder
+
+
+def gitlab_tree(project, branch: str, cache: LRUCache) -> dict:
+    """
+    Return the listing of a GitLab project branch.
+
+    Raises GitlabError if the branch or tree can not be read.
+    """
+    head_sha = project.branches.get(branch).commit["id"]
+
+    # lazy project objects only have the (quoted) path as their id
+    key = ("tree", "gitlab", getattr(project, "path_with_namespace", None) or urllib.parse.unquote(str(project.id)), head_sha)
+    tree = cache.get(key)
+    if tree is not None:
+        return tree
+
+    items = project.repository_tree(recursive=True, ref=head_sha, get_all=True, per_page=100)
+    tree = {
+        "sha": head_sha,
+        "truncated": False,
+        "entries": [{"path": item["path"], "type": item["type"], "size": None, "sha": item["id"]} for item in items],
+    }
+    cache.put(key, tree)
+    return tree
+
+
+def gitlab_blob_shas(project, branch: str, paths) -> dict:
+    """
+    Return the blob SHAs of those of 'paths' that are files on a branch of a GitLab project, as a dict of path to SHA.
+
+    Only the folders containing the paths are listed (not recursively), one listing per folder.
+    Raises GitlabError if a folder can not be read, other than because it does not exist.
+    """
+    folders = {}
+    for path in paths:
+        folder, _, name = path.rpartition("/")
+        folders.setdefault(folder, {})[name] = path
+
+    shas = {}
+    for folder, names in folders.items():
+        try:
+            if folder:
+                items = project.repository_tree(path=folder, ref=branch, get_all=True, per_page=100)
+            else:
+                items = project.repository_tree(ref=branch, get_all=True, per_page=100)
+        except gitlab.exceptions.GitlabGetError as e:
+            # a folder that does not exist yet
+            if e.response_code == 404:
+                continue
+            raise
+        for item in items:
+            if item["type"] == "blob" and item["name"] in names:
+                shas[names[item["name"]]] = item["id"]
+    return shas
+
+
+def filter_tree(tree: dict, folder: str) -> dict:
+    """
+    Return a copy of a listing containing only the entries inside a folder.
+    """
+    if not folder:
+        return tree
+
+    prefix = folder.strip("/") + "/"
+    return dict(tree, entries=[e for e in tree["entries"] if e["path"].startswith(prefix)])
+
+
+def git_blob_sha(content) -> str:
+    """
+    Return the SHA that git gives to a file with this content (str or bytes).
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
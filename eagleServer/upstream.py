@@ -0,0 +1,281 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Limits on the number of concurrent calls to each upstream host.
+
+When the server runs on cooperative (gevent) workers a single worker can
+have hundreds of requests in flight, all waiting on GitHub, GitLab, Docker
+Hub or arbitrary URLs. Each upstream host gets a fixed number of slots, so
+that one slow host can not open an unbounded number of connections, and
+requests that can not get a slot within a short time fail instead of
+piling up. The threading primitives used here are made cooperative by
+gevent's monkey patching, so they work unchanged on both worker types.
+
+Each host also has a circuit breaker. After a number of consecutive calls
+fail because the host is down (server errors, timeouts and failed
+connections), calls to it fail straight away for a while, instead of each
+waiting for its own timeout. Then a single call is let through to test the
+host: if it succeeds calls go ahead again, otherwise the wait starts over.
+"""
+import contextlib
+import functools
+import threading
+import time
+import urllib.parse
+
+from eagleServer.ratelimit import RateLimitError
+
+
+class UpstreamBusyError(Exception):
+    """Raised when no slot for an upstream host becomes free in time."""
+    def __init__(self, host: str):
+        super().__init__("Too many concurrent requests to " + host)
+        self.host = host
+
+
+class CircuitOpenError(UpstreamBusyError):
+    """Raised when calls to an upstream host are not made, because recent calls to it failed."""
+    def __init__(self, host: str, retry_after: float):
+        Exception.__init__(self, "{0} is not responding, please try again in {1} seconds".format(host, int(retry_after) + 1))
+        self.host = host
+        self.retry_after = int(retry_after) + 1
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream host fails, and there is no earlier result to return instead."""
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class _Circuit:
+    """
+    State of the circuit breaker of one host: the number of consecutive failed calls, when the
+    circuit was opened (None while it is closed), and whether a call is testing the host.
+    """
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+
+class HostLimiter:
+    """
+    Registry of per-host semaphores and circuit breakers.
+
+    Hosts share the semaphore of a pool if one is given when calling them, otherwise each host has
+    its own. Pools and hosts in `pool_sizes` have that many slots instead of `max_per_host`.
+
+    A host's circuit is opened after `failure_threshold` consecutive failed calls (0 to never open it),
+    and a call is let through to test the host after `retry_interval` seconds. `on_change(host, opened)`
+    is called whenever a circuit is opened or closed.
+    """
+    def __init__(self, max_per_host: int, wait_timeout: float, failure_threshold: int = 0, retry_interval: float = 30,
+                 pool_sizes: dict = None, on_change=None):
+        self.max_per_host = max_per_host
+        self.wait_timeout = wait_timeout
+        self.failure_threshold = failure_threshold
+        self.retry_interval = retry_interval
+        self.pool_sizes = pool_sizes or {}
+        self.on_change = on_change
+        self._semaphores = {}
+        self._in_flight = {}
+        self._circuits = {}
+        self._calls = threading.local()
+        self._lock = threading.Lock()
+
+    def _semaphore(self, pool):
+        with self._lock:
+            semaphore = self._semaphores.get(pool)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.pool_sizes.get(pool, self.max_per_host))
+                self._semaphores[pool] = semaphore
+            return semaphore
+
+    @contextlib.contextmanager
+    def limit(self, host: str, pool: str = None):
+        """
+        Context manager holding one of the slots for `host` (or its pool).
+
+        Raises CircuitOpenError if the host's circuit is open, and UpstreamBusyError if no slot is
+        free within the wait timeout.
+        """
+        probe = self._allow(host)
+        semaphore = self._semaphore(pool or host)
+        if not semaphore.acquire(timeout=self.wait_timeout):
+            if probe:
+                with self._lock:
+                    self._circuits[host].probing = False
+            raise UpstreamBusyError(host)
+
+        with self._lock:
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        call = {"host": host, "failed": False}
+        calls = self._calls.__dict__.setdefault("stack", [])
+        calls.append(call)
+        try:
+            yield
+        except Exception as e:
+            call["failed"] = call["failed"] or is_host_failure(e)
+            raise
+        finally:
+            calls.pop()
+            with self._lock:
+                self._in_flight[host] -= 1
+                if not self._in_flight[host]:
+                    del self._in_flight[host]
+            semaphore.release()
+            self._record(host, call["failed"], probe)
+
+    def report(self, e: Exception) -> None:
+        """
+        Count an error that was handled rather than raised against the innermost call in progress on this thread.
+        Call this where errors from an upstream host are turned into error responses, so that the host's
+        circuit breaker still sees them (see is_host_failure()).
+        """
+        calls = getattr(self._calls, "stack", None)
+        if calls and is_host_failure(e):
+            calls[-1]["failed"] = True
+
+    def limited(self, host: str):
+        """
+        Decorator holding one of the slots for `host` for the duration of the call.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.limit(host):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _allow(self, host):
+        """
+        Raise CircuitOpenError if a call to `host` should not be made now. Returns True if the call tests the host.
+        """
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.opened_at is None:
+                return False
+            retry_after = circuit.opened_at + self.retry_interval - time.monotonic()
+            if retry_after > 0 or circuit.probing:
+                raise CircuitOpenError(host, max(retry_after, 0))
+            circuit.probing = True
+            return True
+
+    def _record(self, host, failed, probe):
+        """
+        Record the outcome of a call to `host`, opening or closing its circuit.
+        """
+        changed = None
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if not failed:
+                # forget hosts that work, so that only those with failures are kept
+                if circuit is not None and (circuit.opened_at is None or probe):
+                    del self._circuits[host]
+                    if circuit.opened_at is not None:
+                        changed = False
+            elif self.failure_threshold > 0:
+                if circuit is None:
+                    circuit = self._circuits[host] = _Circuit()
+                circuit.failures += 1
+                if probe or (circuit.opened_at is None and circuit.failures >= self.failure_threshold):
+                    if circuit.opened_at is None:
+                        changed = True
+                    circuit.opened_at = time.monotonic()
+            if probe and circuit is not None:
+                circuit.probing = False
+
+        if changed is not None and self.on_change is not None:
+            self.on_change(host, changed)
+
+    def in_flight(self) -> dict:
+        """
+        Return the number of calls currently in progress, per host.
+        """
+        with self._lock:
+            return dict(self._in_flight)
+
+    def circuits(self) -> dict:
+        """
+        Return the circuit state ("closed", "open" or "half-open"), consecutive failures and, for open
+        circuits, seconds until the host is tested again, of each host whose last call failed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            result = {}
+            for host, circuit in self._circuits.items():
+                if circuit.opened_at is None:
+                    result[host] = {"state": "closed", "failures": circuit.failures}
+                else:
+                    result[host] = {
+                        "state": "half-open" if circuit.probing else "open",
+                        "failures": circuit.failures,
+                        "retryIn": max(0, int(circuit.opened_at + self.retry_interval - now)),
+                    }
+            return result
+
+
+def host_of(url: str) -> str:
+    return (urllib.parse.urlparse(url).hostname or "").lower()
+
+
+def is_upstream_failure(e: Exception) -> bool:
+    """
+    Return True if an error means that an upstream host is down, overloaded or refusing service (a server
+    error, a 403 or 429 response, a timeout or a failed connection, or no free slot for the host), rather
+    than that the request itself was wrong.
+    """
+    if isinstance(e, (UpstreamBusyError, RateLimitError)):
+        return True
+
+    # GithubException has 'status', GitlabError has 'response_code'
+    status = getattr(e, "status", None) or getattr(e, "response_code", None)
+    if isinstance(status, int):
+        return status in (403, 429) or status >= 500
+
+    # timeouts and connection errors, including those of requests and urllib
+    return isinstance(e, OSError)
+
+
+def is_host_failure(e: Exception) -> bool:
+    """
+    Return True if an error means that an upstream host is down (a server error, a timeout or a failed
+    connection). Unlike is_upstream_failure(), refusals such as rate limits are not counted, as they
+    only apply to some callers.
+    """
+    status = getattr(e, "status", None) or getattr(e, "response_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return isinstance(e, OSError) and not isinstance(e, (FileNotFoundError, PermissionError, IsADirectoryError))
+
+
+def raise_upstream_failure(e: Exception):
+    """
+    Raise an error again, as an UpstreamError with the status to respond with if it is an upstream failure
+    reported by a client library (see is_upstream_failure()).
+    """
+    if is_upstream_failure(e) and not isinstance(e, (UpstreamBusyError, RateLimitError)):
+        status = getattr(e, "status", None) or getattr(e, "response_code", None)
+        raise UpstreamError(str(e), status if isinstance(status, int) else 502) from e
+    raise e
@@ -0,0 +1,201 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Push notifications (webhooks) from GitHub and GitLab.
+
+Folder listings, branch heads and the last commits of files can only be
+reused for long if the server hears about every push. A repository that
+sends push notifications is marked as watched, and every push gives new
+versions to the files and folders it changed (and all their parent
+folders, whose listings may change too). Cached entries of watched
+repositories include these versions in their keys, so a push makes the
+entries it affects unreachable, and the others are kept.
+
+Versions are kept in one of the caches of eagleServer.cache, so they are
+shared by every server process. A version that is missing (never set, or
+evicted) is replaced by a new random one, so an entry cached before an
+eviction is never returned by mistake.
+"""
+import hashlib
+import hmac
+import secrets
+
+NULL_SHA = "0" * 40
+
+# GitHub and GitLab include at most this many commits in a push notification
+MAX_PUSH_COMMITS = 20
+
+
+class Push:
+    """
+    A push to a branch: the new 'head' commit SHA (None if the branch was deleted), and the 'paths'
+    of the files it added, changed or removed (None if they are not all known).
+    """
+    def __init__(self, service: str, repo_name: str, branch: str, head: str, paths):
+        self.service = service
+        self.repo_name = repo_name
+        self.branch = branch
+        self.head = head
+        self.paths = paths
+
+
+def verify_github_signature(secret: str, body: bytes, signature: str) -> bool:
+    """
+    Check the X-Hub-Signature-256 header of a GitHub webhook request.
+    """
+    if not secret or not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def verify_gitlab_token(token: str, header: str) -> bool:
+    """
+    Check the X-Gitlab-Token header of a GitLab webhook request.
+    """
+    if not token or not header:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), header.encode("utf-8"))
+
+
+def _branch(ref):
+    if not isinstance(ref, str) or not ref.startswith("refs/heads/"):
+        return None
+    return ref[len("refs/heads/"):]
+
+
+def _changed_paths(commits):
+    paths = set()
+    for commit in commits:
+        for name in ("added", "modified", "removed"):
+            paths.update(commit.get(name) or [])
+    return paths
+
+
+def parse_github_push(payload: dict):
+    """
+    Return the Push described by a GitHub 'push' event, or None if it is not a push to a branch.
+    """
+    branch = _branch(payload.get("ref"))
+    if branch is None:
+        return None
+
+    commits = payload.get("commits") or []
+    head = payload.get("after")
+    paths = _changed_paths(commits)
+    if payload.get("created") or payload.get("deleted") or payload.get("forced") or len(commits) >= MAX_PUSH_COMMITS or (not commits and payload.get("before") != head):
+        # anything on the branch may have changed
+        paths = None
+    return Push("github", payload["repository"]["full_name"], branch, None if payload.get("deleted") or head == NULL_SHA else head, paths)
+
+
+def parse_gitlab_push(payload: dict):
+    """
+    Return the Push described by a GitLab 'Push Hook' event, or None if it is not a push to a branch.
+    """
+    if payload.get("object_kind") != "push":
+        return None
+    branch = _branch(payload.get("ref"))
+    if branch is None:
+        return None
+
+    commits = payload.get("commits") or []
+    head = payload.get("after")
+    paths = _changed_paths(commits)
+    if payload.get("before") == NULL_SHA or head == NULL_SHA or payload.get("total_commits_count", len(commits)) > len(commits) or not commits:
+        # a new or deleted branch, a force push, or more commits than are listed
+        paths = None
+    return Push("gitlab", payload["project"]["path_with_namespace"], branch, None if head == NULL_SHA else head, paths)
+
+
+def affected_paths(paths) -> set:
+    """
+    Return the given file paths and every folder that contains them ("" for the root folder).
+    """
+    result = {""}
+    for path in paths:
+        parts = path.strip("/").split("/")
+        for i in range(1, len(parts) + 1):
+            result.add("/".join(parts[:i]))
+    return result
+
+
+class PushVersions:
+    """
+    Versions of the files and folders of watched repositories, kept in 'cache'.
+
+    A repository is watched for 'watch_ttl' seconds after each notification from it.
+    Repository names are not case sensitive.
+    """
+    def __init__(self, cache, watch_ttl: float):
+        self.cache = cache
+        self.watch_ttl = watch_ttl
+
+    def watch(self, service: str, repo_name: str) -> None:
+        self.cache.put(("watched", service, repo_name.lower()), True, ttl=self.watch_ttl)
+
+    def watched(self, service: str, repo_name: str) -> bool:
+        return self.cache.get(("watched", service, repo_name.lower())) is not None
+
+    def version(self, service: str, repo_name: str, branch: str, path: str) -> str:
+        """
+        Return the current version of a file or folder on a branch.
+        """
+        branch_version = self._get(("branch", service, repo_name.lower(), branch))
+        return branch_version + "." + self._get(("path", service, repo_name.lower(), branch, branch_version, path.strip("/")))
+
+    def head(self, service: str, repo_name: str, branch: str):
+        """
+        Return the head commit SHA of a branch from the last push to it, or None if not known.
+        """
+        return self.cache.get(("head", service, repo_name.lower(), branch)) or None
+
+    def record(self, push: Push) -> set:
+        """
+        Give new versions to everything changed by a push, and remember the new head of the branch.
+
+        Returns the affected paths, or None if the whole branch is affected.
+        """
+        repo_name = push.repo_name.lower()
+        self.watch(push.service, repo_name)
+        self.cache.put(("head", push.service, repo_name, push.branch), push.head or "", ttl=self.watch_ttl)
+
+        if push.paths is None:
+            self.cache.put(("branch", push.service, repo_name, push.branch), self._new())
+            return None
+
+        paths = affected_paths(push.paths)
+        branch_version = self._get(("branch", push.service, repo_name, push.branch))
+        for path in paths:
+            self.cache.put(("path", push.service, repo_name, push.branch, branch_version, path), self._new())
+        return paths
+
+    @staticmethod
+    def _new():
+        return secrets.token_hex(8)
+
+    def _get(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            value = self._new()
+            self.cache.put(key, value)
+        return value
@@ -86,6 +86,19 @@ install_requires = [
     "six",
 ]
 
+extras_require = {
+    # cooperative workers for the async server profile (EAGLE_PROFILE=async)
+    "async": ["gevent"],
+    # shared response cache in a Redis server (EAGLE_CACHE_BACKEND=redis)
+    "redis": ["redis"],
+    # brotli compression of responses, for browsers that accept it
+    "brotli": ["brotli"],
+    # faster JSON parsing and compact serialisation
+    "json": ["orjson"],
+    # Prometheus metrics at /metrics
+    "metrics": ["prometheus_client"],
+}
+
 setup(
     name="eagleServer",
     version=version,
@@ -106,6 +119,7 @@ setup(
     },
     #    dependency_links=['http://github.com/ICRAR/daliuge/tarball/master#egg=daliuge-1.0'],
     install_requires=install_requires,
+    extras_require=extras_require,
     # No spaces allowed between the '='s
     entry_points={
         "console_scripts": ["eagleServer=eagleServer.eagleServer:main"]
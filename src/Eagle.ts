@@ -2560,98 +2560,90 @@ export class Eagle {
     }
 
     loadPalettes = async (paletteList: {name:string, filename:string, readonly:boolean, expanded:boolean}[]): Promise<{palettes: Palette[], errorsWarnings: Errors.ErrorsWarnings}> => {
-        return new Promise(async(resolve) => {
-            const destinationPalettes: Palette[] = [];
-            const errorsWarnings: Errors.ErrorsWarnings = {"errors":[], "warnings":[]};
-
-            // define a function to check if all requests are now complete, if so we can return the list of palettes
-            function _checkAllPalettesComplete() : void {
-                let allComplete = true;
-
-                for (const palette of destinationPalettes){
-                    if (palette.isFetching()){
-                        allComplete = false;
-                    }
-                }
-                if (allComplete){
-                    resolve({palettes: destinationPalettes, errorsWarnings: errorsWarnings});
-                }
-            }
-
-            // initialise the state
-            for (let i = 0 ; i < paletteList.length ; i++){
-                // create placeholder palette to show in the UI while the palette is being fetched
-                const palette = new Palette();
-                palette.isFetching(true);
-                palette.fileInfo().name = paletteList[i].name;
-                palette.expanded(false);
-
-                // keep reference to the placeholder palette so that it can be replaced when the palette is loaded
-                destinationPalettes.push(palette);
-                this.palettes.unshift(palette);
-            }
+        const destinationPalettes: Palette[] = [];
+        const errorsWarnings: Errors.ErrorsWarnings = {"errors":[], "warnings":[]};
 
-            // start trying to load the palettes
-            for (let i = 0 ; i < paletteList.length ; i++){
-                const index = i;
-                const postData = {url: paletteList[i].filename};
+        // initialise the state
+        for (let i = 0 ; i < paletteList.length ; i++){
+            // create placeholder palette to show in the UI while the palette is being fetched
+            const palette = new Palette();
+            palette.isFetching(true);
+            palette.fileInfo().name = paletteList[i].name;
+            palette.expanded(false);
 
-                let data: any;
-                try {
-                    data = await Utils.httpPostJSON("/openRemoteUrlFile", postData);
-                } catch (error){
-                    // an error occurred when fetching the palette
-                    errorsWarnings.errors.push(Errors.Message(Errors.UnknownToError(error)));
-
-                    // try to load palette from localStorage
-                    const paletteData = localStorage.getItem(paletteList[i].filename);
+            // keep reference to the placeholder palette so that it can be replaced when the palette is loaded
+            destinationPalettes.push(palette);
+            this.palettes.unshift(palette);
+        }
 
-                    if (paletteData === null){
-                        console.warn("Unable to fetch palette '" + paletteList[i].name + "'. Palette also unavailable from localStorage.");
-                    } else {
-                        console.warn("Unable to fetch palette '" + paletteList[i].name + "'. Palette loaded from localStorage.");
-
-                        // attempt to determine schema version from FileInfo
-                        const schemaVersion: Setting.SchemaVersion = Utils.determineSchemaVersion(paletteData);
-                        let palette: Palette;
-                        const file = new RepositoryFile(new Repository(Repository.Service.Url, "", "", false), "", paletteList[i].name);
-                        file.type = Eagle.FileType.Palette;
-                        switch (schemaVersion){
-                            case Setting.SchemaVersion.OJS:
-                            case Setting.SchemaVersion.Unknown:
-                                palette = Palette.fromOJSJson(paletteData, file, errorsWarnings);
-                                break;
-                            case Setting.SchemaVersion.V4:
-                                palette = Palette.fromV4Json(paletteData, file, errorsWarnings);
-                                break;
-                        }
-                        
-                        Utils.preparePalette(palette, paletteList[i]);
+        // fetch all the palettes in one request, the results are in the same order
+        const postData = {
+            files: paletteList.map((paletteInfo) => ({service: Repository.Service.Url, url: paletteInfo.filename})),
+            format: 2
+        };
 
-                        destinationPalettes[index].copy(palette);
-                    }
+        let results: {status: number, data?: any, error?: string}[];
+        try {
+            const response: any = await Utils.httpPostJSON("/openRemoteFiles", postData);
+            results = response.results;
+        } catch (error){
+            // the whole request failed, so every palette is treated as failed
+            results = paletteList.map(() => ({status: 0, error: Errors.UnknownToError(error)}));
+        }
 
-                    _checkAllPalettesComplete();
-                    return;
-                } finally {
-                    destinationPalettes[index].isFetching(false);
-                    destinationPalettes[index].expanded(paletteList[index].expanded);
-                }
+        for (let i = 0 ; i < paletteList.length ; i++){
+            const result = results[i];
 
+            if (result.status === 200){
                 // palette fetched successfully
+                const data: string = JSON.stringify(result.data);
                 const repositoryFile = new RepositoryFile(new Repository(Repository.Service.Url, "", "", false), "", paletteList[i].name);
                 const palette: Palette = Palette.fromOJSJson(data, repositoryFile, errorsWarnings);
-                Utils.preparePalette(palette, paletteList[index]);
+                Utils.preparePalette(palette, paletteList[i]);
 
                 // copy loaded palette into the destination palette that is already in the list of palettes
-                destinationPalettes[index].copy(palette);
+                destinationPalettes[i].copy(palette);
 
                 // save to localStorage
-                localStorage.setItem(paletteList[index].filename, data);
+                localStorage.setItem(paletteList[i].filename, data);
+            } else {
+                // an error occurred when fetching the palette
+                errorsWarnings.errors.push(Errors.Message(result.error));
+
+                // try to load palette from localStorage
+                const paletteData = localStorage.getItem(paletteList[i].filename);
+
+                if (paletteData === null){
+                    console.warn("Unable to fetch palette '" + paletteList[i].name + "'. Palette also unavailable from localStorage.");
+                } else {
+                    console.warn("Unable to fetch palette '" + paletteList[i].name + "'. Palette loaded from localStorage.");
+
+                    // attempt to determine schema version from FileInfo
+                    const schemaVersion: Setting.SchemaVersion = Utils.determineSchemaVersion(paletteData);
+                    let palette: Palette;
+                    const file = new RepositoryFile(new Repository(Repository.Service.Url, "", "", false), "", paletteList[i].name);
+                    file.type = Eagle.FileType.Palette;
+                    switch (schemaVersion){
+                        case Setting.SchemaVersion.OJS:
+                        case Setting.SchemaVersion.Unknown:
+                            palette = Palette.fromOJSJson(paletteData, file, errorsWarnings);
+                            break;
+                        case Setting.SchemaVersion.V4:
+                            palette = Palette.fromV4Json(paletteData, file, errorsWarnings);
+                            break;
+                    }
 
-                _checkAllPalettesComplete();
+                    Utils.preparePalette(palette, paletteList[i]);
+
+                    destinationPalettes[i].copy(palette);
+                }
             }
-        });
+
+            destinationPalettes[i].isFetching(false);
+            destinationPalettes[i].expanded(paletteList[i].expanded);
+        }
+
+        return {palettes: destinationPalettes, errorsWarnings: errorsWarnings};
     }
 
     openRemoteFile = async (file : RepositoryFile): Promise<void> => {
@@ -133,6 +133,23 @@ export class GitHub {
                 return;
             }
 
+            // warn if the server returned a stored list, to save the API rate limit
+            if (data.rateLimited){
+                Utils.showNotification(
+                    "GitHub Rate Limit",
+                    "The GitHub API rate limit is almost used up, so the list of files may be out of date.",
+                    "warning"
+                );
+            }
+
+            if (data.stale){
+                Utils.showNotification(
+                    "GitHub Unavailable",
+                    "GitHub is not responding, so this is the list of files from " + Math.round(data.staleAge / 60) + " minutes ago.",
+                    "warning"
+                );
+            }
+
             // flag as fetched and expand by default
             location.fetched(true);
             location.expanded(true);
@@ -213,7 +230,8 @@ export class GitHub {
                 repositoryBranch: repositoryBranch,
                 repositoryService: repositoryService,
                 token: token,
-                filename: fullFileName
+                filename: fullFileName,
+                format: 2
             };
 
             let data: any;
@@ -233,7 +251,16 @@ export class GitHub {
                 );
             }
 
-            resolve(data.data);
+            if (data.stale){
+                Utils.showNotification(
+                    "GitHub Unavailable",
+                    "GitHub is not responding, so " + fullFileName + " is a copy from " + Math.round(data.staleAge / 60) + " minutes ago.",
+                    "warning"
+                );
+            }
+
+            // response format 2 returns graphs and palettes as objects, other files as strings
+            resolve(typeof data.data === "string" ? data.data : JSON.stringify(data.data));
         });
     }
 
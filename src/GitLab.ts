@@ -102,6 +102,23 @@ export class GitLab {
                 return;
             }
 
+            // warn if the server returned a stored list, to save the API rate limit
+            if (data.rateLimited){
+                Utils.showNotification(
+                    "GitLab Rate Limit",
+                    "The GitLab API rate limit is almost used up, so the list of files may be out of date.",
+                    "warning"
+                );
+            }
+
+            if (data.stale){
+                Utils.showNotification(
+                    "GitLab Unavailable",
+                    "GitLab is not responding, so this is the list of files from " + Math.round(data.staleAge / 60) + " minutes ago.",
+                    "warning"
+                );
+            }
+
             // flag as fetched and expand by default
             location.fetched(true);
             location.expanded(true);
@@ -183,7 +200,8 @@ export class GitLab {
                 repositoryBranch: repositoryBranch,
                 repositoryService: repositoryService,
                 token: token,
-                filename: fullFileName
+                filename: fullFileName,
+                format: 2
             };
 
             let data: any;
@@ -203,7 +221,16 @@ export class GitLab {
                 );
             }
 
-            resolve(data.data);
+            if (data.stale){
+                Utils.showNotification(
+                    "GitLab Unavailable",
+                    "GitLab is not responding, so " + fullFileName + " is a copy from " + Math.round(data.staleAge / 60) + " minutes ago.",
+                    "warning"
+                );
+            }
+
+            // response format 2 returns graphs and palettes as objects, other files as strings
+            resolve(typeof data.data === "string" ? data.data : JSON.stringify(data.data));
         });
     }
 
@@ -0,0 +1,145 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Load benchmark comparing sync and asynchronous (gevent) gunicorn workers.
+
+Starts a fake GitHub API with a fixed latency, then for each worker class
+starts the EAGLE server under gunicorn with the same number of workers and
+fires batches of concurrent /getGitHubFilesAll requests at it, reporting
+throughput and latency at each concurrency level.
+
+Run from the repository root:
+
+    python tools/benchmark_async.py --workers 2 --latency 0.2 --concurrency 1 10 50 200
+"""
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_upstream  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start: " + url)
+
+
+def one_request(url: str) -> float:
+    body = json.dumps({"repository": fake_upstream.REPO, "branch": "master", "token": "", "path": ""}).encode()
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run_level(url: str, concurrency: int, rounds: int) -> dict:
+    total = concurrency * rounds
+    errors = 0
+    latencies = []
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in concurrent.futures.as_completed([pool.submit(one_request, url) for _ in range(total)]):
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": latencies[math.ceil(len(latencies) * 0.95) - 1] if latencies else float("nan"),
+    }
+
+
+def run_server(worker_class: str, workers: int, upstream_url: str, args) -> list:
+    port = free_port()
+    env = dict(os.environ, EAGLE_GITHUB_BASE_URL=upstream_url)
+    cmd = [
+        sys.executable, "-m", "gunicorn",
+        "--workers", str(workers),
+        "--worker-class", worker_class,
+        "--worker-connections", str(args.worker_connections),
+        "--timeout", "120",
+        "--bind", "127.0.0.1:%d" % port,
+        "--log-level", "warning",
+        "eagleServer.eagleServer:app",
+    ]
+    server = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+    try:
+        base = "http://127.0.0.1:%d" % port
+        wait_for(base + "/getGitHubRepositoryList")
+        return [run_level(base + "/getGitHubFilesAll", c, args.rounds) for c in args.concurrency]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-connections", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every upstream response")
+    parser.add_argument("--rounds", type=int, default=3, help="requests per client at each concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--worker-classes", nargs="+", default=["sync", "gevent"])
+    args = parser.parse_args()
+
+    upstream = fake_upstream.start(fake_upstream.FakeGitHub(args.latency))
+    upstream_url = "http://127.0.0.1:%d" % upstream.server_port
+
+    print("%-8s %11s %9s %7s %9s %9s %9s" % ("worker", "concurrency", "requests", "errors", "req/s", "p50 (s)", "p95 (s)"))
+    for worker_class in args.worker_classes:
+        for r in run_server(worker_class, args.workers, upstream_url, args):
+            print("%-8s %11d %9d %7d %9.1f %9.3f %9.3f" % (worker_class, r["concurrency"], r["requests"], r["errors"], r["rps"], r["p50"], r["p95"]))
+
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Benchmark of the time taken to import the server, which is paid by every
+new (or reloaded) gunicorn worker that is not preloaded.
+
+Imports eagleServer.eagleServer in a fresh interpreter several times and
+reports the median time and the peak memory of those processes. Fails if
+the median is over --max-seconds, or if one of the modules that should only
+be imported on first use (see eagleServer/lazy.py) was imported.
+
+Run from the repository root:
+
+    python tools/benchmark_import.py --runs 10 --max-seconds 1.0
+
+For a breakdown by module, use:
+
+    python -X importtime -c "import eagleServer.eagleServer" 2> importtime.txt
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ["github", "gitlab", "requests"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import eagleServer.eagleServer
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "imported": [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_once():
+    env = dict(os.environ, EAGLE_CACHE_BACKEND=os.environ.get("EAGLE_CACHE_BACKEND", "memory"))
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail if the median import time is longer than this")
+    args = parser.parse_args()
+
+    # the first run also compiles the bytecode, as a freshly built image would
+    run_once()
+    results = [run_once() for _ in range(args.runs)]
+
+    median = statistics.median(r["seconds"] for r in results)
+    max_rss = max(r["max_rss_kb"] for r in results)
+    imported = sorted(set(name for r in results for name in r["imported"]))
+    print("import eagleServer.eagleServer: median %.3fs, min %.3fs, max %.3fs over %d runs, max RSS %.1f MB" % (
+        median, min(r["seconds"] for r in results), max(r["seconds"] for r in results), len(results), max_rss / 1024))
+
+    failed = False
+    if imported:
+        print("imported at start-up, but should only be imported on first use: " + ", ".join(imported))
+        failed = True
+    if args.max_seconds is not None and median > args.max_seconds:
+        print("median import time is over the limit of %.3fs" % args.max_seconds)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Micro-benchmark of the JSON codec used by the server.
+
+For each graph in tests/data (or the files given on the command line),
+times parsing, compact serialisation and indented serialisation with the
+standard library and with eagleServer.codec, and reports the peak memory
+allocated by each. Also checks that the indented output of the codec is
+byte-for-byte the same as json.dumps(indent=4).
+
+Run from the repository root:
+
+    python tools/benchmark_json.py --repeat 20
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eagleServer import codec  # noqa: E402
+
+
+def measure(func, repeat: int):
+    """
+    Return the best time (in ms) of 'repeat' calls, and the peak memory (in KiB) allocated by one call.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="JSON files to use (default: tests/data/*.graph)")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join("tests", "data", "*.graph")))
+    if not files:
+        sys.exit("No input files found, run from the repository root or give some files")
+
+    print("codec backend:", "orjson" if codec.orjson is not None else "json (orjson not installed)")
+    print("{0:<40} {1:<16} {2:>12} {3:>12} {4:>12} {5:>12}".format("file", "operation", "json ms", "codec ms", "json KiB", "codec KiB"))
+
+    for filename in files:
+        with open(filename, "rb") as f:
+            raw = f.read()
+        graph = json.loads(raw)
+
+        if codec.dumps_indented(codec.loads(raw)) != json.dumps(json.loads(raw), indent=4):
+            print("MISMATCH in indented output:", filename)
+
+        operations = [
+            ("parse", lambda: json.loads(raw), lambda: codec.loads(raw)),
+            ("dump compact", lambda: json.dumps(graph, separators=(",", ":")).encode(), lambda: codec.dumps_bytes(graph)),
+            ("dump indent=4", lambda: json.dumps(graph, indent=4), lambda: codec.dumps_indented(graph)),
+        ]
+        for name, stdlib_func, codec_func in operations:
+            stdlib_ms, stdlib_kib = measure(stdlib_func, args.repeat)
+            codec_ms, codec_kib = measure(codec_func, args.repeat)
+            print("{0:<40} {1:<16} {2:>12.2f} {3:>12.2f} {4:>12.0f} {5:>12.0f}".format(
+                os.path.basename(filename)[:40], name, stdlib_ms, codec_ms, stdlib_kib, codec_kib))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Load test comparing the gunicorn profiles of docker/gunicorn_conf.py.
+
+Starts a fake GitHub API with a fixed latency, then for each profile
+(EAGLE_PROFILE=dev, threaded and async) starts the EAGLE server with
+docker/gunicorn_conf.py and the same number of workers, fires batches of
+concurrent /getGitHubFilesAll requests at it, and reports throughput,
+latency and the memory used by the workers at the end.
+
+Run from the repository root:
+
+    python tools/benchmark_profiles.py --workers 2 --latency 0.2 --concurrency 1 10 50 200
+
+Other settings of gunicorn_conf.py (THREADS, MAX_REQUESTS, ...) can be set
+in the environment, and apply to every profile.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_upstream  # noqa: E402
+from benchmark_async import free_port, run_level, wait_for  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def workers_rss(pid: int) -> int:
+    """
+    Return the total resident memory (in bytes) of the child processes of a process.
+    """
+    total = 0
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return 0
+    for child in children:
+        try:
+            with open("/proc/%d/status" % child) as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def run_profile(profile: str, upstream_url: str, args) -> tuple:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            EAGLE_PROFILE=profile,
+            EAGLE_GITHUB_BASE_URL=upstream_url,
+            WEB_CONCURRENCY=str(args.workers),
+            BIND="127.0.0.1:%d" % port,
+            LOG_LEVEL="warning",
+            EAGLE_LOG_DIR=tmp,
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(tmp, "metrics"),
+            PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+        )
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "docker", "gunicorn_conf.py"), "eagleServer.eagleServer:app"]
+        server = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+        try:
+            base = "http://127.0.0.1:%d" % port
+            wait_for(base + "/getGitHubRepositoryList")
+            results = [run_level(base + "/getGitHubFilesAll", c, args.rounds) for c in args.concurrency]
+            return results, workers_rss(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every upstream response")
+    parser.add_argument("--rounds", type=int, default=3, help="requests per client at each concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--profiles", nargs="+", default=["dev", "threaded", "async"])
+    args = parser.parse_args()
+
+    upstream = fake_upstream.start(fake_upstream.FakeGitHub(args.latency))
+    upstream_url = "http://127.0.0.1:%d" % upstream.server_port
+
+    print("%-9s %11s %9s %7s %9s %9s %9s %12s" % ("profile", "concurrency", "requests", "errors", "req/s", "p50 (s)", "p95 (s)", "workers MB"))
+    for profile in args.profiles:
+        results, rss = run_profile(profile, upstream_url, args)
+        for r in results:
+            print("%-9s %11d %9d %7d %9.1f %9.3f %9.3f %12.1f" % (profile, r["concurrency"], r["requests"], r["errors"], r["rps"], r["p50"], r["p95"], rss / 1e6))
+
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Benchmark of multi-file saves to GitHub ('/saveFilesToRemoteGithub').
+
+Starts a fake GitHub API with a fixed latency and upload bandwidth, and
+times saving 1, 10 and 50 graphs in one commit, with every file sent inline
+with the new tree, and with large files uploaded as separate blobs in
+parallel.
+
+Run from the repository root:
+
+    python tools/benchmark_save.py --latency 0.1 --bandwidth 2000000 --size 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_upstream  # noqa: E402
+
+REPO = fake_upstream.REPO
+
+
+def make_graph(index: int, size: int) -> str:
+    nodes = []
+    length = 0
+    while length < size:
+        node = {"id": "node-%d-%d" % (index, len(nodes)), "name": "Node", "fields": [{"name": "x", "value": len(nodes)}]}
+        nodes.append(node)
+        length += len(json.dumps(node)) + 2
+    return json.dumps({"modelData": {}, "nodeDataArray": nodes, "linkDataArray": []})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds added to every upstream response")
+    parser.add_argument("--bandwidth", type=float, default=2000000, help="upstream upload bandwidth in bytes per second")
+    parser.add_argument("--size", type=int, default=200000, help="approximate size of each graph in bytes")
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    state = fake_upstream.FakeGitHub(args.latency, bandwidth=args.bandwidth)
+    server = fake_upstream.start(state)
+
+    # the server reads these when it is imported
+    os.environ["EAGLE_GITHUB_BASE_URL"] = "http://127.0.0.1:%d" % server.server_port
+    os.environ["EAGLE_CACHE_BACKEND"] = "memory"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import config.config
+    from eagleServer import eagleServer
+
+    client = eagleServer.app.test_client()
+    modes = {
+        "inline": {"SAVE_BLOB_MIN_BYTES": float("inf"), "SAVE_INLINE_MAX_BYTES": float("inf")},
+        "blobs": {"SAVE_BLOB_MIN_BYTES": config.config.SAVE_BLOB_MIN_BYTES, "SAVE_INLINE_MAX_BYTES": config.config.SAVE_INLINE_MAX_BYTES},
+    }
+
+    print("latency %.3fs, bandwidth %d B/s, %d bytes per graph" % (args.latency, args.bandwidth, args.size))
+    print("{0:>6} {1:>8} {2:>12} {3:>10}".format("files", "mode", "seconds", "requests"))
+
+    revision = 0
+    for count in args.files:
+        for mode, settings in modes.items():
+            for name, value in settings.items():
+                setattr(config.config, name, value)
+
+            # change every file on each run, so that nothing is skipped as unchanged
+            revision += 1
+            files = [{"path": "bench/graph%d.graph" % i, "jsonData": make_graph(revision * 1000 + i, args.size)} for i in range(count)]
+            body = {"repositoryName": REPO, "repositoryBranch": "master", "token": "benchmark", "files": files, "commitMessage": "benchmark"}
+
+            requests_before = state.request_count
+            start = time.perf_counter()
+            response = client.post("/saveFilesToRemoteGithub", json=body)
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                print("save failed:", response.status_code, response.get_data(as_text=True)[:200])
+                continue
+
+            print("{0:>6} {1:>8} {2:>12.2f} {3:>10}".format(count, mode, elapsed, state.request_count - requests_before))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2016
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A minimal, in-memory stand-in for the parts of the GitHub REST API used by
+the EAGLE server, for benchmarks and load tests.
+
+Every response is delayed by a configurable latency, to mimic the round
+trip to api.github.com, and optionally by the time to upload the request
+body at a given bandwidth. A rate limit can be set, which is reported in
+the same X-RateLimit headers as GitHub's and enforced with 403 responses. Point the server at it with
+EAGLE_GITHUB_BASE_URL=http://127.0.0.1:<port>.
+
+Like GitHub, files over 1 MB are described without their content, and files
+over 100 MB not at all (these limits can be changed to test with small files).
+"""
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import re
+import threading
+import time
+
+REPO = "ICRAR/EAGLE-graph-repo"
+
+
+class FakeGitHub:
+    """
+    Holds the state of the fake repository: a single branch with a flat list of files.
+    """
+    def __init__(self, latency: float = 0.0, files: dict = None, bandwidth: float = None, rate_limit: int = None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rate_limit = rate_limit
+        self.rate_limit_remaining = rate_limit
+        self.rate_limit_reset = int(time.time()) + 3600
+        self.files = files if files is not None else {
+            "examples/HelloWorld.graph": json.dumps({"modelData": {}, "nodeDataArray": [], "linkDataArray": []}),
+        }
+        self.head = "0" * 40
+        self.blobs = {}
+        self.trees = {self.head: dict(self.files)}
+        self.commits = {self.head: self.head}
+        self.subtrees = {}
+        self.contents_max_bytes = 1024 * 1024
+        self.describe_max_bytes = 100 * 1024 * 1024
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        """
+        Count a request, and return False if it is over the rate limit.
+        """
+        with self._lock:
+            self.request_count += 1
+            if self.rate_limit is None:
+                return True
+            if self.rate_limit_remaining == 0:
+                return False
+            self.rate_limit_remaining -= 1
+            return True
+
+
+def _make_handler(state: FakeGitHub):
+    routes = []
+
+    def route(method, pattern):
+        def decorator(func):
+            routes.append((method, re.compile(pattern), func))
+            return func
+        return decorator
+
+    def base(handler):
+        return "http://" + handler.headers["Host"]
+
+    @route("GET", r"^/repos/(?P<repo>[^/]+/[^/?]+)/?(\?.*)?$")
+    def get_repo(handler, m):
+        return 200, {"full_name": m["repo"], "name": m["repo"].split("/")[1], "url": base(handler) + "/repos/" + m["repo"]}
+
+    @route("GET", r"^/repos/(?P<repo>[^/]+/[^/]+)/commits(\?.*)?$")
+    def get_commits(handler, m):
+        date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        person = {"name": "EAGLE", "email": "eagle@example.com", "date": date}
+        return 200, [{"sha": state.head, "url": "", "commit": {"message": "", "author": person, "committer": person}}]
+
+    @route("GET", r"^/repos/(?P<repo>[^/]+/[^/]+)/contents/(?P<path>[^?]*)")
+    def get_contents(handler, m):
+        if m["path"] in state.files:
+            content = state.files[m["path"]]
+            if len(content) > state.describe_max_bytes:
+                return 403, {"message": "This API returns blobs up to 1 MB in size.", "errors": [{"resource": "Blob", "field": "data", "code": "too_large"}]}
+            url = base(handler) + "/raw/" + m["path"]
+            encoded = base64.b64encode(content.encode()).decode() if len(content) <= state.contents_max_bytes else ""
+            return 200, {"type": "file", "encoding": "base64" if encoded else "none", "content": encoded, "size": len(content),
+                         "name": m["path"].rsplit("/", 1)[-1], "path": m["path"], "sha": blob_sha(content), "url": url, "download_url": url}
+
+        prefix = m["path"].strip("/")
+        prefix = prefix + "/" if prefix else ""
+        entries = {}
+        for path in state.files:
+            if path.startswith(prefix):
+                rest = path[len(prefix):]
+                if "/" in rest:
+                    name = rest.split("/", 1)[0]
+                    entries[name] = {"type": "dir", "name": name, "path": prefix + name}
+                else:
+                    entries[rest] = {"type": "file", "name": rest, "path": path}
+        return 200, list(entries.values())
+
+    @route("GET", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/(ref|refs)/heads/(?P<branch>[^?]+)")
+    def get_ref(handler, m):
+        url = base(handler) + "/repos/" + m["repo"] + "/git/refs/heads/" + m["branch"]
+        return 200, {"ref": "refs/heads/" + m["branch"], "url": url, "object": {"sha": state.head, "type": "commit", "url": ""}}
+
+    @route("GET", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/trees/(?P<sha>[^?]+)(?P<query>\?.*)?")
+    def get_tree(handler, m):
+        tree_sha, prefix = state.subtrees.get(m["sha"], (state.commits.get(m["sha"], m["sha"]), ""))
+        files = state.trees.get(tree_sha)
+        if files is None:
+            return 404, {"message": "Not Found"}
+        if "recursive" in (m["query"] or ""):
+            entries = [{"path": path, "mode": "100644", "type": "blob", "size": len(content), "sha": blob_sha(content)} for path, content in files.items()]
+            return 200, {"sha": tree_sha, "truncated": False, "tree": entries}
+
+        # the files and folders directly inside the folder
+        entries = {}
+        for path, content in files.items():
+            if not path.startswith(prefix):
+                continue
+            name, *rest = path[len(prefix):].split("/", 1)
+            if rest:
+                sha = hashlib.sha1((tree_sha + ":" + prefix + name).encode()).hexdigest()
+                with state._lock:
+                    state.subtrees[sha] = (tree_sha, prefix + name + "/")
+                entries[name] = {"path": name, "mode": "040000", "type": "tree", "sha": sha}
+            else:
+                entries[name] = {"path": name, "mode": "100644", "type": "blob", "size": len(content), "sha": blob_sha(content)}
+        return 200, {"sha": m["sha"] if prefix else tree_sha, "truncated": False, "tree": list(entries.values())}
+
+    @route("GET", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/blobs/(?P<sha>[0-9a-f]+)$")
+    def get_blob(handler, m):
+        with state._lock:
+            contents = list(state.blobs.values()) + [content for files in state.trees.values() for content in files.values()]
+        for content in contents:
+            if blob_sha(content) == m["sha"]:
+                if handler.headers.get("Accept") == "application/vnd.github.raw":
+                    return 200, content.encode()
+                return 200, {"sha": m["sha"], "size": len(content), "encoding": "base64", "content": base64.b64encode(content.encode()).decode()}
+        return 404, {"message": "Not Found"}
+
+    @route("POST", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/blobs$")
+    def create_blob(handler, m):
+        content = handler.body["content"]
+        sha = blob_sha(content)
+        with state._lock:
+            state.blobs[sha] = content
+        return 201, {"sha": sha, "url": ""}
+
+    @route("POST", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/trees$")
+    def create_tree(handler, m):
+        with state._lock:
+            files = dict(state.trees.get(handler.body.get("base_tree"), {}))
+            for element in handler.body["tree"]:
+                files[element["path"]] = element["content"] if "content" in element else state.blobs[element["sha"]]
+            sha = hashlib.sha1(json.dumps(files, sort_keys=True).encode()).hexdigest()
+            state.trees[sha] = files
+        return 201, {"sha": sha, "url": "", "tree": []}
+
+    @route("POST", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/commits$")
+    def create_commit(handler, m):
+        sha = hashlib.sha1(json.dumps(handler.body, sort_keys=True).encode()).hexdigest()
+        with state._lock:
+            state.commits[sha] = handler.body["tree"]
+        return 201, {"sha": sha, "url": "", "message": handler.body["message"], "tree": {"sha": handler.body["tree"], "url": ""}, "parents": []}
+
+    @route("PATCH", r"^/repos/(?P<repo>[^/]+/[^/]+)/git/refs/heads/(?P<branch>[^?]+)")
+    def update_ref(handler, m):
+        with state._lock:
+            state.head = handler.body["sha"]
+            state.files = state.trees[state.commits[state.head]]
+        return get_ref(handler, m)
+
+    handler_routes = routes
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _dispatch(self):
+            allowed = state.count()
+            length = int(self.headers.get("Content-Length") or 0)
+            self.body = json.loads(self.rfile.read(length)) if length else None
+            time.sleep(state.latency + (length / state.bandwidth if state.bandwidth else 0))
+            for method, pattern, func in handler_routes:
+                m = pattern.match(self.path)
+                if not allowed:
+                    status, body = 403, {"message": "API rate limit exceeded"}
+                    break
+                if method == self.command and m:
+                    status, body = func(self, m)
+                    break
+            else:
+                status, body = 404, {"message": "Not Found"}
+
+            raw = isinstance(body, bytes)
+            data = body if raw else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/vnd.github.raw" if raw else "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", '"' + hashlib.sha1(data).hexdigest() + '"')
+            if state.rate_limit is not None:
+                self.send_header("X-RateLimit-Limit", str(state.rate_limit))
+                self.send_header("X-RateLimit-Remaining", str(state.rate_limit_remaining))
+                self.send_header("X-RateLimit-Reset", str(state.rate_limit_reset))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = _dispatch
+        do_POST = _dispatch
+        do_PATCH = _dispatch
+
+    return Handler
+
+
+def blob_sha(content: str) -> str:
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def start(state: FakeGitHub, port: int = 0) -> http.server.ThreadingHTTPServer:
+    """
+    Start the fake API in a background thread, and return the server.
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-p", "--port", type=int, default=9999)
+    parser.add_argument("-l", "--latency", type=float, default=0.2, help="seconds added to every response")
+    parser.add_argument("-b", "--bandwidth", type=float, default=None, help="upload bandwidth in bytes per second (default: unlimited)")
+    parser.add_argument("-r", "--rate-limit", type=int, default=None, help="number of requests allowed per hour (default: unlimited)")
+    args = parser.parse_args()
+
+    server = start(FakeGitHub(args.latency, bandwidth=args.bandwidth, rate_limit=args.rate_limit), args.port)
+    print("Fake GitHub API listening on http://127.0.0.1:%d" % server.server_port)
+    threading.Event().wait()
@@ -28,3 +28,10 @@ print(file_contents)
 version_file = open("static/VERSION", "w")
 version_file.write(file_contents)
 version_file.close()
+
+# write the same information as a python module, so the server can read it without running git when it starts
+if file_contents == "Unknown":
+    tag_output = hash_output = "Unknown"
+module_file = open("eagleServer/_version.py", "w")
+module_file.write("# generated by updateVersion.py\n" + "version = " + repr(tag_output) + "\n" + "commit_hash = " + repr(hash_output) + "\n")
+module_file.close()